@@ -11,9 +11,20 @@
 ***************************************************************************
 """
 
-from PyQt5.QtCore import QCoreApplication
-from qgis.core import (QgsProcessing,
+from PyQt5.QtCore import QCoreApplication, QVariant
+from qgis.core import (Qgis,
+                       QgsProcessing,
+                       QgsFeature,
                        QgsFeatureSink,
+                       QgsField,
+                       QgsFields,
+                       QgsGeometry,
+                       QgsPointXY,
+                       QgsLineString,
+                       QgsRectangle,
+                       QgsRasterLayer,
+                       QgsWkbTypes,
+                       QgsCoordinateTransform,
                        QgsProcessingException,
                        QgsProcessingAlgorithm,
                        QgsProcessingParameterFeatureSource,
@@ -21,14 +32,24 @@ from qgis.core import (QgsProcessing,
                        QgsProcessingParameterNumber,
                        QgsProcessingParameterFile,
                        QgsProcessingParameterBoolean,
+                       QgsProcessingParameterEnum,
                        QgsProcessingParameterCrs,
-                       QgsProcessingParameterFeatureSink)
+                       QgsProcessingParameterFeatureSink,
+                       QgsProcessingParameterFileDestination)
 import processing
 import os
 import numpy as np
 import datetime
 import math
 import glob
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from geophygis import (sampling, filters, dem, inversion, instrument, survey, topocache, datload, mosaic, ties, session,
+                       qgisutils)
+
+RASTER_DTYPES = {Qgis.Byte: np.uint8, Qgis.UInt16: np.uint16, Qgis.Int16: np.int16, Qgis.UInt32: np.uint32,
+                 Qgis.Int32: np.int32, Qgis.Float32: np.float32, Qgis.Float64: np.float64}
 
 
 class ExampleProcessingAlgorithm(QgsProcessingAlgorithm):
@@ -36,13 +57,32 @@ class ExampleProcessingAlgorithm(QgsProcessingAlgorithm):
     INPUT = 'INPUT'
     INPUT_PROFILES = 'INPUT_PROFILES'
     INPUT_DEM = 'INPUT_DEM'
+    DEM_TILES = 'DEM_TILES'
     SPACING = 'SPACING'
     PARENT_DIR = 'PARENT_DIR'
     ADDITIONAL_CRS = 'ADDITIONAL_CRS'
     ADD_NULL_VAL = 'ADD_NULL_VAL',
     MEDIAN_WINDOW = 'MEDIAN_WINDOW'
+    FILTER_TYPE = 'FILTER_TYPE'
+    DEM_SAMPLING = 'DEM_SAMPLING'
+    DEM_CACHE_MB = 'DEM_CACHE_MB'
     IVP_FILE = 'IVP_FILE'
     INVERT_FLAG = 'INVERT_FLAG'
+    ATTAB_FLAG = 'ATTAB_FLAG'
+    RES2DINV_PATH = 'RES2DINV_PATH'
+    INVERT_WORKERS = 'INVERT_WORKERS'
+    INVERT_TIMEOUT = 'INVERT_TIMEOUT'
+    PROFILE_RUN = 'PROFILE_RUN'
+    INCREMENTAL = 'INCREMENTAL'
+    FINE_SAMPLING = 'FINE_SAMPLING'
+    FINE_STEP = 'FINE_STEP'
+    DAT_ELECTRODES = 'DAT_ELECTRODES'
+    ELECTRODE_RANGE = 'ELECTRODE_RANGE'
+    SINK_BATCH = 'SINK_BATCH'
+    GPKG_OUTPUT = 'GPKG_OUTPUT'
+    GPKG_INDEX = 'GPKG_INDEX'
+    TIE_POINTS = 'TIE_POINTS'
+    TIES_OUTPUT = 'TIES_OUTPUT'
     OUTPUT = 'OUTPUT'
 
     def tr(self, string):
@@ -66,6 +106,33 @@ class ExampleProcessingAlgorithm(QgsProcessingAlgorithm):
     def shortHelpString(self):
         return self.tr("Export module for GeophyGIS by bitgeo. For further help see documentation provided.")
 
+    def transformCoordinates(self, transform, x, y):
+        if not transform.isValid() or transform.isShortCircuited():
+            return x, y
+        line = QgsLineString(x.tolist(), y.tolist())  # jedno wywołanie transformacji dla całego profilu
+        line.transform(transform)
+        return np.array(line.xVector()), np.array(line.yVector())
+
+    def demReader(self, provider, nodata, cache_mb):
+        extent = provider.extent()
+        x_res = extent.width() / provider.xSize()
+        y_res = extent.height() / provider.ySize()
+
+        def read_block(col0, row0, width, height):  # odczyt jednego kafla z dostawcy rastra
+            block_extent = QgsRectangle(extent.xMinimum() + col0 * x_res, extent.yMaximum() - (row0 + height) * y_res,
+                                        extent.xMinimum() + (col0 + width) * x_res, extent.yMaximum() - row0 * y_res)
+            block = provider.block(1, block_extent, width, height)
+            array = np.frombuffer(bytes(block.data()), dtype=RASTER_DTYPES[block.dataType()]).reshape(height, width)
+            array = array.astype(np.float64)
+            if block.hasNoDataValue():
+                array[array == block.noDataValue()] = np.nan
+            return array
+
+        if provider.sourceHasNoDataValue(1):
+            nodata = nodata + [provider.sourceNoDataValue(1)]
+        return dem.DemReader(read_block, provider.xSize(), provider.ySize(), extent.xMinimum(), extent.yMaximum(),
+                             x_res, y_res, nodata=nodata, cache_bytes=int(cache_mb * 1024 ** 2))
+
     def initAlgorithm(self, config=None):
         self.addParameter(
             QgsProcessingParameterFeatureSource(
@@ -79,10 +146,20 @@ class ExampleProcessingAlgorithm(QgsProcessingAlgorithm):
             QgsProcessingParameterRasterLayer(
             'INPUT_DEM',
             'Digital Elevation Model:',
+            optional = True
             )
         
         )
         
+        self.addParameter(
+            QgsProcessingParameterFile(
+            'DEM_TILES',
+            'Folder of DEM tiles (instead of a single DEM, ; separates several folders or files):',
+            behavior = QgsProcessingParameterFile.Folder,
+            optional = True
+            )
+        )
+        
         self.addParameter(
             QgsProcessingParameterNumber(
             'SPACING',
@@ -95,6 +172,25 @@ class ExampleProcessingAlgorithm(QgsProcessingAlgorithm):
         
         )
         
+        self.addParameter(
+            QgsProcessingParameterEnum(
+            'DEM_SAMPLING',
+            'DEM sampling method:',
+            options = dem.SAMPLING_METHODS,
+            defaultValue = 0
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterNumber(
+            'DEM_CACHE_MB',
+            'DEM tile cache size [MB]:',
+            type = QgsProcessingParameterNumber.Double,
+            defaultValue = 256,
+            minValue = 1
+            )
+        )
+        
         self.addParameter(
             QgsProcessingParameterFile(
             'PARENT_DIR',
@@ -126,7 +222,7 @@ class ExampleProcessingAlgorithm(QgsProcessingAlgorithm):
         self.addParameter(
             QgsProcessingParameterNumber(
             'MEDIAN_WINDOW',
-            'Provide window size for median filtering:',
+            'Provide window size for topography filtering:',
             type = QgsProcessingParameterNumber.Integer,
             optional = True,
             defaultValue = None,
@@ -136,6 +232,15 @@ class ExampleProcessingAlgorithm(QgsProcessingAlgorithm):
         
         )
         
+        self.addParameter(
+            QgsProcessingParameterEnum(
+            'FILTER_TYPE',
+            'Topography filter:',
+            options = filters.FILTER_TYPES,
+            defaultValue = 0
+            )
+        )
+        
         self.addParameter(
             QgsProcessingParameterFile(
             'IVP_FILE',
@@ -153,10 +258,146 @@ class ExampleProcessingAlgorithm(QgsProcessingAlgorithm):
             )
         )
         
+        self.addParameter(
+            QgsProcessingParameterFile(
+            'RES2DINV_PATH',
+            'Res2DInv executable:',
+            behavior = QgsProcessingParameterFile.File,
+            defaultValue = inversion.DEFAULT_RES2DINV,
+            optional = True
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterNumber(
+            'INVERT_WORKERS',
+            'Number of parallel inversions:',
+            type = QgsProcessingParameterNumber.Integer,
+            defaultValue = 1,
+            minValue = 1
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterNumber(
+            'INVERT_TIMEOUT',
+            'Inversion timeout per batch file [min] (0 - no limit):',
+            type = QgsProcessingParameterNumber.Double,
+            defaultValue = 0,
+            minValue = 0
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+            'ATTAB_FLAG',
+            'Write *.attab table of sampled points (debug)',
+            defaultValue = False
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+            'FINE_SAMPLING',
+            'Sample the DEM once at fine resolution and interpolate every spacing (cached)',
+            defaultValue = False
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterNumber(
+            'FINE_STEP',
+            'Fine sampling step in layer units (0 - DEM cell size):',
+            type = QgsProcessingParameterNumber.Double,
+            defaultValue = 0,
+            minValue = 0
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+            'DAT_ELECTRODES',
+            'Place points at the electrodes of the *.dat files (min/max electrode, base spacing)',
+            defaultValue = False
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+            'ELECTRODE_RANGE',
+            'Sample only between the first and last electrode of each *.dat file',
+            defaultValue = False
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+            'INCREMENTAL',
+            'Incremental export to TOPO_incremental (reuse unchanged profiles)',
+            defaultValue = False
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+            'PROFILE_RUN',
+            'Write cProfile statistics of this run (*.prof)',
+            defaultValue = False
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterNumber(
+            'SINK_BATCH',
+            'Output features per write (batch size):',
+            type = QgsProcessingParameterNumber.Integer,
+            defaultValue = 1000,
+            minValue = 1
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterFileDestination(
+            'GPKG_OUTPUT',
+            'Write points and profiles directly to GeoPackage:',
+            fileFilter = 'GeoPackage (*.gpkg)',
+            optional = True,
+            createByDefault = False
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+            'GPKG_INDEX',
+            'Create spatial indexes in the GeoPackage',
+            defaultValue = True
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+            'TIE_POINTS',
+            'Find profile crossings (tie points, *_ties.csv)',
+            defaultValue = False
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+            'TIES_OUTPUT',
+            'Tie points layer',
+            type = QgsProcessing.TypeVectorPoint,
+            optional = True,
+            createByDefault = False
+            )
+        )
+        
         self.addParameter(
             QgsProcessingParameterFeatureSink(
             self.OUTPUT,
-            self.tr('Output layer')
+            self.tr('Output layer'),
+            optional = True,
+            createByDefault = True
             )
         )
 
@@ -167,20 +408,36 @@ class ExampleProcessingAlgorithm(QgsProcessingAlgorithm):
             context
         )
         
-        feedback.pushInfo(str(type(source)))
-        
         dem_layer = self.parameterAsRasterLayer(
             parameters,
             self.INPUT_DEM,
             context
         )
         
+        dem_tiles = self.parameterAsString(
+            parameters,
+            self.DEM_TILES,
+            context
+        )
+        
         spacing = self.parameterAsDouble(
             parameters,
             self.SPACING,
             context
         )
         
+        dem_sampling = self.parameterAsEnum(
+            parameters,
+            self.DEM_SAMPLING,
+            context
+        )
+        
+        dem_cache_mb = self.parameterAsDouble(
+            parameters,
+            self.DEM_CACHE_MB,
+            context
+        )
+        
         parent_dir_path = self.parameterAsString(
             parameters,
             self.PARENT_DIR,
@@ -193,15 +450,23 @@ class ExampleProcessingAlgorithm(QgsProcessingAlgorithm):
             context
         )
         
-        null_value2 = self.parameterAsInt(
+        null_value2 = None  # bez parametru parameterAsInt zwraca 0 - prawdziwe 0 m nie jest wartością pustą
+        if parameters.get('ADD_NULL_VAL') is not None:
+            null_value2 = self.parameterAsInt(
+                parameters,
+                'ADD_NULL_VAL',
+                context
+            )
+        
+        median_window_size = self.parameterAsInt(
             parameters,
-            'ADD_NULL_VAL',
+            self.MEDIAN_WINDOW,
             context
         )
         
-        median_window_size = self.parameterAsInt(
+        filter_type = self.parameterAsEnum(
             parameters,
-            self.MEDIAN_WINDOW,
+            self.FILTER_TYPE,
             context
         )
         
@@ -216,12 +481,103 @@ class ExampleProcessingAlgorithm(QgsProcessingAlgorithm):
             self.INVERT_FLAG,
             context
         )
+        
+        attab_flag = self.parameterAsBool(
+            parameters,
+            self.ATTAB_FLAG,
+            context
+        )
+        
+        res2dinv_path = self.parameterAsString(
+            parameters,
+            self.RES2DINV_PATH,
+            context
+        ) or inversion.DEFAULT_RES2DINV
+        
+        invert_workers = self.parameterAsInt(
+            parameters,
+            self.INVERT_WORKERS,
+            context
+        )
+        
+        invert_timeout = self.parameterAsDouble(
+            parameters,
+            self.INVERT_TIMEOUT,
+            context
+        )
+        
+        profile_run = self.parameterAsBool(
+            parameters,
+            self.PROFILE_RUN,
+            context
+        )
+        
+        sink_batch = self.parameterAsInt(
+            parameters,
+            self.SINK_BATCH,
+            context
+        )
+        
+        gpkg_path = self.parameterAsFileOutput(
+            parameters,
+            self.GPKG_OUTPUT,
+            context
+        )
+        
+        gpkg_index = self.parameterAsBool(
+            parameters,
+            self.GPKG_INDEX,
+            context
+        )
+        
+        tie_flag = self.parameterAsBool(
+            parameters,
+            self.TIE_POINTS,
+            context
+        )
+        
+        incremental = self.parameterAsBool(
+            parameters,
+            self.INCREMENTAL,
+            context
+        )
+        
+        fine_sampling = self.parameterAsBool(
+            parameters,
+            self.FINE_SAMPLING,
+            context
+        )
+        
+        fine_step = self.parameterAsDouble(
+            parameters,
+            self.FINE_STEP,
+            context
+        )
+        
+        dat_electrodes = self.parameterAsBool(
+            parameters,
+            self.DAT_ELECTRODES,
+            context
+        )
+        
+        electrode_range = self.parameterAsBool(
+            parameters,
+            self.ELECTRODE_RANGE,
+            context
+        )
 
         if source.isValid() == False:
             raise QgsProcessingException('Invalid vector input')
             
-        if dem_layer.isValid() == False:
-            raise QgsProcessingException('Invalid vector input')
+        if dem_tiles:
+            dem_tile_paths = mosaic.tile_paths(dem_tiles)
+            if not dem_tile_paths:
+                raise QgsProcessingException('No DEM tiles in ' + dem_tiles)
+            dem_crs = QgsRasterLayer(dem_tile_paths[0]).crs()  # arkusze w jednym układzie
+        elif dem_layer is None or dem_layer.isValid() == False:
+            raise QgsProcessingException('Invalid DEM input')
+        else:
+            dem_crs = dem_layer.crs()
             
         input_CRS_ID = source.sourceCrs().authid()
         additional_CRS_ID = additional_CRS.authid()
@@ -230,173 +586,168 @@ class ExampleProcessingAlgorithm(QgsProcessingAlgorithm):
         y_fieldname = 'y_' + input_CRS_ID
         x_reprojected_fieldname = 'x_' + additional_CRS_ID
         y_reprojected_fieldname = 'y_' + additional_CRS_ID
-        x_reprojected_formula = "round(x(transform($geometry," + "'" + input_CRS_ID + "'" + "," + "'" + additional_CRS_ID + "'" + ")),2)"
-        y_reprojected_formula = "round(y(transform($geometry," + "'" + input_CRS_ID + "'" + "," + "'" + additional_CRS_ID + "'" + ")),2)"
-        
-        points_alines = processing.run("qgis:pointsalonglines", {'INPUT':source, 'DISTANCE':spacing, 'START_OFFSET': 0, 'END_OFFSET': 0, 'OUTPUT':'memory:'})
-        pts_with_DEM = processing.run("qgis:rastersampling", {'INPUT':points_alines['OUTPUT'], 'RASTERCOPY':dem_layer, 'COLUMN_PREFIX':'DEM', 'OUTPUT':'memory:'})
-        calc_x = processing.run("qgis:fieldcalculator", {'INPUT':pts_with_DEM['OUTPUT'], 'FIELD_NAME':x_fieldname, 'FIELD_TYPE': 0, 'FIELD_LENGTH': 10, 'FIELD_PRECISION': 2, 'NEW_FIELD':True, 'FORMULA':'$x', 'OUTPUT':'memory:'})
-        calc_y = processing.run("qgis:fieldcalculator", {'INPUT':calc_x['OUTPUT'], 'FIELD_NAME':y_fieldname, 'FIELD_TYPE': 0, 'FIELD_LENGTH': 10, 'FIELD_PRECISION': 2, 'NEW_FIELD':True, 'FORMULA':'$y', 'OUTPUT':'memory:'})
-        calc_xTransformed = processing.run("qgis:fieldcalculator", {'INPUT':calc_y['OUTPUT'], 'FIELD_NAME':x_reprojected_fieldname, 'FIELD_TYPE': 0, 'FIELD_LENGTH': 10, 'FIELD_PRECISION': 2, 'NEW_FIELD':True, 'FORMULA': x_reprojected_formula, 'OUTPUT':'memory:'})
-        calc_yTransformed = processing.run("qgis:fieldcalculator", {'INPUT':calc_xTransformed['OUTPUT'], 'FIELD_NAME':y_reprojected_fieldname,'FIELD_TYPE': 0, 'FIELD_LENGTH': 10, 'FIELD_PRECISION': 2, 'NEW_FIELD':True, 'FORMULA': y_reprojected_formula, 'OUTPUT':'memory:'}, context = context, feedback=feedback)['OUTPUT']
+        
+        fields = QgsFields(source.fields())  # pola jak po pointsalonglines, rastersampling i kalkulatorze pól
+        for name in ['distance', 'angle', 'DEM_1']:
+            fields.append(QgsField(name, QVariant.Double))
+        for name in [x_fieldname, y_fieldname, x_reprojected_fieldname, y_reprojected_fieldname]:
+            fields.append(QgsField(name, QVariant.Double, len=10, prec=2))
 
         (sink, dest_id) = self.parameterAsSink(
             parameters,
             self.OUTPUT,
             context,
-            calc_yTransformed.fields(),
-            calc_yTransformed.wkbType(),
-            calc_yTransformed.sourceCrs()
+            fields,
+            QgsWkbTypes.Point,
+            source.sourceCrs()
         )
         
-        if sink is None:
+        if sink is None and not gpkg_path:
             raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+        
+        ties_fields = QgsFields()
+        for name, sql_type in ties.TIE_FIELDS:
+            ties_fields.append(QgsField(name, QVariant.String if sql_type == 'TEXT' else QVariant.Double))
+        (ties_sink, ties_dest_id) = self.parameterAsSink(
+            parameters,
+            self.TIES_OUTPUT,
+            context,
+            ties_fields,
+            QgsWkbTypes.Point,
+            source.sourceCrs()
+        )
+        tie_flag = tie_flag or ties_sink is not None
             
         time_object = datetime.datetime.now()
         time_stamp = "(" + time_object.strftime('%d%m_%H%M%S') + ")"
         
-        topo_dir_path = parent_dir_path + "/TOPO_" + time_stamp
-        os.mkdir(topo_dir_path)  # stworzenie podfolderu
-        
-        parent_dir_name = os.path.basename(parent_dir_path)  #stworzenie pliku roboczego tabeli atrybutów
-        attab_file = open(topo_dir_path + '\\' + parent_dir_name + '.attab', 'a+')
-        topx_file = open(topo_dir_path + '\\' + parent_dir_name + '.top', 'a+')  #stworzenie pliku zbiorczego topografii
-        
-        features = calc_yTransformed.getFeatures()
-        for current, feature in enumerate(features):
-            if feedback.isCanceled():
-                break
-            sink.addFeature(feature, QgsFeatureSink.FastInsert)
-            if (feature["DEM_1"] == -9999 or feature["DEM_1"] == null_value2 or str(feature["DEM_1"]) == "NULL") == False:
-                lineout = str(feature['ID']) + "\t" + str(feature["distance"]) + "\t" + str(feature["DEM_1"]) + "\n"
-                attab_file.write(lineout)
-            
-        attab_file.close()
-        
-        attab_filename = open(topo_dir_path + '\\' + parent_dir_name + '.attab') #tymczasowe rozwiązanie
-        raw_attab = np.genfromtxt(topo_dir_path + '\\' + parent_dir_name + '.attab',
-                                  delimiter='\t', dtype='string_')  # pobranie danych z pliku
-        attab = raw_attab.copy()  # zebranie metadanych o zaimportowanej macierzy
-        attab_n, attab_m = attab.shape
-        bound_indic = [0]  # boundary indicators - przedziały między profilami w danych
-        attab_prof_nam = []
-        attab = attab[attab[:, 1].argsort()]  # sortowanie
-        attab = attab[attab[:, 0].argsort(kind='mergesort')]
-
-        for j in range(1, attab_n):  # mapowanie granic i nazw do rozdzielenia profili
-            if attab[j, 0] != attab[j-1,0]:
-                bound_indic.append(j)
-                attab_prof_nam.append(attab[j-1,0])
-        bound_indic.append(attab_n-1)  # dokładka ostatniej granicy i ostatniej nazwy
-        attab_prof_nam.append(attab[j - 1, 0])
-
-        attab_dict = dict.fromkeys(attab_prof_nam, np.array)  # stworzenie słownika
-
-        for i in range(0, len(attab_prof_nam)):  # wypełnienie słownika posorotowanymi danymi
-            temp_array = attab[bound_indic[i]:bound_indic[i+1], 1:].astype(np.float32)
-            temp_array = temp_array[temp_array[:, 1].argsort()]
-            temp_array = temp_array[temp_array[:, 0].argsort(kind='mergesort')]
-            column_1 = temp_array[:,1]
-            column_0 = temp_array[:,0]
-            column_1 = np.atleast_2d(column_1)
-            column_0 = np.atleast_2d(column_0)
-            if (median_window_size == 0) == False:
-                to_RA = column_1.copy()
-                RA = column_1.copy()
-                len_RA = to_RA.shape[1]
-                if median_window_size > len_RA/2:
-                    median_window_size = len_RA/2
-                    if median_window_size % 2 == 0:
-                        median_window_size = median_window_size + 1
-                    feedback.pushInfo("Size of window for filtering is too big. Changing window size to " + str(int(median_window_size)) + " probes") #erro
-                if median_window_size % 2 == 0:
-                    median_window_size = median_window_size + 1
-                n_2 = int((median_window_size - 1) / 2)
-                for j in range(n_2, len_RA - n_2):
-                    RA[0,j] =  round(np.sum(to_RA[0, j - n_2 : j + n_2 + 1]) / median_window_size,2)
-                margins = range(1, n_2)
-                margin_window_sizes = list(range(3, int(median_window_size), 2))
-                for k in margins:
-                    median_window_size = margin_window_sizes[k - 1]
-                    n_2_margin = int((median_window_size - 1) / 2)
-                    RA[0,k] = round(np.sum(to_RA[0,  : k + n_2_margin + 1]) / median_window_size,2)
-                for k in margins:
-                    median_window_size = margin_window_sizes[k - 1]
-                    n_2_margin = int((median_window_size - 1) / 2)
-                    kk = -k-1
-                    kk1 = kk - n_2_margin
-                    RA[0, kk] = round(np.sum(to_RA[0, kk1 :]) / median_window_size,2)
-                temp_array_2 = np.append(column_0, RA, axis=0)
-                temp_array_3 = np.transpose(temp_array_2)
+        if incremental:
+            topo_dir_path = parent_dir_path + "/" + survey.INCREMENTAL_DIR
+            os.makedirs(topo_dir_path, exist_ok=True)  # folder wspólny dla kolejnych uruchomień
+        else:
+            topo_dir_path = parent_dir_path + "/TOPO_" + time_stamp
+            os.mkdir(topo_dir_path)  # stworzenie podfolderu
+        
+        parent_dir_name = os.path.basename(parent_dir_path)
+        report_path = topo_dir_path + '/' + parent_dir_name + '_timing'  # raport etapów (.json) i profil (.prof)
+        instruments = instrument.Instrumentation('export', feedback, report_path + '.prof' if profile_run else None).start()
+        
+        transform_context = context.transformContext()
+        to_dem = QgsCoordinateTransform(source.sourceCrs(), dem_crs, transform_context)
+        to_additional = QgsCoordinateTransform(source.sourceCrs(), additional_CRS, transform_context)
+        dem_nodata = [dem.DEFAULT_NODATA]
+        if null_value2 is not None:
+            dem_nodata.append(null_value2)
+        if dem_tiles:
+            dem_reader = mosaic.DemMosaic(dem_tile_paths, dem_nodata, int(dem_cache_mb * 1024 ** 2))
+            dem_source = dem_reader.key
+        else:
+            dem_reader = self.demReader(dem_layer.dataProvider(), dem_nodata, dem_cache_mb)
+            dem_source = topocache.file_signature(dem_layer.source()) or (
+                dem_layer.source(), dem_layer.extent().toString(), dem_layer.width(), dem_layer.height())
+        dem_transform = None
+        if to_dem.isValid() and not to_dem.isShortCircuited():  # ten sam klucz co w wierszu poleceń bez reprojekcji
+            dem_transform = (input_CRS_ID, dem_crs.authid())
+        topo_cache = topocache.TopoCache(topo_dir_path) if incremental else None
+        survey_session = session.SurveySession.load(parent_dir_path)  # zapisana przez Import
+        curves = None
+        if fine_sampling:  # krzywe niezależne od rozstawu we wspólnym folderze pamięci podręcznej
+            curves = topocache.TopoCache(parent_dir_path + "/" + datload.CACHE_DIR, name=topocache.CURVE_CACHE)
+        
+        geopackage = None
+        if gpkg_path:  # bezpośredni zapis do GeoPackage w jednej transakcji
+            geopackage = survey.open_geopackage(gpkg_path, qgisutils.gpkg_srs(source.sourceCrs()),
+                                                qgisutils.gpkg_fields(fields), gpkg_index)
+        
+        attributes = []
+        
+        def features():  # atrybuty obiektów dla warstwy wynikowej, linie dla eksportu
+            for feature in source.getFeatures():
+                attributes.append(feature.attributes())
+                yield str(feature['ID']), qgisutils.line_parts(feature.geometry())
+        
+        def point_values(sample):
+            if additional_CRS.isValid():
+                x_reprojected, y_reprojected = self.transformCoordinates(to_additional, sample.x, sample.y)
+                x_reprojected = sampling.round_half_away(x_reprojected, 2)
+                y_reprojected = sampling.round_half_away(y_reprojected, 2)
             else:
-                temp_array_3 = temp_array.copy()
-            attab_dict[attab_prof_nam[i]] = temp_array_3
-        
-        
-        for prof_name in attab_prof_nam:  # odzyskanie nazwy profilu i przeformatowanie na wlasciwy string
-            val_prof_name = str(prof_name)
-            val_prof_name = val_prof_name.replace('b', '')
-            val_prof_name = val_prof_name.replace("'", "")
-            try:
-                with open(parent_dir_path + '\\' + val_prof_name + '.dat') as file_open_res:
-                    file_res_topo = open(topo_dir_path + '\\' + val_prof_name + '_topo.dat', 'a+')  # stworzenie nowego pliku
-                    topx_file.write("TOPO of:" + val_prof_name + "\n")
-
-                    res_data = file_open_res.readlines()  # odczytanie istniejącego pliku z opornościami
-                    
-                    while res_data[-1].rstrip('\n') == '0':  # wycięcie zer kończących
-                        del res_data[-1]
-                        
-                    res_data.append('2\n')   # dodanie dwójki
-
-                    topo_n, topo_m = attab_dict[prof_name].shape
-                    res_data.append(int(topo_n))
-                    topo_data = attab_dict[prof_name].tolist()  # przerobienie numpy na listę
-
-                    for i in range (0, len(res_data)):
-                        file_res_topo.write(str(res_data[i]))
-                    file_res_topo.write('\n')
-                    for j in range (0, len(topo_data)):
-                        file_res_topo.write(str(topo_data[j][0]) + "\t" + str(round(topo_data[j][-1], 3)) + "\n")
-                        topx_file.write(str(topo_data[j][0]) + "\t" + str(round(topo_data[j][-1], 3)) + "\n")
-                    file_res_topo.write('0\n0\n0\n0\n0\n')
-                    topx_file.write("###\n")
-
-                    file_open_res.close()
-                    file_res_topo.close()
-            except:
-                feedback.pushInfo("Profile not found: " + val_prof_name)
-
-        attab_file.close()
+                x_reprojected = y_reprojected = np.full(sample.x.shape, np.nan)
+            columns = np.column_stack([sample.distance, sample.angle, sample.elevation, sample.x, sample.y,
+                                       x_reprojected, y_reprojected]).tolist()
+            return [[None if value != value else value for value in values] for values in columns]  # NaN -> NULL
+        
+        batch = []
+        
+        def add_points(index, profile_id, sample):
+            if sink is None:
+                return
+            for values in point_values(sample):
+                out_feature = QgsFeature(fields)
+                out_feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(values[3], values[4])))
+                out_feature.setAttributes(attributes[index] + values)
+                batch.append(out_feature)
+            if len(batch) >= sink_batch:
+                sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+                batch.clear()
+        
+        def gpkg_rows(index, profile_id, sample):
+            gpkg_attrs = [qgisutils.gpkg_value(value) for value in attributes[index]]
+            return [gpkg_attrs + values for values in point_values(sample)]
+        
+        def add_ties(tie_points, elevation):
+            if ties_sink is None:
+                return
+            batch = []
+            for values, x, y in zip(ties.tie_rows(tie_points, elevation), tie_points.x, tie_points.y):
+                out_feature = QgsFeature(ties_fields)
+                out_feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+                out_feature.setAttributes(values)
+                batch.append(out_feature)
+            ties_sink.addFeatures(batch, QgsFeatureSink.FastInsert)
         
         feedback.pushInfo("::" + ivp_path)
-        
-        if (ivp_path == "") == False:
-            dat_files = glob.glob(topo_dir_path + "/*.dat")
-            parent_dir = os.path.basename(parent_dir_path)
-            numof_dat = len(dat_files)
-            numof_bth = math.ceil(numof_dat/40)
-            for i in range(0, numof_bth):
-                k = 40 * (i + 1)  # obliczenia konieczne do zachowania limitu 40 profili na batch
-                if k > numof_dat:
-                    k = numof_dat
-                batch_file = open(topo_dir_path + "/" + parent_dir + '_' + str(i + 1) + '.bth', 'a+')
-                batch_file.write(str(k - i * 40) + "\n")
-                batch_file.write("INVERSION PARAMETERS FILES USED\n")
-                for j in range(i * 40, k):
-                    batch_file.write("DATA FILE " + str(j - i * 40 + 1) + "\n")
-                    batch_file.write(str(dat_files[j]) + "\n")
-                    batch_file.write(str(dat_files[j]).replace('.dat', '.inv') + "\n")
-                    batch_file.write(ivp_path + "\n")
-                    j += 1
+        try:
+            survey.export_survey(parent_dir_path, features(), dem_reader, spacing, topo_dir_path, feedback, instruments,
+                                 dem_sampling=dem_sampling, null_value=null_value2, window=median_window_size,
+                                 filter_type=filter_type, ivp_path=ivp_path, cache=topo_cache,
+                                 dem_key=survey.dem_key(dem_source, dem_nodata, dem_transform), curves=curves,
+                                 step=fine_step, dat_electrodes=dat_electrodes, geopackage=geopackage,
+                                 ties_path=topo_dir_path + '/' + parent_dir_name + '_ties.csv' if tie_flag else None,
+                                 survey_session=survey_session, electrode_range=electrode_range,
+                                 to_dem=lambda x, y: self.transformCoordinates(to_dem, x, y),
+                                 attab_path=topo_dir_path + '/' + parent_dir_name + '.attab' if attab_flag else None,
+                                 on_sample=add_points, gpkg_rows=gpkg_rows if geopackage is not None else None,
+                                 on_ties=add_ties)
+            if batch:
+                sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+            if geopackage is not None:
+                with instruments.stage('geopackage index', geopackage.count(survey.GPKG_POINTS)):
+                    geopackage.close()  # indeksy przestrzenne dopiero po zapisaniu wszystkich punktów
+                geopackage = None
+        finally:
+            if geopackage is not None:
+                geopackage.connection.close()
+            for open_cache in (topo_cache, curves):
+                if open_cache is not None:
+                    open_cache.close()
+        cache_stats = dem_reader.stats()
+        feedback.pushInfo("DEM tile cache: {} hits, {} misses, {} evictions, {} tiles / {:.1f} MB of {:.1f} MB".format(
+            cache_stats.hits, cache_stats.misses, cache_stats.evictions, cache_stats.tiles,
+            cache_stats.bytes / 1024 ** 2, cache_stats.budget / 1024 ** 2))
+        if dem_tiles:
+            feedback.pushInfo("DEM mosaic: {} tiles indexed, {} opened, {} released".format(
+                len(dem_reader.paths), dem_reader.opened, dem_reader.released))
 
 
         if inversion_flag == True:
-            res2dinv_path = 'D:\Dokumenty\Obowiazki\GeoVolt\Res2DInv'
-            bth_files = glob.glob(topo_dir_path + "\*.bth")   # zebranie wszystkich plików bth
-            for file in bth_files:  # pętla wysyłająca do CMD składnię program - plik batch
-                os.system(res2dinv_path + ' ' + file)
-                feedback.pushInfo(str(bth_files))
+            with instruments.stage('inversion') as stage:
+                bth_files = sorted(glob.glob(topo_dir_path + "/*.bth"))   # zebranie wszystkich plików bth
+                jobs = inversion.run_inversions(res2dinv_path, bth_files, feedback,
+                                                workers=invert_workers, timeout=invert_timeout * 60 or None)
+                feedback.pushInfo(inversion.summary(jobs))
+                stage.count = len(jobs)
+        instruments.finish(report_path + '.json')
             
 
-        return {self.OUTPUT: dest_id}
\ No newline at end of file
+        return {self.OUTPUT: dest_id, self.GPKG_OUTPUT: gpkg_path, self.TIES_OUTPUT: ties_dest_id}
\ No newline at end of file
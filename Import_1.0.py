@@ -11,26 +11,39 @@
 ***************************************************************************
 """
 
-from PyQt5.QtCore import QCoreApplication
+from PyQt5.QtCore import QCoreApplication, QVariant
 from qgis.core import (QgsProcessing,
                        QgsProject,
                        QgsVectorLayer,
+                       QgsFeature,
                        QgsFeatureSink,
+                       QgsField,
+                       QgsFields,
+                       QgsDistanceArea,
+                       QgsGeometry,
+                       QgsPoint,
+                       QgsWkbTypes,
                        QgsProcessingException,
                        QgsProcessingAlgorithm,
                        QgsProcessingParameterFeatureSource,
                        QgsProcessingParameterNumber,
                        QgsProcessingParameterBoolean,
                        QgsProcessingParameterString,
+                       QgsProcessingParameterEnum,
                        QgsProcessingParameterFile,
                        QgsProcessingParameterCrs,
                        QgsProcessingParameterVectorDestination,
                        QgsProcessingParameterFeatureSink)
 import processing
-import glob
 import os
-import re
+import sys
 import datetime
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from geophygis import scan, attributes, instrument, survey, gpkg, watch, invfile, catalog, qgisutils
+
+FIELD_TYPES = {'int': QVariant.Int, 'double': QVariant.Double, 'string': QVariant.String}
 
 
 class GeophygisProcessingAlgorithm(QgsProcessingAlgorithm):
@@ -38,6 +51,16 @@ class GeophygisProcessingAlgorithm(QgsProcessingAlgorithm):
     PARENT_DIR = 'PARENT_DIR'
     INPUT_FLAG = 'INPUT_FLAG'
     PROC_CRS = 'PROC_CRS'
+    WORKERS = 'WORKERS'
+    SCAN_MODE = 'SCAN_MODE'
+    REBUILD_INDEX = 'REBUILD_INDEX'
+    PROFILE_RUN = 'PROFILE_RUN'
+    SINK_BATCH = 'SINK_BATCH'
+    RECURSIVE = 'RECURSIVE'
+    INV_DIR = 'INV_DIR'
+    MODEL_OUTPUT = 'MODEL_OUTPUT'
+    WATCH = 'WATCH'
+    WATCH_INTERVAL = 'WATCH_INTERVAL'
     OUTPUT = 'OUTPUT'
 
     def tr(self, string):
@@ -61,6 +84,75 @@ class GeophygisProcessingAlgorithm(QgsProcessingAlgorithm):
     def shortHelpString(self):
         return self.tr("Import module for GeophyGIS by bitgeo. For further help see documentation provided.")
 
+    def joinedFieldName(self, fields, name):
+        if fields.lookupField(name) == -1:  # jak przy złączeniu atrybutów - duplikaty dostają sufiks
+            return name
+        i = 2
+        while fields.lookupField(name + '_' + str(i)) != -1:
+            i += 1
+        return name + '_' + str(i)
+
+    def joinedFields(self, source, types):
+        fields = QgsFields(source.fields())
+        for name, field_type in zip(attributes.META_FIELDS, types):
+            fields.append(QgsField(self.joinedFieldName(fields, name), FIELD_TYPES[field_type]))
+        for name, field_type in zip(survey.QC_FIELDS, survey.QC_TYPES):
+            fields.append(QgsField(self.joinedFieldName(fields, name), FIELD_TYPES[field_type]))
+        fields.append(QgsField('GIS_LENGTH', QVariant.Double, len=10, prec=1))
+        fields.append(QgsField('LEN_ERR_[%]', QVariant.Double, len=10, prec=2))
+        fields.append(QgsField('AZIM', QVariant.Int, len=10, prec=0))
+        fields.append(QgsField('DIRECTION', QVariant.String, len=10, prec=0))
+        return fields
+
+    def joinFeatures(self, source, fields, table, qc_table, distance_area, context, feedback, ids=None):
+        n_source_fields = source.fields().count()
+        length_index = fields.lookupField('LENGTH')
+        joined = []
+        gis_length = []
+        endpoints = []
+        empty_row = [None] * len(attributes.META_FIELDS)
+        empty_qc = [None] * len(survey.QC_FIELDS)
+        for feature in source.getFeatures():
+            if feedback.isCanceled():
+                break
+            if ids is not None and str(feature['ID']) not in ids:  # tryb obserwacji - tylko zmienione profile
+                continue
+            attrs = (feature.attributes()[:n_source_fields] + table.get(str(feature['ID']), empty_row)
+                     + qc_table.get(str(feature['ID']), empty_qc))
+            geometry = feature.geometry()
+            if geometry.isEmpty():
+                gis_length.append(np.nan)
+                endpoints.append((np.nan, np.nan, np.nan, np.nan))
+            else:
+                length = distance_area.measureLength(geometry)
+                gis_length.append(distance_area.convertLengthMeasurement(length, context.distanceUnit()))
+                first = geometry.vertexAt(0)
+                last = geometry.vertexAt(geometry.constGet().nCoordinates() - 1)
+                endpoints.append((first.x(), first.y(), last.x(), last.y()))
+            joined.append((geometry, attrs))
+        
+        gis_length = np.array(gis_length, dtype=np.float64)
+        endpoints = np.array(endpoints, dtype=np.float64).reshape(-1, 4)
+        lengths = [attrs[length_index] if isinstance(attrs[length_index], (int, float)) else np.nan for geometry, attrs in joined]
+        len_err = attributes.length_error(lengths, gis_length)
+        azim = attributes.azimuth(endpoints[:, 0], endpoints[:, 1], endpoints[:, 2], endpoints[:, 3])
+        direction = attributes.direction(azim)
+        result = []
+        for current, (geometry, attrs) in enumerate(joined):
+            calculated = [None if np.isnan(gis_length[current]) else float(gis_length[current]),
+                          None if np.isnan(len_err[current]) else float(len_err[current]),
+                          None if np.isnan(azim[current]) else int(azim[current]),
+                          direction[current]]
+            result.append((geometry, attrs + calculated))
+        return result
+
+    def gpkgGeometry(self, geometry, srs_id):
+        if geometry.isEmpty():
+            return gpkg.wkb_blob(geometry.asWkb(), None, srs_id), (np.nan, np.nan, np.nan, np.nan)
+        box = geometry.boundingBox()
+        envelope = (box.xMinimum(), box.xMaximum(), box.yMinimum(), box.yMaximum())
+        return gpkg.wkb_blob(geometry.asWkb(), envelope, srs_id), envelope
+
     def initAlgorithm(self, config=None):
         self.addParameter(
             QgsProcessingParameterFeatureSource(
@@ -85,6 +177,96 @@ class GeophygisProcessingAlgorithm(QgsProcessingAlgorithm):
             )
         )
         
+        self.addParameter(
+            QgsProcessingParameterNumber(
+            'WORKERS',
+            'Number of parallel workers for file scanning:',
+            type = QgsProcessingParameterNumber.Integer,
+            defaultValue = 1,
+            minValue = 1
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterEnum(
+            'SCAN_MODE',
+            'Parallel scan mode:',
+            options = scan.SCAN_MODES,
+            defaultValue = 0
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+            'REBUILD_INDEX',
+            'Rebuild metadata index',
+            defaultValue = False
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+            'PROFILE_RUN',
+            'Write cProfile statistics of this run (*.prof)',
+            defaultValue = False
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterNumber(
+            'SINK_BATCH',
+            'Output features per write (batch size):',
+            type = QgsProcessingParameterNumber.Integer,
+            defaultValue = 1000,
+            minValue = 1
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+            'RECURSIVE',
+            'Discover all campaign folders under the parent directory and write one merged catalog',
+            defaultValue = False
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterFile(
+                'INV_DIR',
+                'Load inversion results (*.inv) listed in the *.bth files of the TOPO folder:',
+                behavior = QgsProcessingParameterFile.Folder,
+                optional = True
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+            'MODEL_OUTPUT',
+            'Inversion model blocks',
+            type = QgsProcessing.TypeVectorPoint,
+            optional = True,
+            createByDefault = False
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+            'WATCH',
+            'Then watch the folder and update the live outputs as profiles arrive (cancel to stop)',
+            defaultValue = False
+            )
+        )
+        
+        self.addParameter(
+            QgsProcessingParameterNumber(
+            'WATCH_INTERVAL',
+            'Watch polling interval [s] (without inotify):',
+            type = QgsProcessingParameterNumber.Double,
+            defaultValue = 2,
+            minValue = 0.1
+            )
+        )
+        
         self.addParameter(
             QgsProcessingParameterVectorDestination(
                 'OUTPUT',
@@ -111,118 +293,212 @@ class GeophygisProcessingAlgorithm(QgsProcessingAlgorithm):
             context
         )
         
+        workers = self.parameterAsInt(
+            parameters,
+            self.WORKERS,
+            context
+        )
+        
+        scan_mode = self.parameterAsEnum(
+            parameters,
+            self.SCAN_MODE,
+            context
+        )
+        
+        rebuild_index = self.parameterAsBool(
+            parameters,
+            self.REBUILD_INDEX,
+            context
+        )
+        
+        profile_run = self.parameterAsBool(
+            parameters,
+            self.PROFILE_RUN,
+            context
+        )
+        
+        sink_batch = self.parameterAsInt(
+            parameters,
+            self.SINK_BATCH,
+            context
+        )
+        
+        recursive = self.parameterAsBool(
+            parameters,
+            self.RECURSIVE,
+            context
+        )
+        
+        inv_dir_path = self.parameterAsString(
+            parameters,
+            self.INV_DIR,
+            context
+        )
+        
+        watch_mode = self.parameterAsBool(
+            parameters,
+            self.WATCH,
+            context
+        )
+        
+        watch_interval = self.parameterAsDouble(
+            parameters,
+            self.WATCH_INTERVAL,
+            context
+        )
+        
         if source.isValid() == False:
             raise QgsProcessingException('Invalid vector input')
         
         time_object = datetime.datetime.now()
         time_stamp = "(" + time_object.strftime('%d%m_%H%M%S') + ")"
-        profile_names = []
-        files = glob.glob(parent_dir_path + "/*.dat")
-        for i in range(0,len(files)):  # odczytanie nazw profili - ID
-            profile_names.append((str(os.path.basename(files[i]))[:-4]).upper())
-        data = dict.fromkeys(profile_names, [])
-        for key in profile_names:  # iterator po pliku
-            with open(parent_dir_path + "/" + key + ".dat") as datfile:
-                dat_lines = datfile.readlines()
-                dat_data = []
-                all_arrays =['Wenner-Alpha', 'Pole-Pole', 'Dipole-dipole', 'Wenner-Beta', 'Wenner-Gamma?','Pole-dipole', 'Schlumberger', 'Equatorial dipole-dipole']
-                for i in range(1, len(dat_lines)):
-                    dat_line = dat_lines[i].rstrip('\n')  # usunięcie niepotrzebnych n-lineów
-                    separator = dat_line[0]
-                    dat_line = dat_line.lstrip()
-                    if separator == ' ':
-                        dat_data.append(int(float(dat_line.split(' ')[0])))  # wyłuskanie pierwszej kolumny
-                    else:
-                        dat_data.append(int(float(dat_line.split('\t')[0])))  # wyłuskanie pierwszej kolumny
-                while dat_data[-1] == 0:  # wycięcie zer kończących
-                    del dat_data[-1]
-                max_electrode = max(dat_data[5:])
-                min_electrode = min(dat_data[5:])
-                base_spacing = dat_data[0]
-                array_type = dat_data[1]
-                if array_type in [1, 3, 4, 5, 6, 7]:  # wyliczenie dlugosci profilu
-                    profile_end = max_electrode + 3 * base_spacing - min_electrode
-                elif array_type == 2:
-                    profile_end = max_electrode + base_spacing - min_electrode
-                else:
-                    profile_end = -999
-            header_data = [profile_end, base_spacing, all_arrays[array_type-1]]  # zapisanie danych z dat do pliku
-            datfile.close()
-            if flag2dm is True:  #moduł do odczytu danych z plików 2dm
-                with open(parent_dir_path + "/" + key + ".2dm") as file:
-                    header_buffer = []
-                    for i in range(1, 26):
-                        header_line = file.readline()  # odczytanie linii pliku
-                        header_line = header_line.rstrip('\n')  # odrzucenie wszystkiego po nline
-                        header_buffer.append(header_line)
-                    if 'Time' in header_buffer[1] != -1:  # Ares-II
-                        file_type = [13, 2, 1, 0, 4, 5]
-                        for j in file_type:  # operacje porządkujące plik żródłowy
-                            header_buffer[j] = header_buffer[j].replace('\t', '')
-                            header_buffer[j] = re.sub(r'.*: ', '', header_buffer[j])
-                            for l in ['Operator:', 'Note:', 'Profile length:', ' m']:
-                                header_buffer[j] = header_buffer[j].replace(l, '')
-                            header_data.append(header_buffer[j])
-                    else:
-                        file_type = [9, 3, 24, 0, 2, 4]  # Ares-3D
-                        for j in file_type: # operacje porządkujące plik żródłowy
-                            header_buffer[j] = re.sub(r'.*:\t', '', header_buffer[j])
-                            header_buffer[j] = re.sub(r'.*: \t', '', header_buffer[j])
-                        header_buffer[24] = ''
-                        header_data.append(header_buffer[j])
-            data[key] = header_data
         parent_dir = os.path.basename(parent_dir_path)
+        report_path = parent_dir_path + "/" + parent_dir + '_timing' + time_stamp  # raport etapów (.json) i profil (.prof)
+        instruments = instrument.Instrumentation('import', feedback, report_path + '.prof' if profile_run else None).start()
+        if recursive:  # archiwum wielu kampanii - jeden katalog zamiast złączenia z warstwą
+            with instruments.stage('catalog') as stage:
+                uri_catalog = parent_dir_path + "/" + parent_dir + '_catalog' + time_stamp + '.csv'
+                stage.count = catalog.write_catalog(parent_dir_path, uri_catalog, feedback, workers=workers,
+                                                    use_processes=scan_mode == 1, rebuild=rebuild_index)[1]
+            feedback.pushInfo('file:///' + uri_catalog + '?delimiter=;')
+            instruments.finish(report_path + '.json')
+            return {}
+        with instruments.stage('scan') as stage:
+            profile_names = survey.profile_names(parent_dir_path)  # odczytanie nazw profili - ID
+            data, stage.count = survey.read_metadata(parent_dir_path, profile_names, flag2dm, feedback, workers=workers,
+                                                     use_processes=scan_mode == 1, rebuild=rebuild_index)
+        if feedback.isCanceled():
+            instruments.finish(report_path + '.json')
+            return {}
+        with instruments.stage('qc', len(data)):
+            qc_table = survey.read_qc(parent_dir_path, list(data), feedback, workers=workers)  # kontrola jakości ze wszystkich pomiarów
         uri = parent_dir_path + "/" + parent_dir + '_meta' + time_stamp + '.csv'
-        file_out = open(uri, 'a+')
-        file_out.write("ID;LENGTH;SPACING;ARRAY;field_LENGTH;DATE;TIME;DEVICE;OPERATOR;NOTES\n")
-        for key in profile_names:  # eksport wszystkich danych do pliku csv, porządkowanie danych
-            line_out = str(data[key])
-            line_out = line_out.replace(", ", ";")
-            line_out = line_out.replace("'", "")
-            line_out = line_out.replace('[', '')
-            line_out = line_out.replace(']', '')
-            file_out.write(key + ';' + line_out + '\n')
-        file_out.close()
+        with instruments.stage('meta csv', len(data)):
+            survey.write_meta_csv(uri, data)
         
         feedback.pushInfo('file:///' + uri + '?delimiter=;')
-        feedback.pushInfo(str(type(source)))
-        feedback.pushInfo(str(type(self.INPUT)))
         feedback.pushInfo(parent_dir_path)
         feedback.pushInfo('CRS is {}'.format(source.sourceCrs().authid()))
         feedback.pushInfo(str(source.sourceCrs().authid()))
         
-        azim_text = 'degrees(azimuth(start_point($geometry), end_point($geometry)))'
-        dir_text = """if("AZIM" > 337.5 OR "AZIM" <22.5, 'N', if("AZIM" > 22.5 AND "AZIM" <67.5, 'NE', 
-        if("AZIM" > 67.5 AND "AZIM" <112.5, 'E', if("AZIM" > 112.5 AND "AZIM" <157.5, 'SE', 
-        if("AZIM" > 157.5 AND "AZIM" <202.5, 'S', if("AZIM" > 202.5 AND "AZIM" <247.5, 'SW',
-        if("AZIM" > 247.5 AND "AZIM" <292.5, 'W', if("AZIM" > 295.5 AND "AZIM" <337.5, 'NW', 'err'))))))))"""
-                    
-        csv = QgsVectorLayer('file:///' + uri + '?delimiter=;', 'test', 'delimitedtext')
-        merged = processing.run("native:joinattributestable", {'INPUT': source, 'FIELD': 'ID' , 'INPUT_2': csv, 'FIELD_2': 'ID', 'METHOD': 1, 'OUTPUT':'memory:'})
-        calc_len = processing.run("qgis:fieldcalculator", {'INPUT': merged['OUTPUT'], 'FIELD_NAME':'GIS_LENGTH', 'FIELD_TYPE': 0, 'FIELD_LENGTH': 10, 'FIELD_PRECISION': 1, 'NEW_FIELD':True, 'FORMULA': '$length', 'OUTPUT':'memory:'})
-        calc_err = processing.run("qgis:fieldcalculator", {'INPUT': calc_len['OUTPUT'], 'FIELD_NAME':'LEN_ERR_[%]', 'FIELD_TYPE': 0, 'FIELD_LENGTH': 10, 'FIELD_PRECISION': 2, 'NEW_FIELD':True, 'FORMULA': 'abs("LENGTH"-"GIS_LENGTH")/"LENGTH"*100', 'OUTPUT':'memory:'})
-        calc_azim = processing.run("qgis:fieldcalculator", {'INPUT': calc_err['OUTPUT'], 'FIELD_NAME':'AZIM', 'FIELD_TYPE': 1, 'FIELD_LENGTH': 10, 'FIELD_PRECISION': 0, 'NEW_FIELD':True, 'FORMULA': azim_text , 'OUTPUT':'memory:'})
-        calc_dir = processing.run("qgis:fieldcalculator", {'INPUT': calc_azim['OUTPUT'], 'FIELD_NAME':'DIRECTION', 'FIELD_TYPE' : 2, 'FIELD_LENGTH':10, 'FIELD_PRECISION': 0, 'NEW_FIELD':True, 'FORMULA': dir_text, 'OUTPUT':'memory:'}, context = context, feedback=feedback)['OUTPUT']
+        with instruments.stage('join') as stage:
+            types, table = attributes.meta_table(data)  # złączenie po ID bez pliku csv i warstwy tymczasowej
+            fields = self.joinedFields(source, types)
+        
+            distance_area = QgsDistanceArea()  # $length liczony tak jak w kalkulatorze pól
+            distance_area.setSourceCrs(source.sourceCrs(), context.transformContext())
+            distance_area.setEllipsoid(context.ellipsoid())
+        
+            joined = self.joinFeatures(source, fields, table, qc_table, distance_area, context, feedback)
+            stage.count = len(joined)
         
         (sink, dest_id) = self.parameterAsSink(
             parameters,
             self.OUTPUT,
             context,
-            calc_dir.fields(),
-            calc_dir.wkbType(),
-            calc_dir.sourceCrs()
+            fields,
+            source.wkbType(),
+            source.sourceCrs()
         )
         
-        uri_docsheet = parent_dir_path + "/" + parent_dir + '_docsheet_' + time_stamp + '.csv'
-        file_docsheet = open(uri_docsheet, 'a+')  # tworzymy nowy csv
-        file_docsheet.write('ID\tGIS_LENGHTH\tLENHGTH\tARRAY\tSPACING\tDIRECTION\n')
+        with instruments.stage('write', len(joined)):
+            uri_docsheet = parent_dir_path + "/" + parent_dir + '_docsheet_' + time_stamp + '.csv'
+            file_docsheet = open(uri_docsheet, 'a+')  # tworzymy nowy csv
+            file_docsheet.write(survey.DOCSHEET_HEADER)
         
-        features = calc_dir.getFeatures()
-        for current, feature in enumerate(features):
-            if feedback.isCanceled():
-                break
-            sink.addFeature(feature, QgsFeatureSink.FastInsert)
-            lineout = str(feature['ID']) + "\t" + str(round(float(feature['GIS_LENGTH']),2)) + "\t" + str(feature['LENGTH']) + "\t" + str(feature['ARRAY']) + "\t" + str(feature['SPACING']) + "\t" + str(feature['DIRECTION'] + "\n")
-            file_docsheet.write(lineout)
+            docsheet_columns = [fields.lookupField(name) for name in ['ID', 'GIS_LENGTH', 'LENGTH', 'ARRAY', 'SPACING', 'DIRECTION']]
+            batch = []
+            for geometry, values in joined:
+                if feedback.isCanceled():
+                    break
+                feature = QgsFeature(fields)
+                feature.setGeometry(geometry)
+                feature.setAttributes(values)
+                batch.append(feature)
+                if len(batch) >= sink_batch:
+                    sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+                    batch = []
+                file_docsheet.write(survey.docsheet_line([values[i] for i in docsheet_columns]))
+            if batch:
+                sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+            file_docsheet.close()
+        model_sink = None
+        if inv_dir_path:  # modele z ostatniej iteracji wzdłuż linii profili
+            with instruments.stage('inversion results') as stage:
+                lines = {str(feature['ID']): qgisutils.line_parts(feature.geometry())
+                         for feature in source.getFeatures() if not feature.geometry().isEmpty()}
+                placed = invfile.placed_models(inv_dir_path, lines, feedback, workers=workers,
+                                               use_processes=scan_mode == 1)
+                invfile.write_models_csv(inv_dir_path + "/" + parent_dir + '_models' + time_stamp + '.csv', placed)
+                model_fields = QgsFields()
+                for name, sql_type in invfile.MODEL_FIELDS:
+                    model_fields.append(QgsField(name, {'TEXT': QVariant.String, 'INTEGER': QVariant.Int}.get(sql_type, QVariant.Double)))
+                (model_sink, model_dest_id) = self.parameterAsSink(
+                    parameters,
+                    self.MODEL_OUTPUT,
+                    context,
+                    model_fields,
+                    QgsWkbTypes.PointZ,
+                    source.sourceCrs()
+                )
+                if model_sink is not None:
+                    batch = []
+                    for points in placed:
+                        for values, x, y, z in zip(invfile.model_rows(points), points.x, points.y, points.elevation):
+                            model_feature = QgsFeature(model_fields)
+                            model_feature.setGeometry(QgsGeometry(QgsPoint(x, y, z)))
+                            model_feature.setAttributes(values)
+                            batch.append(model_feature)
+                            if len(batch) >= sink_batch:
+                                model_sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+                                batch = []
+                    if batch:
+                        model_sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+                stage.count = sum(points.model.rho.size for points in placed)
+        instruments.finish(report_path + '.json')
+        
+        if watch_mode and not feedback.isCanceled():  # pliki *_live aktualizowane w miejscu podczas pomiarów
+            live_path = parent_dir_path + "/" + parent_dir
+            srs = qgisutils.gpkg_srs(source.sourceCrs())
+            srs_id = -1 if srs is None else srs[0]
+            id_index = fields.lookupField('ID')
+            live_rows = {}
+        
+            def on_update(data, changed, removed):
+                table = attributes.meta_table(data)[1]
+                for name in removed:
+                    qc_table.pop(name, None)
+                qc_table.update(survey.read_qc(parent_dir_path, sorted(changed), feedback, workers=workers))
+                ids = None if not live_rows else changed | removed
+                joined = self.joinFeatures(source, fields, table, qc_table, distance_area, context, feedback, ids)
+                updated = {}
+                for geometry, values in joined:
+                    updated.setdefault(str(values[id_index]), []).append((geometry, values))
+                blobs, envelopes, rows = [], [], []
+                for geometry, values in joined:
+                    blob, envelope = self.gpkgGeometry(geometry, srs_id)
+                    blobs.append(blob)
+                    envelopes.append(envelope)
+                    rows.append([qgisutils.gpkg_value(value) for value in values])
+                if not live_rows:
+                    with gpkg.GeoPackageWriter(live_path + watch.GPKG_LIVE, srs, spatial_index=False) as writer:
+                        writer.create_table(watch.LIVE_TABLE, qgisutils.gpkg_fields(fields), 'GEOMETRY')
+                        writer.add_geometries(watch.LIVE_TABLE, blobs, envelopes, rows)
+                    feedback.pushInfo(live_path + watch.GPKG_LIVE)
+                else:
+                    gpkg.replace_features(live_path + watch.GPKG_LIVE, watch.LIVE_TABLE,
+                                          qgisutils.gpkg_fields(fields)[id_index][0], ids, blobs, rows)
+                for name in ids or ():
+                    live_rows.pop(name, None)
+                live_rows.update(updated)
+                watch.write_live(live_path + watch.META_LIVE, survey.write_meta_csv, data)
+                watch.write_live(live_path + watch.DOCSHEET_LIVE, survey.write_docsheet,
+                                 [[values[i] for i in docsheet_columns] for features in live_rows.values()
+                                  for geometry, values in features])
+        
+            watch.watch_survey(parent_dir_path, flag2dm, feedback, on_update, workers=workers, interval=watch_interval)
         
-        return {self.OUTPUT: dest_id}
+        results = {self.OUTPUT: dest_id}
+        if model_sink is not None:  # warstwa modeli tylko gdy została utworzona
+            results[self.MODEL_OUTPUT] = model_dest_id
+        return results
@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Benchmarks of the Import and Export stages on synthetic surveys.
+
+    python benchmarks/run.py --scales small medium
+    python benchmarks/run.py --save-baseline
+    python benchmarks/run.py --qgis
+
+Every stage of both algorithms that does not need QGIS (parse, join,
+densify, sample, filter, write) runs on top of the geophygis package, so
+only NumPy is required. The export.* stages after them time
+survey.export_survey end to end: a plain export, an incremental export
+into an empty and then into an up-to-date TOPO_incremental, fine curve
+densification, a DEM mosaic of ``--tiles`` x ``--tiles`` sheets and
+GeoPackage output. Each stage reports wall and CPU time (best of
+``--repeat`` runs), peak traced memory and a checksum of its output. The
+results are compared with the baseline JSON: stages slower than the
+tolerance allows or with a different checksum are listed as regressions
+and the exit code is 1. ``--qgis`` additionally times both complete
+processing algorithms when the QGIS Python bindings are importable.
+
+benchmarks/baseline.json is the reference of the default scales. Its
+checksums hold on any machine; its times only on the machine that wrote
+it, so before comparing times elsewhere save a baseline there first
+(``--save-baseline`` on the unchanged tree) and keep it out of commits.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import importlib.util
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from geophygis import (scan, attributes, sampling, dem, topostore, filters, topowriter, datload, geotiff, mosaic,
+                       topocache, instrument, invfile, survey as export)
+from geophygis.survey import filter_profiles, write_batch_files, read_qc
+import synthetic
+
+SCALES = {
+    'small': dict(n_profiles=16, n_datums=500, n_electrodes=48, dem_size=1000),
+    'medium': dict(n_profiles=120, n_datums=2000, n_electrodes=96, dem_size=3000),
+    'large': dict(n_profiles=480, n_datums=10000, n_electrodes=160, dem_size=6000),
+}
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+DEFAULT_TOLERANCE = 0.25
+
+
+class Feedback:
+    """Stand-in for QgsProcessingFeedback collecting the messages."""
+
+    def __init__(self):
+        self.messages = []
+
+    def isCanceled(self):
+        return False
+
+    def setProgress(self, progress):
+        pass
+
+    def pushInfo(self, text):
+        self.messages.append(text)
+
+    def reportError(self, text, fatalError=False):
+        self.messages.append(text)
+
+
+def _checksum(*arrays):
+    return round(float(sum(np.nansum(np.asarray(a, dtype=np.float64)) for a in arrays)), 3)
+
+
+def stage_parse(survey, state):
+    names = [name.upper() for name in survey.profile_names]
+    state['data'] = scan.scan_profiles(survey.path, names, True, Feedback(), workers=state['workers'])
+    return _checksum([row[0] for row in state['data'].values()])
+
+
+def stage_qc_cold(survey, state):
+    shutil.rmtree(os.path.join(survey.path, datload.CACHE_DIR), ignore_errors=True)
+    return stage_qc_warm(survey, state)
+
+
+def stage_qc_warm(survey, state):
+    qc = read_qc(survey.path, survey.profile_names, Feedback(), workers=state['workers'])
+    return _checksum([value for row in qc.values() for value in row[1:]])
+
+
+def stage_join(survey, state):
+    types, table = attributes.meta_table(state['data'])
+    length_index = attributes.META_FIELDS.index('LENGTH')
+    gis_length = []
+    endpoints = []
+    lengths = []
+    for name in survey.profile_names:
+        x, y = survey.lines[name]
+        gis_length.append(np.hypot(np.diff(x), np.diff(y)).sum())
+        endpoints.append((x[0], y[0], x[-1], y[-1]))
+        lengths.append(table[name][length_index] if name in table else np.nan)
+    endpoints = np.array(endpoints)
+    len_err = attributes.length_error(lengths, gis_length)
+    azim = attributes.azimuth(endpoints[:, 0], endpoints[:, 1], endpoints[:, 2], endpoints[:, 3])
+    direction = attributes.direction(azim)
+    return _checksum(len_err, azim) + int((direction != 'err').sum())
+
+
+def stage_densify(survey, state):
+    state['points'] = {name: sampling.densify([survey.lines[name]], survey.spacing) for name in survey.profile_names}
+    return _checksum(*[np.concatenate(columns) for columns in zip(*state['points'].values())])
+
+
+def stage_sample(survey, state):
+    raster = np.memmap(survey.dem_path, dtype='<f4', mode='r', offset=survey.dem_offset, shape=survey.dem.shape)
+
+    def read_block(col0, row0, width, height):
+        return raster[row0:row0 + height, col0:col0 + width]
+
+    reader = dem.DemReader(read_block, survey.dem.shape[1], survey.dem.shape[0], survey.dem_origin[0],
+                           survey.dem_origin[1], survey.dem_cell, survey.dem_cell, cache_bytes=state['cache_bytes'])
+    store = topostore.TopoStore()
+    elevations = []
+    for name, (distance, x, y, angle) in state['points'].items():
+        elevation = reader.sample(x, y, state['dem_sampling'])
+        valid = ~np.isnan(elevation)
+        store.add(name, distance[valid], elevation[valid])
+        elevations.append(elevation)
+    state['store'] = store
+    del raster
+    return _checksum(*elevations)
+
+
+def stage_filter(survey, state):
+    state['profiles'] = filter_profiles(state['store'], state['window'], state['filter_type'], Feedback())
+    return _checksum(*[elevation for distance, elevation in state['profiles'].values()])
+
+
+def stage_write(survey, state):
+    topo_dir = os.path.join(survey.path, 'TOPO_bench')
+    shutil.rmtree(topo_dir, ignore_errors=True)
+    os.mkdir(topo_dir)
+    written = topowriter.write_profiles(state['profiles'], survey.path, topo_dir, topo_dir + '/bench.top', Feedback())
+    write_batch_files(topo_dir, survey.path, 'bench.ivp', Feedback())
+    return len(written) + os.path.getsize(topo_dir + '/bench.top')
+
+
+def _export(survey, state, folder, dem_reader=None, **kwargs):
+    """export_survey of the whole synthetic survey into a new ``folder``; checksum of its outputs."""
+    topo_dir = os.path.join(survey.path, folder)
+    if folder != export.INCREMENTAL_DIR:
+        shutil.rmtree(topo_dir, ignore_errors=True)
+    os.makedirs(topo_dir, exist_ok=True)
+    if dem_reader is None:
+        dem_reader = geotiff.open_dem(survey.dem_path, [dem.DEFAULT_NODATA], state['cache_bytes'])
+    lines = {name: [survey.lines[name]] for name in survey.profile_names}
+    written = export.export_survey(survey.path, lines, dem_reader, survey.spacing, topo_dir, Feedback(),
+                                   instrument.Instrumentation('bench', Feedback()).start(),
+                                   dem_sampling=state['dem_sampling'], window=state['window'],
+                                   filter_type=state['filter_type'], ivp_path='bench.ivp', **kwargs)
+    curves = invfile.read_top(os.path.join(topo_dir, os.path.basename(survey.path) + '.top'))
+    return len(written) + _checksum(*[elevation for distance, elevation in curves.values()])
+
+
+def stage_export(survey, state):
+    return _export(survey, state, 'TOPO_bench')
+
+
+def _export_incremental(survey, state):
+    topo_dir = os.path.join(survey.path, export.INCREMENTAL_DIR)
+    with topocache.TopoCache(topo_dir) as cache:
+        key = export.dem_key(topocache.file_signature(survey.dem_path), [dem.DEFAULT_NODATA])
+        return _export(survey, state, export.INCREMENTAL_DIR, cache=cache, dem_key=key)
+
+
+def stage_incremental_cold(survey, state):
+    shutil.rmtree(os.path.join(survey.path, export.INCREMENTAL_DIR), ignore_errors=True)
+    return _export_incremental(survey, state)
+
+
+def stage_incremental_warm(survey, state):  # po etapie cold - wszystkie profile bez zmian
+    return _export_incremental(survey, state)
+
+
+def stage_fine(survey, state):
+    cache_dir = os.path.join(survey.path, datload.CACHE_DIR)
+    with topocache.TopoCache(cache_dir, True, topocache.CURVE_CACHE) as curves:  # krzywe liczone od nowa
+        return _export(survey, state, 'TOPO_bench', curves=curves, step=state['fine_step'])
+
+
+def write_tiles(survey, folder, n_tiles):
+    """Split the DEM of ``survey`` into n_tiles x n_tiles GeoTIFF sheets in ``folder``."""
+    shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(folder)
+    rows, cols = survey.dem.shape
+    for i, row0 in enumerate(range(0, rows, -(-rows // n_tiles))):
+        for j, col0 in enumerate(range(0, cols, -(-cols // n_tiles))):
+            tile = survey.dem[row0:row0 + -(-rows // n_tiles), col0:col0 + -(-cols // n_tiles)]
+            synthetic.write_geotiff(os.path.join(folder, 'tile_{}_{}.tif'.format(i, j)), np.ascontiguousarray(tile),
+                                    survey.dem_origin[0] + col0 * survey.dem_cell,
+                                    survey.dem_origin[1] - row0 * survey.dem_cell, survey.dem_cell)
+    return folder
+
+
+def stage_mosaic(survey, state):
+    reader = mosaic.DemMosaic(mosaic.tile_paths(state['tiles']), [dem.DEFAULT_NODATA], state['cache_bytes'])
+    return _export(survey, state, 'TOPO_bench', reader)
+
+
+def stage_gpkg(survey, state):
+    geopackage = export.open_geopackage(os.path.join(survey.path, 'bench.gpkg'))
+    try:
+        checksum = _export(survey, state, 'TOPO_bench', geopackage=geopackage)
+        checksum += geopackage.count(export.GPKG_POINTS)
+        geopackage.close()
+        geopackage = None
+    finally:
+        if geopackage is not None:
+            geopackage.connection.close()
+    return checksum
+
+
+STAGES = [('import.parse', stage_parse), ('import.qc.cold', stage_qc_cold), ('import.qc.warm', stage_qc_warm),
+          ('import.join', stage_join), ('export.densify', stage_densify),
+          ('export.sample', stage_sample), ('export.filter', stage_filter), ('export.write', stage_write),
+          ('export.survey', stage_export), ('export.incr.cold', stage_incremental_cold),
+          ('export.incr.warm', stage_incremental_warm), ('export.fine', stage_fine),
+          ('export.mosaic', stage_mosaic), ('export.gpkg', stage_gpkg)]
+
+
+def measure(function, repeat):
+    """Best wall/CPU time of ``repeat`` runs and peak traced memory of one more."""
+    walls, cpus = [], []
+    for i in range(repeat):
+        wall, cpu = time.perf_counter(), time.process_time()
+        checksum = function()
+        walls.append(time.perf_counter() - wall)
+        cpus.append(time.process_time() - cpu)
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'wall': round(min(walls), 4), 'cpu': round(min(cpus), 4),
+            'peak_mb': round(peak / 1024 ** 2, 2), 'checksum': checksum}
+
+
+def _load_script(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_qgis(survey, repeat):
+    """Time the complete Import and Export algorithms, None without QGIS."""
+    try:
+        from qgis.core import (QgsApplication, QgsProcessing, QgsProcessingContext, QgsProcessingFeedback,
+                               QgsProject, QgsRasterLayer, QgsVectorLayer)
+    except ImportError:
+        return None
+    if QgsApplication.instance() is None:
+        run_qgis.application = QgsApplication([], False)
+        run_qgis.application.initQgis()
+    root = os.path.dirname(BENCH_DIR)
+    import_module = _load_script(os.path.join(root, 'Import_1.0.py'), 'geophygis_import')
+    export_module = _load_script(os.path.join(root, 'Export_1.0.py'), 'geophygis_export')
+    name = os.path.basename(os.path.normpath(survey.path))
+    lines = QgsVectorLayer('file:///' + survey.path + '/' + name + '_lines.csv?delimiter=;&wkt=WKT&crs=EPSG:2180',
+                           'lines', 'delimitedtext')
+    raster = QgsRasterLayer(survey.dem_path, 'dem')
+    runs = [('qgis.import', import_module.GeophygisProcessingAlgorithm,
+             {'INPUT': lines, 'PARENT_DIR': survey.path, 'INPUT_FLAG': True, 'OUTPUT': QgsProcessing.TEMPORARY_OUTPUT}),
+            ('qgis.export', export_module.ExampleProcessingAlgorithm,
+             {'INPUT': lines, 'INPUT_DEM': raster, 'SPACING': survey.spacing, 'PARENT_DIR': survey.path,
+              'MEDIAN_WINDOW': 5, 'OUTPUT': QgsProcessing.TEMPORARY_OUTPUT})]
+    results = {}
+    for stage, algorithm_class, parameters in runs:
+        def run():
+            algorithm = algorithm_class().create()
+            algorithm.initAlgorithm()
+            context = QgsProcessingContext()
+            context.setProject(QgsProject.instance())
+            outputs, ok = algorithm.run(parameters, context, QgsProcessingFeedback())
+            if not ok:
+                raise RuntimeError(stage + ' failed')
+            return len(outputs)
+        results[stage] = measure(run, repeat)
+    return results
+
+
+def run_scale(scale, work_dir, args):
+    survey_path = os.path.join(work_dir, 'BENCH_' + scale.upper())
+    started = time.perf_counter()
+    survey = synthetic.generate_survey(survey_path, seed=args.seed, **SCALES[scale])
+    print("{}: survey generated in {:.1f} s ({} profiles)".format(scale, time.perf_counter() - started, len(survey.profile_names)))
+    state = {'workers': args.workers, 'dem_sampling': args.dem_sampling, 'window': args.window,
+             'filter_type': args.filter_type, 'cache_bytes': int(args.cache_mb * 1024 ** 2),
+             'fine_step': args.fine_step, 'tiles': write_tiles(survey, os.path.join(work_dir, scale + '_tiles'), args.tiles)}
+    results = {}
+    for stage, function in STAGES:
+        results[stage] = measure(lambda: function(survey, state), args.repeat)
+        print("  {:<16} {wall:>9.4f} s wall {cpu:>9.4f} s cpu {peak_mb:>9.2f} MB peak".format(stage, **results[stage]))
+    if args.qgis:
+        qgis_results = run_qgis(survey, args.repeat)
+        if qgis_results is None:
+            print("  QGIS not available, complete algorithm runs skipped")
+        else:
+            for stage, result in qgis_results.items():
+                print("  {:<16} {wall:>9.4f} s wall {cpu:>9.4f} s cpu {peak_mb:>9.2f} MB peak".format(stage, **result))
+            results.update(qgis_results)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Regressions against the baseline as a list of text lines."""
+    regressions = []
+    for scale, stages in results.items():
+        for stage, result in stages.items():
+            reference = baseline.get(scale, {}).get(stage)
+            if reference is None:
+                continue
+            if result['wall'] > reference['wall'] * (1 + tolerance) and result['wall'] - reference['wall'] > 0.01:
+                regressions.append("{} {}: {:.4f} s vs {:.4f} s in baseline".format(scale, stage, result['wall'], reference['wall']))
+            if result['checksum'] != reference['checksum']:
+                regressions.append("{} {}: checksum {} vs {} in baseline".format(scale, stage, result['checksum'], reference['checksum']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='GeophyGIS Import/Export benchmarks on synthetic surveys.')
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['small', 'medium'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=1, help='parallel workers of the parse stage')
+    parser.add_argument('--dem-sampling', type=int, default=0, choices=range(len(dem.SAMPLING_METHODS)))
+    parser.add_argument('--filter-type', type=int, default=0, choices=range(len(filters.FILTER_TYPES)))
+    parser.add_argument('--window', type=int, default=5)
+    parser.add_argument('--cache-mb', type=float, default=256)
+    parser.add_argument('--fine-step', type=float, default=0, help='fine sampling step (0 - DEM cell size)')
+    parser.add_argument('--tiles', type=int, default=4, help='DEM mosaic of tiles x tiles sheets')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', help='keep the generated surveys in this folder')
+    parser.add_argument('--output', help='write the results JSON to this file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='allowed relative slowdown')
+    parser.add_argument('--qgis', action='store_true', help='also time the complete algorithms (needs QGIS)')
+    args = parser.parse_args(argv)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='geophygis_bench_')
+    try:
+        results = {scale: run_scale(scale, work_dir, args) for scale in args.scales}
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    report = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+              'parameters': {k: v for k, v in vars(args).items() if k not in ('baseline', 'output', 'work_dir')},
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as baseline_file:
+                baseline = json.load(baseline_file).get('results', {})
+        baseline.update(results)
+        report['results'] = baseline
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(report, baseline_file, indent=2)
+        print("Baseline saved: " + args.baseline)
+        return 0
+    if not os.path.exists(args.baseline):
+        print("No baseline at {} (run with --save-baseline)".format(args.baseline))
+        return 0
+    with open(args.baseline) as baseline_file:
+        regressions = compare(results, json.load(baseline_file).get('results', {}), args.tolerance)
+    for line in regressions:
+        print("REGRESSION " + line)
+    if not regressions:
+        print("No regressions against " + args.baseline)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
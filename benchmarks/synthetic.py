@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Synthetic survey generator for the GeophyGIS benchmarks.
+
+A survey folder gets, for every profile, a Res2DInv *.dat file (array
+types cycling through all eight types of datfile.ALL_ARRAYS) and an Ares-II
+or Ares-3D style *.2dm header, plus the profile lines as WKT
+(``<name>_lines.csv``) and a float32 GeoTIFF DEM covering them.
+Only NumPy is needed.
+"""
+
+import os
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+Survey = namedtuple('Survey', ['path', 'profile_names', 'lines', 'spacing', 'dem', 'dem_origin', 'dem_cell',
+                               'dem_path', 'dem_offset'])
+
+# liczba kolumn danych dla typów układów 1..8 (x, a, [n,] rho)
+DAT_COLUMNS = {1: 3, 2: 3, 3: 4, 4: 3, 5: 3, 6: 4, 7: 4, 8: 4}
+
+
+def dem_surface(x, y):
+    return 150 + 25 * np.sin(x / 310.0) * np.cos(y / 470.0) + 0.004 * x
+
+
+def write_geotiff(path, array, x_min, y_max, cell, epsg=2180):
+    """Write a single band float32 GeoTIFF stored as one uncompressed strip.
+
+    Returns the byte offset of the pixel data, so the file can be
+    memory-mapped directly.
+    """
+    array = np.ascontiguousarray(array, dtype='<f4')
+    height, width = array.shape
+    tags = [(256, 4, [width]), (257, 4, [height]), (258, 3, [32]), (259, 3, [1]), (262, 3, [1]),
+            (273, 4, [0]), (277, 3, [1]), (278, 4, [height]), (279, 4, [array.nbytes]), (339, 3, [3]),
+            (33550, 12, [cell, cell, 0.0]), (33922, 12, [0.0, 0.0, 0.0, x_min, y_max, 0.0]),
+            (34735, 3, [1, 1, 0, 3, 1024, 0, 1, 1, 1025, 0, 1, 1, 3072, 0, 1, epsg])]
+    formats = {3: 'H', 4: 'I', 12: 'd'}
+    extra_offset = 8 + 2 + len(tags) * 12 + 4
+    entries = []
+    extra = b''
+    for code, kind, values in tags:
+        data = struct.pack('<%d%s' % (len(values), formats[kind]), *values)
+        if len(data) > 4:  # wartości nie mieszczące się w polu IFD
+            entries.append((code, kind, len(values), struct.pack('<I', extra_offset + len(extra))))
+            extra += data
+        else:
+            entries.append((code, kind, len(values), data.ljust(4, b'\0')))
+    data_offset = extra_offset + len(extra)
+    ifd = struct.pack('<H', len(entries))
+    for code, kind, count, value in entries:
+        if code == 273:
+            value = struct.pack('<I', data_offset)
+        ifd += struct.pack('<HHI', code, kind, count) + value
+    with open(path, 'wb') as tif:
+        tif.write(b'II*\0' + struct.pack('<I', 8) + ifd + struct.pack('<I', 0) + extra)
+        tif.write(array.tobytes())
+    return data_offset
+
+
+def dat_rows(array_type, n_datums, n_electrodes, spacing, rng):
+    """Data rows (x, a, [n,] rho) of one synthetic profile."""
+    levels = max(1, min(8, n_electrodes // 4))
+    level = rng.integers(1, levels + 1, n_datums)
+    x = rng.integers(0, max(n_electrodes - 3 * levels, 1), n_datums) * spacing + 1.5 * spacing * level
+    x.sort()
+    rho = np.round(np.exp(rng.normal(4.5, 0.8, n_datums)), 3)
+    if DAT_COLUMNS[array_type] == 3:
+        return np.column_stack([x, spacing * level, rho])
+    return np.column_stack([x, np.full(n_datums, spacing), level, rho])
+
+
+def write_dat(path, name, array_type, rows, spacing):
+    with open(path, 'w') as dat:
+        dat.write(name + "\n" + str(spacing) + "\n" + str(array_type) + "\n" + str(len(rows)) + "\n1\n0\n")
+        np.savetxt(dat, rows, fmt=' %.3f')
+        dat.write("0\n0\n0\n0\n")
+
+
+def write_2dm(path, ares3d, length, index):
+    lines = ['Other line'] * 25
+    if ares3d:
+        lines[0] = 'Instrument:\tARES-3D'
+        lines[2] = 'Start:\t10:%02d:00' % (index % 60)
+        lines[3] = 'Date:\t2020-05-%02d' % (index % 28 + 1)
+        lines[4] = 'Operator:\tBench'
+        lines[9] = 'Profile length:\t%d' % length
+        lines[24] = 'Note:\tsynthetic'
+    else:
+        lines[0] = 'Device: ARES-II'
+        lines[1] = 'Time: 10:%02d:00' % (index % 60)
+        lines[2] = 'Date: 2020-05-%02d' % (index % 28 + 1)
+        lines[4] = 'Operator: Bench'
+        lines[5] = 'Note: synthetic'
+        lines[13] = 'Profile length: %d m' % length
+    with open(path, 'w') as dm:
+        dm.write('\n'.join(lines) + '\n')
+
+
+def generate_survey(path, n_profiles=20, n_datums=2000, n_electrodes=80, spacing=5,
+                    dem_size=2000, dem_cell=1.0, seed=0):
+    """Create a synthetic survey in ``path`` and return its Survey description."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(path, exist_ok=True)
+    name = os.path.basename(os.path.normpath(path))
+    x_min, y_max = 500000.0, 300000.0 + dem_size * dem_cell
+    length = (n_electrodes - 1) * spacing
+    profile_names = []
+    lines = {}
+    with open(os.path.join(path, name + '_lines.csv'), 'w') as csv:
+        csv.write("ID;WKT\n")
+        for i in range(n_profiles):
+            profile = 'P%04d' % (i + 1)
+            profile_names.append(profile)
+            azimuth = rng.uniform(0, 2 * np.pi)
+            span = dem_size * dem_cell
+            x0 = x_min + rng.uniform(0.1, 0.9) * span
+            y0 = y_max - rng.uniform(0.1, 0.9) * span
+            bend = rng.uniform(-0.3, 0.3)  # jeden załom w połowie profilu
+            xs = np.array([x0, x0 + 0.5 * length * np.sin(azimuth), x0 + 0.5 * length * (np.sin(azimuth) + np.sin(azimuth + bend))])
+            ys = np.array([y0, y0 + 0.5 * length * np.cos(azimuth), y0 + 0.5 * length * (np.cos(azimuth) + np.cos(azimuth + bend))])
+            lines[profile] = (xs, ys)
+            csv.write(profile + ";LINESTRING(" + ", ".join("%.3f %.3f" % (x, y) for x, y in zip(xs, ys)) + ")\n")
+            array_type = i % 8 + 1
+            rows = dat_rows(array_type, n_datums, n_electrodes, spacing, rng)
+            write_dat(os.path.join(path, profile + '.dat'), profile, array_type, rows, spacing)
+            write_2dm(os.path.join(path, profile + '.2dm'), i % 2 == 1, length, i)
+    cols = (np.arange(dem_size) + 0.5) * dem_cell + x_min
+    rows = y_max - (np.arange(dem_size) + 0.5) * dem_cell
+    dem = dem_surface(cols[None, :], rows[:, None]).astype(np.float32)
+    dem_path = os.path.join(path, name + '_dem.tif')
+    dem_offset = write_geotiff(dem_path, dem, x_min, y_max, dem_cell)
+    return Survey(path, profile_names, lines, spacing, dem, (x_min, y_max), dem_cell, dem_path, dem_offset)
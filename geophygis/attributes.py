@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Attribute calculations of Import done on whole columns with NumPy.
+
+The results follow the expressions previously evaluated per feature by
+qgis:fieldcalculator (GIS_LENGTH, LEN_ERR_[%], AZIM and DIRECTION) and the
+field types the delimited text provider guessed for the metadata CSV.
+"""
+
+import numpy as np
+
+META_FIELDS = ['ID', 'LENGTH', 'SPACING', 'ARRAY', 'field_LENGTH', 'DATE', 'TIME', 'DEVICE', 'OPERATOR', 'NOTES']
+
+# granice kierunków jak w dawnym wyrażeniu (łącznie z przerwą 292.5-295.5 -> 'err')
+DIRECTION_BOUNDS = [(22.5, 67.5, 'NE'), (67.5, 112.5, 'E'), (112.5, 157.5, 'SE'), (157.5, 202.5, 'S'),
+                    (202.5, 247.5, 'SW'), (247.5, 292.5, 'W'), (295.5, 337.5, 'NW')]
+
+
+def _guess_type(values):
+    values = [value for value in values if value != '']
+    if not values:
+        return 'string'
+    try:
+        [int(value) for value in values]
+        return 'int'
+    except ValueError:
+        pass
+    try:
+        [float(value) for value in values]
+        return 'double'
+    except ValueError:
+        return 'string'
+
+
+def meta_table(data):
+    """Typed metadata columns joined to the profiles, keyed by ID.
+
+    Returns ``(types, table)``: the guessed type of each META_FIELDS column
+    and a dict mapping ID to a full row (missing values are None).
+    """
+    width = len(META_FIELDS)
+    rows = {}
+    for key, row in data.items():
+        text = [key] + [str(value).replace("'", "") for value in row]
+        rows[key] = (text + [''] * width)[:width]
+    types = [_guess_type([row[i] for row in rows.values()]) for i in range(width)]
+    cast = {'int': int, 'double': float, 'string': str}
+    table = {}
+    for key, row in rows.items():
+        table[key] = [cast[types[i]](value) if value != '' else None for i, value in enumerate(row)]
+    return types, table
+
+
+def length_error(length, gis_length):
+    """abs(LENGTH - GIS_LENGTH) / LENGTH * 100, NaN where undefined."""
+    length = np.asarray(length, dtype=np.float64)
+    gis_length = np.asarray(gis_length, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        error = np.abs(length - gis_length) / length * 100
+    error[~np.isfinite(error)] = np.nan
+    return error
+
+
+def azimuth(x_start, y_start, x_end, y_end):
+    """Azimuth in degrees, clockwise from north, rounded like an integer field.
+
+    Degenerate lines (start equal to end) give NaN.
+    """
+    dx = np.asarray(x_end, dtype=np.float64) - x_start
+    dy = np.asarray(y_end, dtype=np.float64) - y_start
+    angle = np.degrees(np.arctan2(dx, dy)) % 360.0
+    angle = np.floor(angle + 0.5)  # zaokrąglenie jak przy zapisie do pola Integer
+    angle[(dx == 0) & (dy == 0)] = np.nan
+    return angle
+
+
+def direction(azim):
+    """8-way direction label of integer azimuths, 'err' outside the bins."""
+    azim = np.asarray(azim, dtype=np.float64)
+    labels = np.full(azim.shape, 'err', dtype=object)
+    labels[(azim > 337.5) | (azim < 22.5)] = 'N'
+    for low, high, label in DIRECTION_BOUNDS:
+        labels[(azim > low) & (azim < high)] = label
+    return labels
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Planning and writing of Res2DInv batch (*.bth) files.
+
+Profiles are packed into batches of at most MAX_PROFILES by estimated
+inversion cost (longest processing time first), so batches inverted in
+parallel finish at roughly the same time.
+"""
+
+import os
+import math
+import heapq
+
+from geophygis import datfile
+
+MAX_PROFILES = 40  # limit Res2DInv
+
+# względny koszt inwersji na pomiar dla typów układów z datfile.ALL_ARRAYS
+ARRAY_WEIGHTS = {1: 1.0, 2: 0.8, 3: 1.5, 4: 1.0, 5: 1.0, 6: 1.4, 7: 1.2, 8: 1.5}
+
+
+def estimate_cost(dat_header):
+    """Relative inversion cost: data points x model width x array weight."""
+    electrodes = (dat_header.max_electrode - dat_header.min_electrode) / max(dat_header.base_spacing, 1) + 1
+    return dat_header.datum_count * electrodes * ARRAY_WEIGHTS.get(dat_header.array_type, 1.0)
+
+
+def profile_cost(dat_path):
+    """Cost of one profile, falling back to the file size if it cannot be parsed."""
+    try:
+        return estimate_cost(datfile.read_dat_header(dat_path))
+    except (OSError, ValueError, IndexError):
+        try:
+            return float(os.path.getsize(dat_path))
+        except OSError:
+            return 1.0
+
+
+def plan_batches(costs, max_profiles=MAX_PROFILES, n_batches=None):
+    """Split ``costs`` ({path: cost}) into balanced batches.
+
+    Returns a list of ``(paths, total_cost)``; by default as many batches are
+    made as the profile limit requires.
+    """
+    if not costs:
+        return []
+    if n_batches is None:
+        n_batches = math.ceil(len(costs) / max_profiles)
+    n_batches = max(n_batches, math.ceil(len(costs) / max_profiles))
+    heap = [(0.0, i) for i in range(n_batches)]
+    batches = [[] for i in range(n_batches)]
+    totals = [0.0] * n_batches
+    for path in sorted(costs, key=lambda p: (-costs[p], p)):  # najdroższe profile najpierw
+        total, i = heapq.heappop(heap)
+        batches[i].append(path)
+        totals[i] = total + costs[path]
+        if len(batches[i]) < max_profiles:  # pełne batche nie przyjmują kolejnych profili
+            heapq.heappush(heap, (totals[i], i))
+    return [(sorted(batches[i]), totals[i]) for i in range(n_batches) if batches[i]]
+
+
+def write_batch(path, dat_files, ivp_path):
+    with open(path, 'w') as batch_file:
+        batch_file.write(str(len(dat_files)) + "\n")
+        batch_file.write("INVERSION PARAMETERS FILES USED\n")
+        for j, dat_file in enumerate(dat_files):
+            batch_file.write("DATA FILE " + str(j + 1) + "\n")
+            batch_file.write(str(dat_file) + "\n")
+            batch_file.write(str(dat_file).replace('.dat', '.inv') + "\n")
+            batch_file.write(ivp_path + "\n")
+
+
+def read_batch(path):
+    """(data file, result file, inversion parameters file) entries of a *.bth file."""
+    with open(path) as batch_file:
+        lines = [line.strip() for line in batch_file]
+    entries = []
+    for i, line in enumerate(lines):
+        if line.upper().startswith('DATA FILE') and i + 2 < len(lines):
+            entries.append((lines[i + 1], lines[i + 2], lines[i + 3] if i + 3 < len(lines) else ''))
+    return entries
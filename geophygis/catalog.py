@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Merged catalog of all campaign folders under an archive root.
+
+The tree is walked with os.scandir; every folder with *.dat files is one
+campaign, with its *.dat / *.2dm files paired by name. Folders are read in
+parallel, each through its own metadata index (see geophygis.metaindex),
+and catalog rows are written to disk in walk order as soon as a folder is
+done, so only a bounded window of folders is held in memory. Profile IDs
+repeated in several campaigns keep their ID; UID adds the folder relative
+to the root and DUPLICATE counts the earlier campaigns with the same ID.
+"""
+
+import os
+import sqlite3
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+from geophygis import scan, metaindex, survey
+
+CATALOG_HEADER = "UID;CAMPAIGN;FOLDER;DUPLICATE;" + survey.META_HEADER
+META_COLUMNS = survey.META_HEADER.count(';')  # kolumny wiersza metadanych bez ID
+SKIPPED_PREFIXES = ('.', 'TOPO_')  # pamięć podręczna i wyniki eksportu
+
+
+class FolderFeedback:
+    """Feedback of a folder read in a worker; errors are returned to the main process."""
+
+    def __init__(self):
+        self.errors = []
+
+    def isCanceled(self):
+        return False
+
+    def setProgress(self, progress):
+        pass
+
+    def pushInfo(self, text):
+        pass
+
+    def reportError(self, text, fatalError=False):
+        self.errors.append(text)
+
+
+def campaign_folders(root):
+    """Yield ``(folder, dat_names, paired_names)`` of every folder with *.dat files, sorted depth first."""
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        dat_names, dm_names, subfolders = [], set(), []
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith(SKIPPED_PREFIXES):
+                            subfolders.append(entry.path)
+                    elif entry.name.lower().endswith('.dat'):
+                        dat_names.append(entry.name[:-4])
+                    elif entry.name.lower().endswith('.2dm'):
+                        dm_names.add(entry.name[:-4].upper())
+        except OSError:
+            continue  # brak dostępu do folderu
+        stack.extend(sorted(subfolders, reverse=True))
+        if dat_names:
+            names = sorted(name.upper() for name in dat_names)
+            yield folder.replace('\\', '/'), names, [name for name in names if name in dm_names]
+
+
+def read_campaign(folder, names, paired, rebuild=False):
+    """Metadata rows {ID: row} of one folder and the errors met; profiles with a *.2dm get its fields."""
+    feedback = FolderFeedback()
+    paired_names = set(paired)
+    groups = [(True, paired), (False, [name for name in names if name not in paired_names])]
+    rows = {}
+    try:
+        with metaindex.MetadataIndex(folder, rebuild=rebuild) as index:
+            for flag2dm, group in groups:
+                cached, stale = index.lookup(group, flag2dm)
+                records = {}
+                parsed = scan.scan_profiles(folder, stale, flag2dm, feedback, records=records)
+                index.store(parsed, flag2dm, records)
+                cached.update(parsed)
+                rows.update(cached)
+            index.prune(names)
+    except sqlite3.Error:  # archiwum tylko do odczytu - bez indeksu
+        for flag2dm, group in groups:
+            rows.update(scan.scan_profiles(folder, group, flag2dm, feedback))
+    return {name: rows[name] for name in names if name in rows}, feedback.errors
+
+
+def catalog_line(uid, campaign, folder, duplicate, name, row):
+    values = list(row) + [''] * (META_COLUMNS - len(row))  # profile bez *.2dm
+    return ';'.join([uid, campaign, folder, str(duplicate), name] + [str(value) for value in values]) + '\n'
+
+
+def write_catalog(root, path, feedback, workers=1, use_processes=False, rebuild=False):
+    """Walk ``root`` and write the merged catalog to ``path``; returns (folders, profiles, duplicates)."""
+    root = os.path.abspath(root).replace('\\', '/')
+    if use_processes and workers > 1:
+        executor = scan._process_executor(workers)
+    else:
+        executor = ThreadPoolExecutor(max_workers=max(workers, 1))
+    window = collections.deque()
+    seen = collections.Counter()  # tylko ID - pamięć rośnie z liczbą profili, nie wierszy
+    n_folders = n_profiles = n_duplicates = 0
+    try:
+        with open(path, 'w') as catalog_file:
+            catalog_file.write(CATALOG_HEADER)
+
+            def write_next():
+                folder, future = window.popleft()
+                rows, errors = future.result()
+                for error in errors:
+                    feedback.reportError('{}: {}'.format(folder, error))
+                relative = os.path.relpath(folder, root).replace('\\', '/')
+                for name, row in rows.items():
+                    uid = name if relative == '.' else relative + '/' + name
+                    catalog_file.write(catalog_line(uid, os.path.basename(folder), relative, seen[name], name, row))
+                    seen[name] += 1
+                return len(rows), sum(1 for name in rows if seen[name] > 1)
+
+            for folder, names, paired in campaign_folders(root):
+                if feedback.isCanceled():
+                    break
+                window.append((folder, executor.submit(read_campaign, folder, names, paired, rebuild)))
+                n_folders += 1
+                if len(window) >= 4 * max(workers, 1):  # ograniczone okno folderów w pamięci
+                    profiles, duplicates = write_next()
+                    n_profiles += profiles
+                    n_duplicates += duplicates
+            while window and not feedback.isCanceled():
+                profiles, duplicates = write_next()
+                n_profiles += profiles
+                n_duplicates += duplicates
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    feedback.pushInfo('Catalog: {} profiles in {} folders, {} with an ID used in an earlier folder'.format(
+        n_profiles, n_folders, n_duplicates))
+    return n_folders, n_profiles, n_duplicates
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Command line interface running Import and Export on many survey folders.
+
+    python -m geophygis import SURVEY_DIR [SURVEY_DIR ...] --2dm
+    python -m geophygis import SURVEY_DIR --watch
+    python -m geophygis catalog ARCHIVE_ROOT --workers 8
+    python -m geophygis export SURVEY_DIR [...] --spacing 5 --window 5
+
+Surveys are processed in parallel worker processes (``--jobs``). Only the
+standard library is imported at start; NumPy and the processing modules
+are loaded by the command that needs them. Export reads the profile lines
+from a delimited text file with ID and WKT columns and the DEM (one
+raster or a folder of tiles, see geophygis.mosaic) through GDAL or the
+built-in GeoTIFF reader; both are expected in the same CRS.
+"""
+
+import os
+import sys
+import time
+import argparse
+import datetime
+
+FILTER_HELP = '0 - moving mean, 1 - median, 2 - Savitzky-Golay'
+SAMPLING_HELP = '0 - nearest, 1 - bilinear'
+
+
+class ConsoleFeedback:
+    """Processing feedback printing messages prefixed with the survey name."""
+
+    def __init__(self, prefix, quiet=False):
+        self.prefix = prefix
+        self.quiet = quiet
+
+    def isCanceled(self):
+        return False
+
+    def setProgress(self, progress):
+        pass
+
+    def pushInfo(self, text):
+        if not self.quiet:
+            print('[{}] {}'.format(self.prefix, text), flush=True)
+
+    def reportError(self, text, fatalError=False):
+        print('[{}] ERROR: {}'.format(self.prefix, text), file=sys.stderr, flush=True)
+
+
+def _time_stamp():
+    return "(" + datetime.datetime.now().strftime('%d%m_%H%M%S') + ")"
+
+
+def _new_folder(path):
+    """Create the folder ``path``, or ``path_2``, ``path_3``... when a run in the same second created it."""
+    candidate = path
+    number = 1
+    while True:
+        try:
+            os.mkdir(candidate)
+            return candidate
+        except FileExistsError:
+            number += 1
+            candidate = '{}_{}'.format(path, number)
+
+
+def _survey_path(template, parent_dir_path):
+    return template.format(dir=parent_dir_path, name=os.path.basename(parent_dir_path))
+
+
+def run_import(parent_dir_path, options):
+    """Metadata scan and ``_meta`` table of one survey; returns the profile count."""
+    from geophygis import survey, instrument
+
+    parent_dir = os.path.basename(parent_dir_path)
+    feedback = ConsoleFeedback(parent_dir, options['quiet'])
+    time_stamp = _time_stamp()
+    report_path = parent_dir_path + "/" + parent_dir + '_timing' + time_stamp
+    instruments = instrument.Instrumentation('import', feedback, report_path + '.prof' if options['profile'] else None).start()
+    with instruments.stage('scan') as stage:
+        names = survey.profile_names(parent_dir_path)
+        data, stage.count = survey.read_metadata(parent_dir_path, names, options['flag2dm'], feedback,
+                                                 workers=options['workers'], rebuild=options['rebuild_index'])
+    uri = parent_dir_path + "/" + parent_dir + '_meta' + time_stamp + '.csv'
+    with instruments.stage('meta csv', len(data)):
+        survey.write_meta_csv(uri, data)
+    feedback.pushInfo(uri)
+    if options['inv_dir']:
+        from geophygis import invfile
+
+        inv_dir_path = _survey_path(options['inv_dir'], parent_dir_path)
+        with instruments.stage('inversion results') as stage:
+            lines = survey.read_lines_csv(_survey_path(options['lines'], parent_dir_path))
+            placed = invfile.placed_models(inv_dir_path, lines, feedback, workers=options['workers'])
+            models_uri = inv_dir_path + "/" + parent_dir + '_models.csv'
+            invfile.write_models_csv(models_uri, placed)
+            stage.count = len(placed)
+        feedback.pushInfo(models_uri)
+    instruments.finish(report_path + '.json')
+    if options['watch']:
+        from geophygis import watch
+
+        live_uri = parent_dir_path + "/" + parent_dir + watch.META_LIVE
+
+        def on_update(data, changed, removed):
+            watch.write_live(live_uri, survey.write_meta_csv, data)
+
+        feedback.pushInfo(live_uri)
+        try:
+            watch.watch_survey(parent_dir_path, options['flag2dm'], feedback, on_update, workers=options['workers'],
+                               interval=options['interval'], settle=options['settle'])
+        except KeyboardInterrupt:
+            feedback.pushInfo('Watching stopped')
+    return len(data)
+
+
+def run_export(parent_dir_path, options):
+    """Topography export of one survey; returns the number of _topo.dat files."""
+    from geophygis import survey, instrument, geotiff, dem, topocache, datload, mosaic, session, gpkg
+
+    parent_dir = os.path.basename(parent_dir_path)
+    feedback = ConsoleFeedback(parent_dir, options['quiet'])
+    if options['incremental']:
+        topo_dir_path = parent_dir_path + "/" + survey.INCREMENTAL_DIR
+        os.makedirs(topo_dir_path, exist_ok=True)
+    else:
+        topo_dir_path = _new_folder(parent_dir_path + "/TOPO_" + _time_stamp())
+    report_path = topo_dir_path + '/' + parent_dir + '_timing'
+    instruments = instrument.Instrumentation('export', feedback, report_path + '.prof' if options['profile'] else None).start()
+    with instruments.stage('read inputs') as stage:
+        lines = survey.read_lines_csv(_survey_path(options['lines'], parent_dir_path))
+        dem_path = _survey_path(options['dem'], parent_dir_path)
+        nodata = [dem.DEFAULT_NODATA] + ([options['null_value']] if options['null_value'] is not None else [])
+        if mosaic.is_mosaic(dem_path):  # folder lub lista arkuszy
+            dem_reader = mosaic.DemMosaic(mosaic.tile_paths(dem_path), nodata, int(options['cache_mb'] * 1024 ** 2))
+            dem_source = dem_reader.key
+        else:
+            dem_reader = geotiff.open_dem(dem_path, nodata, int(options['cache_mb'] * 1024 ** 2))
+            dem_source = topocache.file_signature(dem_path)
+        stage.count = len(lines)
+    points_path = topo_dir_path + '/' + parent_dir + '_points.csv' if options['points'] else None
+    geopackage = None
+    if options['gpkg']:
+        srs = None
+        if options['epsg']:
+            srs = gpkg.srs_row(options['epsg'], 'EPSG:' + str(options['epsg']), 'EPSG:' + str(options['epsg']),
+                               'undefined')
+        geopackage = survey.open_geopackage(topo_dir_path + '/' + parent_dir + '.gpkg', srs,
+                                            spatial_index=not options['no_spatial_index'])
+    cache = topocache.TopoCache(topo_dir_path, options['rebuild_cache']) if options['incremental'] else None
+    curves = None
+    if options['fine']:
+        curves = topocache.TopoCache(parent_dir_path + "/" + datload.CACHE_DIR, options['rebuild_cache'],
+                                     topocache.CURVE_CACHE)
+    try:
+        written = survey.export_survey(parent_dir_path, lines, dem_reader, options['spacing'], topo_dir_path,
+                                       feedback, instruments, dem_sampling=options['sampling'],
+                                       null_value=options['null_value'], window=options['window'],
+                                       filter_type=options['filter_type'], ivp_path=options['ivp'] or '',
+                                       points_path=points_path, cache=cache,
+                                       dem_key=survey.dem_key(dem_source, nodata), curves=curves,
+                                       step=options['fine_step'], dat_electrodes=options['dat_electrodes'],
+                                       geopackage=geopackage,
+                                       ties_path=topo_dir_path + '/' + parent_dir + '_ties.csv' if options['ties'] else None,
+                                       survey_session=session.SurveySession.load(parent_dir_path),
+                                       electrode_range=options['electrode_range'])
+        if geopackage is not None:
+            with instruments.stage('geopackage index', geopackage.count(survey.GPKG_POINTS)):
+                geopackage.close()
+            geopackage = None
+    finally:
+        if geopackage is not None:
+            geopackage.connection.close()
+        for open_cache in (cache, curves):
+            if open_cache is not None:
+                open_cache.close()
+    if isinstance(dem_reader, mosaic.DemMosaic):
+        feedback.pushInfo("DEM mosaic: {} tiles indexed, {} opened, {} released".format(
+            len(dem_reader.paths), dem_reader.opened, dem_reader.released))
+    instruments.finish(report_path + '.json')
+    return len(written)
+
+
+def run_catalog(root_path, options):
+    """Merged catalog of all campaign folders under one archive root; returns the profile count."""
+    from geophygis import catalog
+
+    root_name = os.path.basename(root_path)
+    feedback = ConsoleFeedback(root_name, options['quiet'])
+    uri = root_path + "/" + root_name + '_catalog' + _time_stamp() + '.csv'
+    n_folders, n_profiles, n_duplicates = catalog.write_catalog(root_path, uri, feedback, workers=options['workers'],
+                                                                use_processes=options['processes'],
+                                                                rebuild=options['rebuild_index'])
+    feedback.pushInfo(uri)
+    return n_profiles
+
+
+COMMANDS = {'import': run_import, 'export': run_export, 'catalog': run_catalog}
+
+
+def run_survey(command, parent_dir_path, options):
+    """Worker entry point: ``(survey, result, error text, seconds)``."""
+    start = time.perf_counter()
+    try:
+        return parent_dir_path, COMMANDS[command](parent_dir_path, options), None, time.perf_counter() - start
+    except Exception as e:
+        return parent_dir_path, None, '{}: {}'.format(type(e).__name__, e), time.perf_counter() - start
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='geophygis', description='GeophyGIS Import and Export of many surveys.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('surveys', nargs='+', help='survey folders with the *.dat files')
+    common.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='surveys processed in parallel')
+    common.add_argument('--profile', action='store_true', help='write cProfile statistics of every survey')
+    common.add_argument('-q', '--quiet', action='store_true', help='print only errors and the summary')
+
+    import_parser = commands.add_parser('import', parents=[common], help='scan metadata and write the _meta table')
+    import_parser.add_argument('--2dm', dest='flag2dm', action='store_true', help='*.2dm files present')
+    import_parser.add_argument('--workers', type=int, default=1, help='file scanning threads per survey')
+    import_parser.add_argument('--rebuild-index', action='store_true', help='rebuild the metadata index')
+    import_parser.add_argument('--inv-dir',
+                               help='TOPO folder whose *.bth results (*.inv) are placed along the lines; {dir} and '
+                                    '{name} refer to the survey')
+    import_parser.add_argument('--lines', default='{dir}/{name}_lines.csv', help='profile lines for --inv-dir')
+    import_parser.add_argument('--watch', action='store_true',
+                               help='then follow the folder and keep {name}_meta_live.csv current (Ctrl+C to stop)')
+    import_parser.add_argument('--interval', type=float, default=2.0, help='watch polling interval in seconds')
+    import_parser.add_argument('--settle', type=float, default=1.0,
+                               help='seconds a new file must stay unchanged before it is read')
+
+    catalog_parser = commands.add_parser('catalog', parents=[common],
+                                         help='walk archive roots and write one catalog of all campaign folders')
+    catalog_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='folders read in parallel')
+    catalog_parser.add_argument('--processes', action='store_true', help='read folders in processes instead of threads')
+    catalog_parser.add_argument('--rebuild-index', action='store_true', help='rebuild the metadata index of every folder')
+
+    export_parser = commands.add_parser('export', parents=[common], help='sample the DEM and write _topo.dat files')
+    export_parser.add_argument('--spacing', type=float, required=True, help='electrode spacing')
+    export_parser.add_argument('--lines', default='{dir}/{name}_lines.csv',
+                               help='profile lines (ID and WKT columns); {dir} and {name} refer to the survey')
+    export_parser.add_argument('--dem', default='{dir}/{name}_dem.tif',
+                               help='DEM raster, folder of DEM tiles or a ; separated list; {dir} and {name} as above')
+    export_parser.add_argument('--sampling', type=int, default=0, choices=range(2), help=SAMPLING_HELP)
+    export_parser.add_argument('--cache-mb', type=float, default=256, help='DEM tile cache size per survey')
+    export_parser.add_argument('--null-value', type=int, help='additional DEM null value')
+    export_parser.add_argument('--window', type=int, default=0, help='topography filter window (0 - no filtering)')
+    export_parser.add_argument('--filter-type', type=int, default=0, choices=range(3), help=FILTER_HELP)
+    export_parser.add_argument('--ivp', help='*.ivp file for the batch (*.bth) files')
+    export_parser.add_argument('--points', action='store_true', help='also write the sampled points table')
+    export_parser.add_argument('--gpkg', action='store_true',
+                               help='write sampled points and profile lines to a GeoPackage in the TOPO folder')
+    export_parser.add_argument('--epsg', type=int, help='EPSG code of the lines and DEM for the GeoPackage')
+    export_parser.add_argument('--no-spatial-index', action='store_true', help='GeoPackage without R-tree indexes')
+    export_parser.add_argument('--ties', action='store_true',
+                               help='write the crossings of the profile lines (tie points) to {name}_ties.csv')
+    export_parser.add_argument('--incremental', action='store_true',
+                               help='write to TOPO_incremental and reuse profiles unchanged since the last run')
+    export_parser.add_argument('--fine', action='store_true',
+                               help='sample the DEM once along each line and interpolate any spacing from it')
+    export_parser.add_argument('--fine-step', type=float, default=0, help='fine sampling step (0 - DEM cell size)')
+    export_parser.add_argument('--dat-electrodes', action='store_true',
+                               help='place points at the electrodes of the *.dat file instead of every --spacing')
+    export_parser.add_argument('--electrode-range', action='store_true',
+                               help='sample every --spacing only between the first and last electrode of the *.dat')
+    export_parser.add_argument('--rebuild-cache', action='store_true', help='forget the incremental and fine caches')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    options = {key: value for key, value in vars(args).items() if key not in ('command', 'surveys', 'jobs')}
+    surveys = [os.path.abspath(path).replace('\\', '/') for path in args.surveys]
+    jobs = max(1, min(args.jobs, len(surveys)))
+    start = time.perf_counter()
+    if jobs == 1:
+        results = [run_survey(args.command, path, options) for path in surveys]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(run_survey, [args.command] * len(surveys), surveys, [options] * len(surveys)))
+    failed = 0
+    for path, result, error, seconds in results:
+        if error is None:
+            print('{}: {} profiles in {:.1f} s'.format(path, result, seconds))
+        else:
+            failed += 1
+            print('{}: FAILED after {:.1f} s - {}'.format(path, seconds, error), file=sys.stderr)
+    print('{} of {} surveys done in {:.1f} s with {} jobs'.format(len(surveys) - failed, len(surveys),
+                                                                time.perf_counter() - start, jobs))
+    return 1 if failed else 0
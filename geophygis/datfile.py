@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Reader for Res2DInv *.dat headers.
+
+Only the first column of the file is needed by Import (base spacing, array
+type and the electrode extent), so the data block is parsed in bulk with
+NumPy instead of splitting every line in Python.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+ALL_ARRAYS = ['Wenner-Alpha', 'Pole-Pole', 'Dipole-dipole', 'Wenner-Beta', 'Wenner-Gamma?',
+              'Pole-dipole', 'Schlumberger', 'Equatorial dipole-dipole']
+
+HEADER_LINES = 6  # nazwa, rozstaw, typ układu, liczba pomiarów, typ x, flaga IP
+FIELD_WIDTH = 12
+
+DatHeader = namedtuple('DatHeader', ['profile_end', 'base_spacing', 'array_type', 'array_name',
+                                     'min_electrode', 'max_electrode', 'datum_count'])
+
+
+
+def _first_value(line):
+    return int(float(line.split()[0]))
+
+
+def _parse_decimals(chars):
+    """Vectorised float parsing of plain decimal fields (one field per column).
+
+    Returns None if any field uses a notation other than [-]digits[.digits].
+    """
+    value = np.zeros(chars.shape[1])
+    decimals = np.zeros(chars.shape[1])
+    negative = np.zeros(chars.shape[1], bool)
+    seen_dot = np.zeros(chars.shape[1], bool)
+    for row in chars:
+        digit = (row >= 48) & (row <= 57)
+        dot = row == 46
+        minus = row == 45
+        if not np.all(digit | dot | minus | (row <= 32)):
+            return None
+        value = np.where(digit, value * 10 + (row - 48.0), value)
+        decimals += digit & seen_dot
+        seen_dot |= dot
+        negative |= minus
+    value /= 10.0 ** decimals  # dokładne dzielenie, wynik jak z float()
+    value[negative] *= -1
+    return value
+
+
+def _first_column(block):
+    """Return the first column of a whitespace separated block as floats.
+
+    Only a narrow window at the start of every line is looked at, so the
+    remaining columns are never tokenised.
+    """
+    block = block.rstrip()
+    if not block:
+        return np.empty(0)
+    buf = np.frombuffer(block + b' ' * FIELD_WIDTH, np.uint8)
+    starts = np.flatnonzero(buf[:len(block)] == 10) + 1
+    starts = np.concatenate(([0], starts))
+    chars = buf[starts + np.arange(FIELD_WIDTH)[:, None]]  # okno na początku każdej linii
+    space = chars <= 32
+    newline = chars == 10
+    started = np.zeros(starts.size, bool)
+    cut = np.zeros(starts.size, bool)
+    for j in range(FIELD_WIDTH):  # wszystko po pierwszym polu jest zerowane
+        cut |= (space[j] & started) | newline[j]
+        started |= ~cut & ~space[j]
+        space[j] = cut
+    if cut.all():
+        chars[space] = 0
+        chars = chars[:, started]  # pominięcie pustych linii
+        values = _parse_decimals(chars)
+        if values is not None:
+            return values
+        try:
+            return np.ascontiguousarray(chars.T).view('S%d' % FIELD_WIDTH).ravel().astype(np.float64)
+        except ValueError:
+            pass
+    # puste linie albo zbyt długie pola - wolniejsza ścieżka
+    return np.array([float(line.split()[0]) for line in block.split(b'\n') if line.strip()])
+
+
+def _find_terminator(raw, pos):
+    """Offset of the block of single-zero lines closing the data section."""
+    while True:
+        pos = raw.find(b'\n0', pos)
+        if pos == -1:
+            return len(raw)
+        end = raw.find(b'\n', pos + 1)
+        if not raw[pos + 2:end if end != -1 else len(raw)].strip():
+            return pos + 1
+        pos += 1
+
+
+def profile_length(array_type, base_spacing, min_electrode, max_electrode):
+    if array_type in [1, 3, 4, 5, 6, 7]:  # wyliczenie dlugosci profilu
+        return max_electrode + 3 * base_spacing - min_electrode
+    elif array_type == 2:
+        return max_electrode + base_spacing - min_electrode
+    return -999
+
+
+def parse_dat_bytes(raw):
+    """Parse the content of a Res2DInv *.dat file into a DatHeader."""
+    pos = 0
+    header = []
+    for i in range(HEADER_LINES):
+        end = raw.find(b'\n', pos)
+        if end == -1:
+            end = len(raw)
+        if i > 0:
+            header.append(_first_value(raw[pos:end]))
+        pos = end + 1
+    base_spacing = header[0]
+    array_type = header[1]
+
+    stop = _find_terminator(raw, pos)
+    block = raw[pos:stop]
+    electrodes = np.trunc(_first_column(block)).astype(np.int64)
+    nonzero = np.flatnonzero(electrodes)  # wycięcie zer kończących
+    electrodes = electrodes[:nonzero[-1] + 1] if nonzero.size else electrodes[:0]
+    if electrodes.size == 0:
+        raise ValueError('No datum points found')
+
+    min_electrode = int(electrodes.min())
+    max_electrode = int(electrodes.max())
+    return DatHeader(profile_length(array_type, base_spacing, min_electrode, max_electrode),
+                     base_spacing, array_type, ALL_ARRAYS[array_type - 1],
+                     min_electrode, max_electrode, int(electrodes.size))
+
+
+def read_dat_header(path):
+    with open(path, 'rb') as datfile:
+        return parse_dat_bytes(datfile.read())
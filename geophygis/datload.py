@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Loader of all measurement rows of Res2DInv *.dat files.
+
+Rows are returned as a NumPy structured array (DAT_DTYPE) and cached as
+a memory-mapped *.npy file in CACHE_DIR of the survey folder. The cache
+file name carries the size and modification time of the *.dat file, so a
+changed file is parsed again and its old cache file removed.
+"""
+
+import os
+import glob
+import tempfile
+import warnings
+from collections import namedtuple
+
+import numpy as np
+
+from geophygis import datfile
+
+CACHE_DIR = '.geophygis_cache'
+
+DAT_DTYPE = np.dtype([('x', '<f8'), ('a', '<f4'), ('n', '<f4'), ('rho', '<f4'), ('ip', '<f4')])
+
+# układy zapisywane jako x, a, rho - pozostałe jako x, a, n, rho
+THREE_COLUMN_ARRAYS = [1, 2, 4, 5]
+IP_HEADER_LINES = 3  # nazwa parametru IP, jednostka, czasy opóźnienia i całkowania
+
+DatData = namedtuple('DatData', ['name', 'base_spacing', 'array_type', 'x_location', 'ip_flag', 'rows'])
+
+
+def _header(raw):
+    """Header values, the offset of the first data row and the number of datums."""
+    pos = 0
+    lines = []
+    for i in range(datfile.HEADER_LINES):
+        end = raw.find(b'\n', pos)
+        if end == -1:
+            end = len(raw)
+        lines.append(raw[pos:end].decode(errors='replace').strip())
+        pos = end + 1
+    values = [float(line.replace(',', ' ').split()[0]) for line in lines[1:]]
+    ip_flag = int(values[4])
+    if ip_flag == 1:
+        for i in range(IP_HEADER_LINES):
+            end = raw.find(b'\n', pos)
+            pos = len(raw) if end == -1 else end + 1
+    return lines[0], values[0], int(values[1]), int(values[3]), ip_flag, pos, int(values[2])
+
+
+def parse_dat_rows(raw):
+    """Parse the content of a *.dat file into a DatData with all data rows."""
+    name, base_spacing, array_type, x_location, ip_flag, pos, n_datums = _header(raw)
+    block = raw[pos:datfile._find_terminator(raw, pos)].replace(b',', b' ')
+    first_line = block.lstrip().split(b'\n', 1)[0].split()
+    if not first_line:
+        raise ValueError('No datum points found')
+    n_columns = len(first_line)
+    rho_column = 2 if array_type in THREE_COLUMN_ARRAYS else 3
+    if n_columns <= rho_column:
+        raise ValueError('Expected at least {} columns for array type {}'.format(rho_column + 1, array_type))
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', DeprecationWarning)  # starszy NumPy ucina tekst tylko z ostrzeżeniem
+            values = np.fromstring(block.decode(errors='replace'), sep=' ')
+    except (ValueError, DeprecationWarning):
+        values = None
+    if values is None or values.size != n_datums * n_columns:  # niejednolite linie - wolniejsza ścieżka
+        values = np.array([[float(value) for value in line.split()[:n_columns]]
+                           for line in block.split(b'\n') if line.strip()], dtype=np.float64)
+    values = values.reshape(-1, n_columns)
+    rows = np.zeros(values.shape[0], dtype=DAT_DTYPE)
+    rows['x'] = values[:, 0]
+    rows['a'] = values[:, 1]
+    if array_type in THREE_COLUMN_ARRAYS:
+        rows['n'] = 1
+    else:
+        rows['n'] = values[:, 2]
+    rows['rho'] = values[:, rho_column]
+    rows['ip'] = values[:, rho_column + 1] if ip_flag == 1 and n_columns > rho_column + 1 else np.nan
+    return DatData(name, base_spacing, array_type, x_location, ip_flag, rows)
+
+
+def _cache_path(dat_path, stat, subfolder=''):
+    folder, file_name = os.path.split(dat_path)
+    stem = os.path.splitext(file_name)[0]
+    return os.path.join(folder, CACHE_DIR, subfolder, '{}-{}-{}.npy'.format(stem, stat.st_size, stat.st_mtime_ns))
+
+
+def load_dat(dat_path, cache=True):
+    """DatData of a *.dat file, with rows memory-mapped from the cache when valid."""
+    stat = os.stat(dat_path)
+    cache_path = _cache_path(dat_path, stat)
+    if cache and os.path.exists(cache_path):
+        with open(dat_path, 'rb') as dat:
+            header = _header(dat.read(4096))  # nagłówek jest krótki, reszta z pamięci podręcznej
+        try:
+            return DatData(*header[:5], np.load(cache_path, mmap_mode='r'))
+        except (OSError, ValueError):
+            pass  # uszkodzony plik pamięci podręcznej
+    with open(dat_path, 'rb') as dat:
+        data = parse_dat_rows(dat.read())
+    if cache:
+        _store(cache_path, data.rows)
+    return data
+
+
+def _store(cache_path, rows):
+    folder = os.path.dirname(cache_path)
+    stem = os.path.basename(cache_path).rsplit('-', 2)[0]
+    try:
+        os.makedirs(folder, exist_ok=True)
+        for old in glob.glob(os.path.join(glob.escape(folder), glob.escape(stem) + '-*-*.npy')):
+            if os.path.basename(old).rsplit('-', 2)[0] == stem:
+                os.remove(old)
+        handle, temp_path = tempfile.mkstemp(suffix='.npy', dir=folder)
+        with os.fdopen(handle, 'wb') as temp_file:
+            np.save(temp_file, rows)
+        os.replace(temp_path, cache_path)  # zapis atomowy przy równoległym skanowaniu
+    except OSError:
+        pass  # folder tylko do odczytu - bez pamięci podręcznej
+
+
+def qc_stats(rows):
+    """Datum count, rho min / median / max and the percentage of rho <= 0."""
+    rho = np.asarray(rows['rho'], dtype=np.float64)
+    if rho.size == 0:
+        return [0, None, None, None, None]
+    return [int(rho.size), round(float(rho.min()), 3), round(float(np.median(rho)), 3), round(float(rho.max()), 3),
+            round(float(np.count_nonzero(rho <= 0)) / rho.size * 100, 2)]
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Windowed DEM access with an LRU cache of raster tiles.
+
+The raster itself is read through a ``read_block(col, row, width, height)``
+callable returning a 2D float array, so the same reader works on top of a
+QGIS raster provider, GDAL or a plain NumPy array.
+"""
+
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+SAMPLING_METHODS = ['Nearest', 'Bilinear']
+DEFAULT_NODATA = -9999
+
+CacheStats = namedtuple('CacheStats', ['hits', 'misses', 'evictions', 'tiles', 'bytes', 'budget'])
+
+
+class DemReader:
+    """Sample a north-up raster at arbitrary coordinates, reading it tile by tile.
+
+    ``nodata`` is a list of values treated as missing in addition to NaN;
+    ``cache_bytes`` is the memory budget of the tile cache.
+    """
+
+    def __init__(self, read_block, width, height, x_min, y_max, x_res, y_res,
+                 nodata=(DEFAULT_NODATA,), tile_size=256, cache_bytes=256 * 1024 ** 2):
+        self.read_block = read_block
+        self.width = width
+        self.height = height
+        self.x_min = x_min
+        self.y_max = y_max
+        self.x_res = x_res
+        self.y_res = y_res
+        self.nodata = [value for value in nodata if value is not None]
+        self.tile_size = tile_size
+        self.cache_bytes = cache_bytes
+        self._tiles = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        return CacheStats(self.hits, self.misses, self.evictions, len(self._tiles), self._bytes, self.cache_bytes)
+
+    def clear(self):
+        self._tiles.clear()
+        self._bytes = 0
+
+    def _tile(self, tile_row, tile_col):
+        key = (tile_row, tile_col)
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+            self.hits += 1
+            return tile
+        self.misses += 1
+        row0 = tile_row * self.tile_size
+        col0 = tile_col * self.tile_size
+        height = min(self.tile_size, self.height - row0)
+        width = min(self.tile_size, self.width - col0)
+        tile = np.array(self.read_block(col0, row0, width, height), dtype=np.float64).reshape(height, width)
+        for value in self.nodata:
+            tile[tile == value] = np.nan
+        self._tiles[key] = tile
+        self._bytes += tile.nbytes
+        while self._bytes > self.cache_bytes and len(self._tiles) > 1:  # usuwanie najdawniej używanych
+            old_key, old_tile = self._tiles.popitem(last=False)
+            self._bytes -= old_tile.nbytes
+            self.evictions += 1
+        return tile
+
+    def cell_values(self, rows, cols):
+        """Values of the given cells, NaN outside the raster or where nodata."""
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        values = np.full(rows.shape, np.nan)
+        inside = (rows >= 0) & (rows < self.height) & (cols >= 0) & (cols < self.width)
+        if not inside.any():
+            return values
+        tile_ids = (rows[inside] // self.tile_size) * ((self.width - 1) // self.tile_size + 1) + cols[inside] // self.tile_size
+        index = np.flatnonzero(inside)
+        order = np.argsort(tile_ids, kind='stable')
+        tile_ids = tile_ids[order]
+        index = index[order]
+        bounds = np.flatnonzero(np.diff(tile_ids)) + 1
+        for group in np.split(np.arange(index.size), bounds):  # jeden odczyt na kafel
+            group_index = index[group]
+            r = rows[group_index]
+            c = cols[group_index]
+            tile = self._tile(int(r[0] // self.tile_size), int(c[0] // self.tile_size))
+            values[group_index] = tile[r % self.tile_size, c % self.tile_size]
+        return values
+
+    def sample(self, x, y, method=0):
+        """Sample at map coordinates; ``method`` indexes SAMPLING_METHODS."""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        col = (x - self.x_min) / self.x_res
+        row = (self.y_max - y) / self.y_res
+        if method == 1:
+            return self._bilinear(row, col)
+        with np.errstate(invalid='ignore'):
+            return self.cell_values(np.floor(np.nan_to_num(row, nan=-1)), np.floor(np.nan_to_num(col, nan=-1)))
+
+    def _bilinear(self, row, col):
+        with np.errstate(invalid='ignore'):
+            inside = (row >= 0) & (row < self.height) & (col >= 0) & (col < self.width)
+        row = np.clip(np.nan_to_num(row) - 0.5, 0, self.height - 1)  # względem środków komórek
+        col = np.clip(np.nan_to_num(col) - 0.5, 0, self.width - 1)
+        row0 = np.minimum(np.floor(row), max(self.height - 2, 0))
+        col0 = np.minimum(np.floor(col), max(self.width - 2, 0))
+        row1 = np.minimum(row0 + 1, self.height - 1)
+        col1 = np.minimum(col0 + 1, self.width - 1)
+        dr = row - row0
+        dc = col - col0
+        values = (self.cell_values(row0, col0) * (1 - dr) * (1 - dc) + self.cell_values(row0, col1) * (1 - dr) * dc
+                  + self.cell_values(row1, col0) * dr * (1 - dc) + self.cell_values(row1, col1) * dr * dc)
+        values[~inside] = np.nan
+        return values
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Smoothing filters for sampled topography profiles.
+
+All filters use centred windows of odd size. Near the ends of a profile the
+window shrinks symmetrically (3, 5, ... samples) so that every output sample
+is centred on its input sample; the first and last samples are kept.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+FILTER_TYPES = ['Moving mean', 'Median', 'Savitzky-Golay']
+
+
+def effective_window(window, n):
+    """Odd window size not larger than half of the profile length."""
+    window = int(window)
+    if window > n / 2:
+        window = int(n / 2)
+    if window % 2 == 0:
+        window += 1
+    return max(window, 1)
+
+
+def _half_widths(n, half):
+    index = np.arange(n)
+    return np.minimum(np.minimum(index, n - 1 - index), half)
+
+
+def moving_mean(values, window):
+    values = np.asarray(values, dtype=np.float64)
+    half = (window - 1) // 2
+    h = _half_widths(values.size, half)
+    index = np.arange(values.size)
+    cumulative = np.concatenate(([0.0], np.cumsum(values)))
+    return (cumulative[index + h + 1] - cumulative[index - h]) / (2 * h + 1)
+
+
+def _apply_windowed(values, window, reduce):
+    """Apply ``reduce`` to full windows at once and to shrunk windows at the ends."""
+    values = np.asarray(values, dtype=np.float64)
+    half = (window - 1) // 2
+    n = values.size
+    result = values.copy()
+    if half == 0 or n < 3:
+        return result
+    if n >= window:
+        result[half:n - half] = reduce(sliding_window_view(values, window), half)
+    for k in range(1, min(half, (n - 1) // 2 + 1)):  # krawędzie - okna 3, 5, ...
+        result[k] = reduce(values[None, :2 * k + 1], k)[0]
+        result[n - 1 - k] = reduce(values[None, n - 2 * k - 1:], k)[0]
+    return result
+
+
+def running_median(values, window):
+    return _apply_windowed(values, window, lambda windows, half: np.median(windows, axis=1))
+
+
+def savgol_coefficients(window, polyorder):
+    half = (window - 1) // 2
+    polyorder = min(polyorder, window - 1)
+    positions = np.arange(-half, half + 1, dtype=np.float64)
+    vandermonde = positions[:, None] ** np.arange(polyorder + 1)
+    return np.linalg.pinv(vandermonde)[0]  # wartość wielomianu w środku okna
+
+
+def savitzky_golay(values, window, polyorder=2):
+    return _apply_windowed(values, window,
+                           lambda windows, half: windows @ savgol_coefficients(2 * half + 1, polyorder))
+
+
+def smooth(values, window, filter_type=0):
+    """Filter one profile with the filter selected by index in FILTER_TYPES."""
+    if filter_type == 1:
+        return running_median(values, window)
+    if filter_type == 2:
+        return savitzky_golay(values, window)
+    return moving_mean(values, window)
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+DEM access outside QGIS.
+
+GDAL is used when it can be imported; otherwise a small built-in reader
+handles north-up, uncompressed single band GeoTIFFs (strips or tiles),
+which is what exports of elevation models usually are.
+"""
+
+import struct
+
+import numpy as np
+
+from geophygis import dem
+
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+TYPE_FORMATS = {1: 'B', 3: 'H', 4: 'I', 6: 'b', 8: 'h', 9: 'i', 11: 'f', 12: 'd'}
+SAMPLE_KINDS = {1: 'u', 2: 'i', 3: 'f'}
+
+
+class GeoTiff:
+    """Memory-mapped reader of an uncompressed single band GeoTIFF."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as tif:
+            head = tif.read(8)
+            if head[:2] not in (b'II', b'MM'):
+                raise ValueError('Not a TIFF file: ' + path)
+            self.order = '<' if head[:2] == b'II' else '>'
+            if struct.unpack(self.order + 'H', head[2:4])[0] != 42:
+                raise ValueError('BigTIFF is not supported without GDAL: ' + path)
+            ifd_offset = struct.unpack(self.order + 'I', head[4:8])[0]
+            tags = self._read_ifd(tif, ifd_offset)
+        if tags.get(259, [1])[0] != 1 or tags.get(277, [1])[0] != 1:
+            raise ValueError('Only uncompressed single band GeoTIFFs can be read without GDAL: ' + path)
+        if 33550 not in tags or 33922 not in tags:
+            raise ValueError('GeoTIFF without pixel scale and tie point: ' + path)
+        self.width = tags[256][0]
+        self.height = tags[257][0]
+        bits = tags.get(258, [8])[0]
+        self.dtype = np.dtype(self.order + SAMPLE_KINDS[tags.get(339, [1])[0]] + str(bits // 8))
+        scale_x, scale_y = tags[33550][:2]
+        i, j, k, x, y, z = tags[33922][:6]
+        self.x_res = scale_x
+        self.y_res = scale_y
+        self.x_min = x - i * scale_x
+        self.y_max = y + j * scale_y
+        nodata = tags.get(42113)
+        self.nodata = float(nodata.strip('\0 ')) if nodata and nodata.strip('\0 ') else None
+        if 324 in tags:  # kafle
+            self.block_width = tags[322][0]
+            self.block_height = tags[323][0]
+            self.offsets = tags[324]
+        else:  # pasy
+            self.block_width = self.width
+            self.block_height = tags.get(278, [self.height])[0]
+            self.offsets = tags[273]
+        self.blocks_across = -(-self.width // self.block_width)
+        self._data = np.memmap(path, dtype=np.uint8, mode='r')
+
+    def _read_ifd(self, tif, offset):
+        tif.seek(offset)
+        count = struct.unpack(self.order + 'H', tif.read(2))[0]
+        entries = [struct.unpack(self.order + 'HHI4s', tif.read(12)) for i in range(count)]
+        tags = {}
+        for code, kind, n, value in entries:
+            size = TYPE_SIZES.get(kind, 1) * n
+            if size > 4:
+                tif.seek(struct.unpack(self.order + 'I', value)[0])
+                value = tif.read(size)
+            if kind == 2:
+                tags[code] = value[:n].decode('ascii', 'replace')
+            elif kind in TYPE_FORMATS:
+                tags[code] = list(struct.unpack(self.order + str(n) + TYPE_FORMATS[kind], value[:size]))
+        return tags
+
+    def _block(self, index):
+        count = self.block_width * self.block_height
+        start = self.offsets[index]
+        data = self._data[start:start + count * self.dtype.itemsize]
+        if data.size < count * self.dtype.itemsize:  # ostatni pas bywa krótszy
+            rows = data.size // (self.block_width * self.dtype.itemsize)
+            return data[:rows * self.block_width * self.dtype.itemsize].view(self.dtype).reshape(rows, self.block_width)
+        return data.view(self.dtype).reshape(self.block_height, self.block_width)
+
+    def read_block(self, col0, row0, width, height):
+        """Raster window as a float64 array, the ``read_block`` of DemReader."""
+        out = np.empty((height, width), dtype=np.float64)
+        for block_row in range(row0 // self.block_height, (row0 + height - 1) // self.block_height + 1):
+            for block_col in range(col0 // self.block_width, (col0 + width - 1) // self.block_width + 1):
+                block = self._block(block_row * self.blocks_across + block_col)
+                top = block_row * self.block_height
+                left = block_col * self.block_width
+                r0, r1 = max(row0, top), min(row0 + height, top + block.shape[0])
+                c0, c1 = max(col0, left), min(col0 + width, left + block.shape[1])
+                out[r0 - row0:r1 - row0, c0 - col0:c1 - col0] = block[r0 - top:r1 - top, c0 - left:c1 - left]
+        return out
+
+
+def _gdal():
+    try:
+        from osgeo import gdal
+    except ImportError:
+        return None
+    return gdal
+
+
+def raster_extent(path):
+    """``(x_min, y_max, x_res, y_res, width, height)`` of a raster file."""
+    gdal = _gdal()
+    if gdal is not None:
+        dataset = gdal.Open(path)
+        if dataset is None:
+            raise ValueError('Could not open raster: ' + path)
+        x_min, x_res, x_skew, y_max, y_skew, y_res = dataset.GetGeoTransform()
+        return x_min, y_max, x_res, -y_res, dataset.RasterXSize, dataset.RasterYSize
+    tiff = GeoTiff(path)
+    return tiff.x_min, tiff.y_max, tiff.x_res, tiff.y_res, tiff.width, tiff.height
+
+
+def open_dem(path, nodata=(dem.DEFAULT_NODATA,), cache_bytes=256 * 1024 ** 2):
+    """DemReader over the first band of a raster file."""
+    nodata = list(nodata)
+    gdal = _gdal()
+    if gdal is not None:
+        dataset = gdal.Open(path)
+        if dataset is None:
+            raise ValueError('Could not open raster: ' + path)
+        band = dataset.GetRasterBand(1)
+        x_min, x_res, x_skew, y_max, y_skew, y_res = dataset.GetGeoTransform()
+        if x_skew or y_skew:
+            raise ValueError('Rotated rasters are not supported: ' + path)
+
+        def read_block(col0, row0, width, height):
+            return band.ReadAsArray(col0, row0, width, height)
+
+        reader = dem.DemReader(read_block, dataset.RasterXSize, dataset.RasterYSize, x_min, y_max, x_res, -y_res,
+                               nodata=nodata + [band.GetNoDataValue()], cache_bytes=cache_bytes)
+        reader.dataset = dataset  # zbiór danych musi żyć tak długo jak czytnik
+        return reader
+    tiff = GeoTiff(path)
+    return dem.DemReader(tiff.read_block, tiff.width, tiff.height, tiff.x_min, tiff.y_max, tiff.x_res, tiff.y_res,
+                         nodata=nodata + [tiff.nodata], cache_bytes=cache_bytes)
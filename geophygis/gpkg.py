@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Direct GeoPackage writer for large point and line tables.
+
+The file is written with the sqlite3 module in a single transaction,
+without going through a feature sink. Geometry blobs of all points of a
+profile are packed with NumPy at once, and the R-tree spatial indexes are
+built from the collected envelopes only when the writer is closed.
+"""
+
+import os
+import sqlite3
+
+import numpy as np
+
+APPLICATION_ID = 0x47504B47  # 'GPKG'
+USER_VERSION = 10200
+GEOMETRY_COLUMN = 'geom'
+
+WGS84_WKT = ('GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563]],PRIMEM["Greenwich",0],'
+             'UNIT["degree",0.0174532925199433],AUTHORITY["EPSG","4326"]]')
+
+_SCHEMA = ["""CREATE TABLE gpkg_spatial_ref_sys (srs_name TEXT NOT NULL, srs_id INTEGER PRIMARY KEY,
+    organization TEXT NOT NULL, organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL,
+    description TEXT)""",
+           """CREATE TABLE gpkg_contents (table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL,
+    identifier TEXT UNIQUE, description TEXT DEFAULT '',
+    last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')),
+    min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE,
+    srs_id INTEGER REFERENCES gpkg_spatial_ref_sys(srs_id))""",
+           """CREATE TABLE gpkg_geometry_columns (table_name TEXT NOT NULL, column_name TEXT NOT NULL,
+    geometry_type_name TEXT NOT NULL, srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL,
+    PRIMARY KEY (table_name, column_name), UNIQUE (table_name),
+    FOREIGN KEY (table_name) REFERENCES gpkg_contents(table_name),
+    FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys(srs_id))""",
+           """CREATE TABLE gpkg_extensions (table_name TEXT, column_name TEXT, extension_name TEXT NOT NULL,
+    definition TEXT NOT NULL, scope TEXT NOT NULL, UNIQUE (table_name, column_name, extension_name))"""]
+
+# wyzwalacze R-tree wg specyfikacji GeoPackage 1.2 (funkcje ST_* dostarcza GDAL/QGIS przy edycji)
+_RTREE_TRIGGERS = [
+    """CREATE TRIGGER "rtree_{t}_{c}_insert" AFTER INSERT ON "{t}"
+    WHEN (new."{c}" NOT NULL AND NOT ST_IsEmpty(NEW."{c}")) BEGIN
+    INSERT OR REPLACE INTO "rtree_{t}_{c}" VALUES (NEW."fid", ST_MinX(NEW."{c}"), ST_MaxX(NEW."{c}"),
+    ST_MinY(NEW."{c}"), ST_MaxY(NEW."{c}")); END""",
+    """CREATE TRIGGER "rtree_{t}_{c}_update1" AFTER UPDATE OF "{c}" ON "{t}"
+    WHEN OLD."fid" = NEW."fid" AND (NEW."{c}" NOTNULL AND NOT ST_IsEmpty(NEW."{c}")) BEGIN
+    INSERT OR REPLACE INTO "rtree_{t}_{c}" VALUES (NEW."fid", ST_MinX(NEW."{c}"), ST_MaxX(NEW."{c}"),
+    ST_MinY(NEW."{c}"), ST_MaxY(NEW."{c}")); END""",
+    """CREATE TRIGGER "rtree_{t}_{c}_update2" AFTER UPDATE OF "{c}" ON "{t}"
+    WHEN OLD."fid" = NEW."fid" AND (NEW."{c}" ISNULL OR ST_IsEmpty(NEW."{c}")) BEGIN
+    DELETE FROM "rtree_{t}_{c}" WHERE id = OLD."fid"; END""",
+    """CREATE TRIGGER "rtree_{t}_{c}_update3" AFTER UPDATE ON "{t}"
+    WHEN OLD."fid" != NEW."fid" AND (NEW."{c}" NOTNULL AND NOT ST_IsEmpty(NEW."{c}")) BEGIN
+    DELETE FROM "rtree_{t}_{c}" WHERE id = OLD."fid";
+    INSERT OR REPLACE INTO "rtree_{t}_{c}" VALUES (NEW."fid", ST_MinX(NEW."{c}"), ST_MaxX(NEW."{c}"),
+    ST_MinY(NEW."{c}"), ST_MaxY(NEW."{c}")); END""",
+    """CREATE TRIGGER "rtree_{t}_{c}_update4" AFTER UPDATE ON "{t}"
+    WHEN OLD."fid" != NEW."fid" AND (NEW."{c}" ISNULL OR ST_IsEmpty(NEW."{c}")) BEGIN
+    DELETE FROM "rtree_{t}_{c}" WHERE id IN (OLD."fid", NEW."fid"); END""",
+    """CREATE TRIGGER "rtree_{t}_{c}_delete" AFTER DELETE ON "{t}"
+    WHEN old."{c}" NOT NULL BEGIN
+    DELETE FROM "rtree_{t}_{c}" WHERE id = OLD."fid"; END"""]
+
+# nagłówek GeoPackage bez obwiedni + WKB Point, little endian
+_BLOB_HEADER = [('magic', 'S2'), ('version', 'u1'), ('flags', 'u1'), ('srs_id', '<i4')]
+POINT_BLOB = np.dtype([('magic', 'S2'), ('version', 'u1'), ('flags', 'u1'), ('srs_id', '<i4'),
+                       ('order', 'u1'), ('type', '<u4'), ('x', '<f8'), ('y', '<f8')])
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def table_fields(fields):
+    """Attribute columns [(name, SQL type)] of ``fields``; names taken by the fid and geometry columns get '_1'."""
+    return [(name + '_1' if name.lower() in ('fid', GEOMETRY_COLUMN) else name, sql_type) for name, sql_type in fields]
+
+
+def column_value(value, to_text=str):
+    """SQLite value of an attribute: None, a number or a string (other values through ``to_text``)."""
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    return to_text(value)
+
+
+def srs_row(srid, name, authid, definition):
+    """``srs`` of GeoPackageWriter for a CRS with an authority id such as 'EPSG:2180'."""
+    return (srid, name, authid.split(':')[0] or 'NONE', srid, definition)
+
+
+def point_blobs(x, y, srs_id):
+    """GeoPackage geometry blobs of points."""
+    x = np.asarray(x, dtype=np.float64)
+    records = np.zeros(x.size, dtype=POINT_BLOB)
+    records['magic'] = b'GP'
+    records['flags'] = 1  # little endian, bez obwiedni
+    records['srs_id'] = srs_id
+    records['order'] = 1
+    records['type'] = 1
+    records['x'] = x
+    records['y'] = y
+    data = records.tobytes()
+    size = POINT_BLOB.itemsize
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def line_blob(x, y, srs_id):
+    """GeoPackage geometry blob of a line string with its envelope."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    header = np.array([0], dtype=[('magic', 'S2'), ('version', 'u1'), ('flags', 'u1'), ('srs_id', '<i4'),
+                                  ('envelope', '<f8', 4), ('order', 'u1'), ('type', '<u4'), ('count', '<u4')])
+    header['magic'] = b'GP'
+    header['flags'] = 3  # little endian, obwiednia minx, maxx, miny, maxy
+    header['srs_id'] = srs_id
+    header['envelope'] = [np.nanmin(x), np.nanmax(x), np.nanmin(y), np.nanmax(y)]
+    header['order'] = 1
+    header['type'] = 2
+    header['count'] = x.size
+    return header.tobytes() + np.column_stack([x, y]).astype('<f8').tobytes()
+
+
+def wkb_blob(wkb, envelope, srs_id):
+    """GeoPackage geometry blob of a WKB geometry; ``envelope`` is (minx, maxx, miny, maxy) or None."""
+    if envelope is None:
+        return np.array([(b'GP', 0, 1, srs_id)], dtype=_BLOB_HEADER).tobytes() + bytes(wkb)
+    header = np.array([(b'GP', 0, 3, srs_id, envelope)], dtype=_BLOB_HEADER + [('envelope', '<f8', 4)])
+    return header.tobytes() + bytes(wkb)
+
+
+def replace_features(path, table, key_field, keys, blobs, rows):
+    """Replace the features whose ``key_field`` is in ``keys`` in one transaction.
+
+    Used for live layers written without spatial indexes: the R-tree
+    triggers need the ST_* functions, which only GDAL and QGIS provide.
+    """
+    connection = sqlite3.connect(path, timeout=30)  # QGIS może właśnie czytać warstwę
+    try:
+        with connection:
+            n_columns = len(connection.execute('SELECT * FROM {} LIMIT 0'.format(_quote(table))).description)
+            connection.executemany('DELETE FROM {} WHERE {} = ?'.format(_quote(table), _quote(key_field)),
+                                   [(key,) for key in keys])
+            connection.executemany('INSERT INTO {} VALUES (NULL, {})'.format(_quote(table),
+                                                                            ', '.join(['?'] * (n_columns - 1))),
+                                   ([blob] + list(row) for blob, row in zip(blobs, rows)))
+            connection.execute("UPDATE gpkg_contents SET last_change = strftime('%Y-%m-%dT%H:%M:%fZ','now') "
+                               "WHERE table_name = ?", (table,))
+    finally:
+        connection.close()
+
+
+class GeoPackageWriter:
+    """New GeoPackage with point and line tables written in one transaction.
+
+    ``srs`` is ``(srs_id, name, organization, organization_id, wkt)``;
+    without it the tables use the undefined cartesian SRS (-1). R-tree
+    inserts cost most of the writing time of large point tables, so the
+    indexes can be left out (``spatial_index``) and created later in QGIS.
+    """
+
+    def __init__(self, path, srs=None, spatial_index=True):
+        if os.path.exists(path):
+            os.remove(path)
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA application_id = {}".format(APPLICATION_ID))
+        self.connection.execute("PRAGMA user_version = {}".format(USER_VERSION))
+        self.connection.execute("PRAGMA journal_mode = MEMORY")  # nowy plik - bez dziennika na dysku
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute("PRAGMA cache_size = -262144")  # 256 MB stron dla budowy R-tree
+        for statement in _SCHEMA:
+            self.connection.execute(statement)
+        srs_rows = [('Undefined cartesian SRS', -1, 'NONE', -1, 'undefined', None),
+                    ('Undefined geographic SRS', 0, 'NONE', 0, 'undefined', None),
+                    ('WGS 84 geodetic', 4326, 'EPSG', 4326, WGS84_WKT, None)]
+        self.srs_id = -1
+        if srs is not None:
+            self.srs_id = srs[0]
+            if self.srs_id not in (-1, 0, 4326):
+                srs_rows.append((srs[1], srs[0], srs[2], srs[3], srs[4], None))
+        self.connection.executemany("INSERT INTO gpkg_spatial_ref_sys VALUES (?,?,?,?,?,?)", srs_rows)
+        self.spatial_index = spatial_index
+        self._tables = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+        else:
+            self.connection.close()
+
+    def create_table(self, table, fields, geometry_type):
+        """Feature table with ``fields`` [(name, SQL type)] and a POINT, LINESTRING or other geometry."""
+        columns = ', '.join(_quote(name) + ' ' + sql_type for name, sql_type in fields)
+        self.connection.execute('CREATE TABLE {} (fid INTEGER PRIMARY KEY AUTOINCREMENT, {} {}, {})'.format(
+            _quote(table), GEOMETRY_COLUMN, geometry_type, columns))
+        self.connection.execute("INSERT INTO gpkg_contents (table_name, data_type, identifier, srs_id) "
+                                "VALUES (?, 'features', ?, ?)", (table, table, self.srs_id))
+        self.connection.execute("INSERT INTO gpkg_geometry_columns VALUES (?,?,?,?,0,0)",
+                                (table, GEOMETRY_COLUMN, geometry_type, self.srs_id))
+        self._tables[table] = {'insert': 'INSERT INTO {} VALUES (NULL, {})'.format(
+            _quote(table), ', '.join(['?'] * (len(fields) + 1))), 'envelopes': [], 'count': 0}
+
+    def _add(self, table, blobs, rows, envelopes):
+        info = self._tables[table]
+        first = info['count'] + 1  # fid nadawane kolejno od 1 w jednej transakcji
+        self.connection.executemany(info['insert'], ([blob] + list(row) for blob, row in zip(blobs, rows)))
+        ids = np.arange(first, first + len(blobs), dtype=np.float64)
+        info['envelopes'].append(np.column_stack([ids, envelopes]))
+        info['count'] += len(blobs)
+
+    def add_geometries(self, table, blobs, envelopes, rows):
+        """Geometry ``blobs`` (see wkb_blob) with their (minx, maxx, miny, maxy) ``envelopes``."""
+        self._add(table, blobs, rows, np.asarray(envelopes, dtype=np.float64).reshape(-1, 4))
+
+    def add_points(self, table, x, y, rows):
+        """Points with attribute ``rows`` (sequences in field order)."""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        self._add(table, point_blobs(x, y, self.srs_id), rows, np.column_stack([x, x, y, y]))
+
+    def add_line(self, table, x, y, row):
+        """One line string with its attribute ``row``."""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        self._add(table, [line_blob(x, y, self.srs_id)], [row],
+                  np.array([[np.nanmin(x), np.nanmax(x), np.nanmin(y), np.nanmax(y)]]))
+
+    def count(self, table):
+        """Number of features added to ``table``."""
+        return self._tables[table]['count']
+
+    def close(self):
+        """Write extents and spatial indexes, commit and close the file."""
+        for table, info in self._tables.items():
+            envelopes = np.concatenate(info['envelopes']) if info['envelopes'] else np.empty((0, 5))
+            envelopes = envelopes[~np.isnan(envelopes).any(axis=1)]  # puste geometrie poza indeksem i zasięgiem
+            if self.spatial_index:
+                rtree = 'rtree_{}_{}'.format(table, GEOMETRY_COLUMN)
+                self.connection.execute('CREATE VIRTUAL TABLE {} USING rtree(id, minx, maxx, miny, maxy)'.format(
+                    _quote(rtree)))
+                self.connection.executemany('INSERT INTO {} VALUES (?,?,?,?,?)'.format(_quote(rtree)),
+                                            envelopes.tolist())  # indeks budowany raz, po wszystkich wierszach
+                for trigger in _RTREE_TRIGGERS:
+                    self.connection.execute(trigger.format(t=table, c=GEOMETRY_COLUMN))
+                self.connection.execute("INSERT INTO gpkg_extensions VALUES (?,?,'gpkg_rtree_index',"
+                                        "'http://www.geopackage.org/spec120/#extension_rtree','write-only')",
+                                        (table, GEOMETRY_COLUMN))
+            if envelopes.size:
+                self.connection.execute("UPDATE gpkg_contents SET min_x = ?, max_x = ?, min_y = ?, max_y = ? "
+                                        "WHERE table_name = ?",
+                                        (float(envelopes[:, 1].min()), float(envelopes[:, 2].max()),
+                                         float(envelopes[:, 3].min()), float(envelopes[:, 4].max()), table))
+        self.connection.commit()
+        self.connection.close()
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Per-stage timing and memory instrumentation of the processing scripts.
+
+Each stage records wall time, CPU time, the peak RSS of the process and
+a feature/row count; the stages are logged through the processing
+feedback and written as a JSON report next to the outputs.
+"""
+
+import os
+import sys
+import json
+import time
+import cProfile
+import datetime
+from contextlib import contextmanager
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes (0 if unknown)."""
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+        return 0
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # Linux podaje kB
+
+
+class Stage:
+    """Measurements of one stage; ``count`` is set by the instrumented code."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = None
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_rss = 0
+        self.rss_growth = 0
+
+    def as_dict(self):
+        return {'name': self.name, 'count': self.count, 'wall': round(self.wall, 4), 'cpu': round(self.cpu, 4),
+                'peak_rss_mb': round(self.peak_rss / 1024 ** 2, 1), 'rss_growth_mb': round(self.rss_growth / 1024 ** 2, 1)}
+
+
+class Instrumentation:
+    """Collects stages of one algorithm run.
+
+    With ``profile_path`` the whole run is profiled with cProfile between
+    ``start`` and ``finish`` and the statistics are dumped to that file.
+    """
+
+    def __init__(self, algorithm, feedback, profile_path=None):
+        self.algorithm = algorithm
+        self.feedback = feedback
+        self.stages = []
+        self.profile_path = profile_path
+        self._profiler = None
+        self._start_wall = None
+        self._start_cpu = None
+        self.started = None
+
+    def start(self):
+        self.started = datetime.datetime.now()
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        if self.profile_path:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self
+
+    @contextmanager
+    def stage(self, name, count=None):
+        """Context manager measuring one stage; yields its Stage record."""
+        record = Stage(name)
+        record.count = count
+        rss_before = peak_rss()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield record
+        except BaseException:
+            self._stop_profiler()  # profiler nie może zostać włączony w procesie QGIS
+            raise
+        finally:
+            record.wall = time.perf_counter() - wall
+            record.cpu = time.process_time() - cpu
+            record.peak_rss = peak_rss()
+            record.rss_growth = record.peak_rss - rss_before
+            self.stages.append(record)
+            self.feedback.pushInfo(self.format(record))
+
+    def format(self, record):
+        text = "[{}] {:.2f} s wall, {:.2f} s CPU, peak RSS {:.0f} MB".format(
+            record.name, record.wall, record.cpu, record.peak_rss / 1024 ** 2)
+        if record.count is not None:
+            text += ", {} items".format(record.count)
+        return text
+
+    def report(self):
+        total_wall = time.perf_counter() - self._start_wall if self._start_wall is not None else None
+        total_cpu = time.process_time() - self._start_cpu if self._start_cpu is not None else None
+        return {'algorithm': self.algorithm,
+                'started': self.started.isoformat(timespec='seconds') if self.started else None,
+                'total_wall': None if total_wall is None else round(total_wall, 4),
+                'total_cpu': None if total_cpu is None else round(total_cpu, 4),
+                'peak_rss_mb': round(peak_rss() / 1024 ** 2, 1),
+                'stages': [record.as_dict() for record in self.stages]}
+
+    def _stop_profiler(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.profile_path)
+            self.feedback.pushInfo("cProfile statistics: " + self.profile_path)
+            self._profiler = None
+
+    def finish(self, report_path):
+        """Stop profiling, write the JSON report and log the totals."""
+        self._stop_profiler()
+        report = self.report()
+        with open(report_path, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+        if report['total_wall'] is not None:
+            self.feedback.pushInfo("Total {:.2f} s wall, {:.2f} s CPU, peak RSS {:.0f} MB; report: {}".format(
+                report['total_wall'], report['total_cpu'], report['peak_rss_mb'], os.path.basename(report_path)))
+        return report
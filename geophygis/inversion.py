@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Scheduler running Res2DInv batch (*.bth) inversions as parallel processes.
+
+The executable is any command (a path or an argument list), so the
+scheduler can be exercised with a stand-in script instead of Res2DInv.
+"""
+
+import os
+import time
+import tempfile
+import subprocess
+from collections import namedtuple
+
+DEFAULT_RES2DINV = 'D:\\Dokumenty\\Obowiazki\\GeoVolt\\Res2DInv'
+POLL_INTERVAL = 0.1
+
+InversionJob = namedtuple('InversionJob', ['bth_path', 'status', 'returncode', 'duration', 'stdout', 'stderr'])
+
+
+def _read_output(file):
+    file.seek(0)
+    return file.read().decode(errors='replace')
+
+
+class _Running:
+    def __init__(self, command, bth_path):
+        self.bth_path = bth_path
+        self.stdout = tempfile.TemporaryFile()
+        self.stderr = tempfile.TemporaryFile()
+        self.start = time.monotonic()
+        self.process = subprocess.Popen(command + [bth_path], stdout=self.stdout, stderr=self.stderr,
+                                        cwd=os.path.dirname(bth_path) or None)
+
+    def finish(self, status):
+        duration = time.monotonic() - self.start
+        if self.process.poll() is None:
+            self.process.kill()
+        returncode = self.process.wait()
+        job = InversionJob(self.bth_path, status, returncode, duration,
+                           _read_output(self.stdout), _read_output(self.stderr))
+        self.stdout.close()
+        self.stderr.close()
+        return job
+
+
+def run_inversions(executable, bth_files, feedback, workers=1, timeout=None):
+    """Invert ``bth_files`` with at most ``workers`` processes at a time.
+
+    Jobs running longer than ``timeout`` seconds are killed. A canceled
+    ``feedback`` kills the running jobs and skips the queued ones. Returns
+    an InversionJob per batch file in input order; status is one of 'ok',
+    'failed', 'timeout', 'canceled' or 'error' (could not be started).
+    """
+    command = [executable] if isinstance(executable, str) else list(executable)
+    queue = list(bth_files)
+    results = {}
+    running = []
+    total = max(len(queue), 1)
+    while queue or running:
+        if feedback.isCanceled():
+            for job in running:
+                results[job.bth_path] = job.finish('canceled')
+            running = []
+            for bth_path in queue:
+                results[bth_path] = InversionJob(bth_path, 'canceled', None, 0.0, '', '')
+            break
+        while queue and len(running) < max(workers, 1):  # uruchomienie kolejnych zadań
+            bth_path = queue.pop(0)
+            try:
+                running.append(_Running(command, bth_path))
+                feedback.pushInfo("Inversion started: " + bth_path)
+            except OSError as e:
+                results[bth_path] = InversionJob(bth_path, 'error', None, 0.0, '', str(e))
+                feedback.reportError("Could not start inversion of {}: {}".format(bth_path, e))
+        still_running = []
+        for job in running:
+            if job.process.poll() is not None:
+                finished = job.finish('ok' if job.process.returncode == 0 else 'failed')
+            elif timeout and time.monotonic() - job.start > timeout:
+                finished = job.finish('timeout')
+            else:
+                still_running.append(job)
+                continue
+            results[job.bth_path] = finished
+            feedback.pushInfo("Inversion {}: {} ({:.1f} s)".format(finished.status, job.bth_path, finished.duration))
+            if finished.status != 'ok' and finished.stderr:
+                feedback.reportError(finished.stderr.strip())
+        running = still_running
+        feedback.setProgress(100 * len(results) / total)
+        if running:
+            time.sleep(POLL_INTERVAL)
+    return [results[bth_path] for bth_path in bth_files if bth_path in results]
+
+
+def summary(jobs):
+    """Short text summary of job statuses and durations."""
+    if not jobs:
+        return "No inversions run"
+    durations = [job.duration for job in jobs if job.status != 'canceled']
+    counts = {}
+    for job in jobs:
+        counts[job.status] = counts.get(job.status, 0) + 1
+    text = "Inversions: " + ", ".join("{} {}".format(n, status) for status, n in sorted(counts.items()))
+    if durations:
+        text += "; duration min {:.1f} s, mean {:.1f} s, max {:.1f} s, total {:.1f} s".format(
+            min(durations), sum(durations) / len(durations), max(durations), sum(durations))
+    return text
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Streaming reader of Res2DInv inversion results (*.inv).
+
+A *.inv file gives the model geometry once, in its header, and then one
+list of block resistivities per iteration. The header sections are found
+by their labels: the number of layers, the number of blocks in each layer,
+the layer thicknesses and the x-locations of the block centres (layer by
+layer). Each iteration starts with a line 'Iteration <n> ...' (optionally
+with the RMS error) and lists the resistivities of all blocks in the same
+layer-by-layer order; numbers may be wrapped over any number of lines.
+The resistivities of the last iteration are paired with the header
+geometry, a block lying in the middle of its layer. tests/data/model.inv
+is a sample of the format.
+
+The file is read line by line only to find where the iteration sections
+start; then only the header and the values of the last one are parsed
+into NumPy arrays, so files with many iterations are never held in
+memory. Blocks are placed along the profile line with the chainage /
+elevation curve Export wrote to the collective *.top file.
+"""
+
+import os
+import re
+import glob
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
+
+from geophygis import batches, sampling
+
+ITERATION_MARKER = re.compile(rb'\s*iteration\s+\d+', re.IGNORECASE)  # 'Iteration 5', nie 'Iterations'
+MODEL_HEADER = "ID;ITERATION;RMS;CHAINAGE;DEPTH;ELEVATION;RHO;x;y\n"
+MODEL_FIELDS = [('ID', 'TEXT'), ('ITERATION', 'INTEGER'), ('RMS', 'REAL'), ('CHAINAGE', 'REAL'),
+                ('DEPTH', 'REAL'), ('ELEVATION', 'REAL'), ('RHO', 'REAL')]
+TOPO_SUFFIX = '_topo'
+
+InvModel = namedtuple('InvModel', ['name', 'iteration', 'rms', 'chainage', 'depth', 'rho'])
+ModelPoints = namedtuple('ModelPoints', ['model', 'x', 'y', 'elevation'])
+
+_NUMBER = re.compile(rb'[-+]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?')
+
+
+def iteration_offsets(path):
+    """Byte offsets and marker lines of the iteration sections, found in one pass over the file."""
+    offsets = []
+    pos = 0
+    with open(path, 'rb') as inv:
+        for line in inv:  # czytanie buforowane linia po linii - stała pamięć
+            if ITERATION_MARKER.match(line):
+                offsets.append((pos, line))
+            pos += len(line)
+    return offsets
+
+
+def _marker_values(line):
+    """Iteration number and RMS error of a marker line ('Iteration 5  RMS error = 3.2%')."""
+    numbers = _NUMBER.findall(line)
+    iteration = int(float(numbers[0])) if numbers else 0
+    rms = float(numbers[1]) if len(numbers) > 1 else None
+    return iteration, rms
+
+
+def _sections(lines):
+    """Numbers following each label line of the header {label: [values]}."""
+    sections = {}
+    values = None
+    for line in lines:
+        numbers = _NUMBER.findall(line)
+        if re.search(rb'[a-df-z]', line, re.IGNORECASE):  # linia z opisem - nowa sekcja
+            values = sections.setdefault(line.strip().lower().decode(errors='replace'), [])
+        elif values is not None:
+            values.extend(float(number) for number in numbers)
+    return sections
+
+
+def _section(sections, *keywords):
+    for label, values in sections.items():
+        if all(keyword in label for keyword in keywords) and values:
+            return values
+    raise ValueError('no "{}" section in the *.inv header'.format(' '.join(keywords)))
+
+
+def block_geometry(header):
+    """Chainage and depth of the block centres, layer by layer, from the header lines of a *.inv file."""
+    sections = _sections(header)
+    n_layers = int(_section(sections, 'number of layers')[0])
+    blocks = [int(count) for count in _section(sections, 'number of blocks')]
+    if len(blocks) == 1:
+        blocks *= n_layers  # ta sama liczba bloków w każdej warstwie
+    thickness = np.array(_section(sections, 'thickness'))
+    x = np.array(_section(sections, 'x-location'))
+    if len(blocks) != n_layers or thickness.size != n_layers or x.size != sum(blocks):
+        raise ValueError('inconsistent block geometry: {} layers, {} block counts, {} thicknesses, {} x-locations'
+                         .format(n_layers, len(blocks), thickness.size, x.size))
+    bottom = np.cumsum(thickness)
+    return x, np.repeat(bottom - thickness / 2, blocks)
+
+
+def read_final_model(path):
+    """InvModel of the last iteration of a *.inv file, None without any iteration.
+
+    Raises ValueError when the header has no block geometry or the last
+    iteration lists fewer resistivities than there are blocks.
+    """
+    offsets = iteration_offsets(path)
+    if not offsets:
+        return None
+    offset, marker = offsets[-1]
+    iteration, rms = _marker_values(marker)
+    with open(path, 'rb') as inv:
+        chainage, depth = block_geometry(inv.read(offsets[0][0]).split(b'\n'))
+        inv.seek(offset + len(marker))
+        values = []
+        for line in inv:  # tylko wartości ostatniej iteracji
+            if not re.search(rb'[a-df-z]', line, re.IGNORECASE):  # bez linii z opisem (np. 'RMS error')
+                values.extend(_NUMBER.findall(line.replace(b',', b' ')))
+            if len(values) >= chainage.size:
+                break
+    if len(values) < chainage.size:
+        raise ValueError('{} resistivities for {} blocks after "{}"'.format(
+            len(values), chainage.size, marker.strip().decode(errors='replace')))
+    rho = np.array(values[:chainage.size], dtype=np.float64)
+    name = os.path.splitext(os.path.basename(path))[0]
+    if name.endswith(TOPO_SUFFIX):
+        name = name[:-len(TOPO_SUFFIX)]
+    return InvModel(name, iteration, rms, chainage, depth, rho)
+
+
+def read_top(path):
+    """Chainage / elevation curves {ID: (distance, elevation)} of a collective *.top file."""
+    curves = {}
+    name = None
+    rows = []
+    with open(path) as top:
+        for line in top:
+            if line.startswith('TOPO of:'):
+                name, rows = line[len('TOPO of:'):].strip(), []
+            elif line.startswith('###'):
+                if name is not None:
+                    values = np.array([row.split()[:2] for row in rows], dtype=np.float64).reshape(-1, 2)
+                    curves[name] = (values[:, 0], values[:, 1])
+                name = None
+            elif name is not None and line.strip():
+                rows.append(line)
+    return curves
+
+
+def inv_paths(topo_dir_path):
+    """Existing *.inv files named in the *.bth files of a TOPO folder."""
+    paths = []
+    for bth_path in sorted(glob.glob(topo_dir_path + "/*.bth")):
+        for dat_path, inv_path, ivp_path in batches.read_batch(bth_path):
+            if not os.path.exists(inv_path):  # folder przeniesiony po eksporcie - plik obok *.bth
+                inv_path = os.path.join(topo_dir_path, os.path.basename(inv_path.replace('\\', '/')))
+            if os.path.exists(inv_path) and inv_path not in paths:
+                paths.append(inv_path)
+    return paths
+
+
+def place_model(model, parts, topography=None):
+    """ModelPoints of the blocks along a line; elevation is the topography minus the depth."""
+    x, y = sampling.points_at(parts, model.chainage)
+    if topography is not None and len(topography[0]):
+        elevation = np.interp(model.chainage, topography[0], topography[1]) - model.depth
+    else:
+        elevation = -model.depth  # bez topografii - głębokość od zera
+    return ModelPoints(model, x, y, elevation)
+
+
+def load_models(paths, feedback, workers=1, use_processes=False):
+    """Final models {ID: InvModel} of ``paths``, read in parallel threads or processes."""
+    models = {}
+    executor_type = ProcessPoolExecutor if use_processes and workers > 1 else ThreadPoolExecutor
+    with executor_type(max_workers=max(workers, 1)) as executor:
+        futures = [(path, executor.submit(read_final_model, path)) for path in paths]
+        for path, future in futures:
+            try:
+                model = future.result()
+            except Exception as e:
+                feedback.reportError('Could not read inversion result {}: {}'.format(path, e))
+                continue
+            if model is None:
+                feedback.pushInfo('No model iterations in ' + path)
+            else:
+                models[model.name] = model
+    return models
+
+
+def placed_models(topo_dir_path, lines, feedback, workers=1, use_processes=False):
+    """ModelPoints of the inversion results listed in the *.bth files of a TOPO folder.
+
+    ``lines`` is {ID: parts}; elevations come from the *.top files of the folder.
+    """
+    models = load_models(inv_paths(topo_dir_path), feedback, workers, use_processes)
+    topography = {}
+    for top_path in sorted(glob.glob(topo_dir_path + "/*.top")):
+        topography.update(read_top(top_path))
+    placed = []
+    for name, model in models.items():
+        if name not in lines:
+            feedback.pushInfo('No profile line for inversion result ' + name)
+            continue
+        placed.append(place_model(model, lines[name], topography.get(name)))
+    feedback.pushInfo('Inversion results: {} models, {} blocks'.format(
+        len(placed), sum(points.model.rho.size for points in placed)))
+    return placed
+
+
+def model_rows(points):
+    """Rows of MODEL_FIELDS for the blocks of one placed model."""
+    model = points.model
+    return [[model.name, model.iteration, model.rms] + values for values in
+            np.round(np.column_stack([model.chainage, model.depth, points.elevation, model.rho]), 3).tolist()]
+
+
+def write_models_csv(path, placed):
+    """Write the blocks of all placed models (ModelPoints) to ``path``."""
+    with open(path, 'w') as file_out:
+        file_out.write(MODEL_HEADER)
+        for points in placed:
+            for row, x, y in zip(model_rows(points), points.x, points.y):
+                file_out.write(';'.join('NULL' if value is None else str(value) for value in row)
+                               + ';{:.2f};{:.2f}\n'.format(x, y))
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Persistent SQLite index of parsed profile metadata kept in the survey folder.
+
+A profile is served from the index when the size and mtime of its *.dat
+(and *.2dm) files are unchanged. If only the mtime moved, the stored content
+hash decides, so copied or touched files are not re-parsed. Next to the
+metadata row the index keeps the session record of the *.dat file read in
+the same pass (see geophygis.session), which Export opens read-only.
+"""
+
+import os
+import json
+import hashlib
+import sqlite3
+from urllib.request import pathname2url
+
+INDEX_NAME = '.geophygis_index.sqlite'
+INDEX_VERSION = 2  # podbić przy każdej zmianie logiki parsowania
+
+_SCHEMA = """CREATE TABLE IF NOT EXISTS profiles (
+    name TEXT PRIMARY KEY,
+    version INTEGER,
+    flag2dm INTEGER,
+    dat_path TEXT, dat_size INTEGER, dat_mtime INTEGER, dat_hash TEXT,
+    dm_path TEXT, dm_size INTEGER, dm_mtime INTEGER, dm_hash TEXT,
+    row TEXT,
+    record TEXT)"""
+
+
+def file_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return [path, stat.st_size, stat.st_mtime_ns]
+
+
+class MetadataIndex:
+    """Cache of Import metadata rows keyed by profile name and file state."""
+
+    def __init__(self, parent_dir_path, rebuild=False):
+        self.path = os.path.join(parent_dir_path, INDEX_NAME)
+        self.parent_dir_path = parent_dir_path
+        self.hits = 0
+        self.misses = 0
+        self._pending = {}
+        self.connection = sqlite3.connect(self.path)
+        columns = [column[1] for column in self.connection.execute("PRAGMA table_info(profiles)")]
+        if columns and 'record' not in columns:  # indeks starszej wersji - budowany od nowa
+            self.connection.execute("DROP TABLE profiles")
+        self.connection.execute(_SCHEMA)
+        if rebuild:
+            self.clear()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def clear(self):
+        with self.connection:
+            self.connection.execute("DELETE FROM profiles")
+
+    def invalidate(self, names):
+        with self.connection:
+            self.connection.executemany("DELETE FROM profiles WHERE name = ?", [(name,) for name in names])
+
+    def prune(self, names):
+        """Drop entries of profiles that are no longer present in the folder."""
+        keep = set(names)
+        stored = [row[0] for row in self.connection.execute("SELECT name FROM profiles")]
+        self.invalidate([name for name in stored if name not in keep])
+
+    def _files(self, name, flag2dm):
+        files = [self.parent_dir_path + "/" + name + ".dat"]
+        if flag2dm:
+            files.append(self.parent_dir_path + "/" + name + ".2dm")
+        return files
+
+    def _unchanged(self, signature, stored):
+        path, size, mtime = signature
+        stored_path, stored_size, stored_mtime, stored_hash = stored
+        if path != stored_path or size != stored_size:
+            return False
+        if mtime == stored_mtime:
+            return True
+        return file_hash(path) == stored_hash  # plik tylko dotknięty albo skopiowany
+
+    def lookup(self, names, flag2dm):
+        """Split ``names`` into cached rows and names that must be parsed.
+
+        Returns ``(cached, stale)`` where ``cached`` maps name to row.
+        """
+        cached = {}
+        stale = []
+        touched = []
+        for name in names:
+            try:
+                signatures = [_signature(path) for path in self._files(name, flag2dm)]
+            except OSError:
+                signatures = None
+            entry = self.connection.execute(
+                "SELECT version, flag2dm, dat_path, dat_size, dat_mtime, dat_hash,"
+                " dm_path, dm_size, dm_mtime, dm_hash, row FROM profiles WHERE name = ?", (name,)).fetchone()
+            if (signatures is not None and entry is not None and entry[0] == INDEX_VERSION
+                    and bool(entry[1]) == bool(flag2dm)
+                    and all(self._unchanged(signature, entry[2 + 4 * i:6 + 4 * i])
+                            for i, signature in enumerate(signatures))):
+                cached[name] = json.loads(entry[10])
+                self.hits += 1
+                if signatures[0][2] != entry[4] or (flag2dm and signatures[1][2] != entry[8]):
+                    touched.append((signatures[0][2], signatures[1][2] if flag2dm else None, name))
+            else:
+                stale.append(name)
+                try:  # skrót liczony przed parsowaniem
+                    self._pending[name] = [signature + [file_hash(signature[0])] for signature in signatures]
+                except (OSError, TypeError):
+                    pass
+                self.misses += 1
+        if touched:
+            with self.connection:
+                self.connection.executemany("UPDATE profiles SET dat_mtime = ?, dm_mtime = ? WHERE name = ?",
+                                            touched)
+        return cached, stale
+
+    def store(self, rows, flag2dm, records=None):
+        """Save freshly parsed rows and their session ``records``, using file states seen by ``lookup``."""
+        entries = []
+        for name, row in rows.items():
+            signatures = self._pending.pop(name, None)
+            if signatures is None:
+                continue
+            values = [value for signature in signatures for value in signature]
+            if not flag2dm:
+                values.extend([None, None, None, None])
+            record = (records or {}).get(name)
+            entries.append([name, INDEX_VERSION, int(bool(flag2dm))] + values
+                           + [json.dumps(row), None if record is None else json.dumps(record)])
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO profiles VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)", entries)
+
+
+def read_records(parent_dir_path):
+    """Session records {name: record} of a survey folder, read without creating or locking the index.
+
+    Size and mtime of a record are those the index holds for the *.dat
+    file, so files only touched since the scan keep their record.
+    """
+    path = os.path.join(parent_dir_path, INDEX_NAME)
+    if not os.path.exists(path):
+        return {}
+    records = {}
+    try:
+        connection = sqlite3.connect('file:{}?mode=ro'.format(pathname2url(os.path.abspath(path))), uri=True)
+        try:
+            for name, dat_size, dat_mtime, record in connection.execute(
+                    "SELECT name, dat_size, dat_mtime, record FROM profiles WHERE version = ? AND record IS NOT NULL",
+                    (INDEX_VERSION,)):
+                records[name] = [dat_size, dat_mtime] + json.loads(record)[2:]
+        finally:
+            connection.close()
+    except (sqlite3.Error, ValueError):
+        return {}  # indeks starszej wersji lub uszkodzony - Export przeczyta pliki sam
+    return records
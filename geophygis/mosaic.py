@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+DEM mosaic of many raster tiles (map sheets) sampled as one DemReader.
+
+Tile extents are read once into an index file (INDEX_NAME next to the
+first tile, refreshed only for changed files) and bucketed on a regular
+grid. A tile is opened when a point first falls into it; open tiles are
+released, least recently used first, when their tile caches together
+exceed the memory budget. Points on a seam or in a nodata collar of one
+sheet are taken from the next sheet covering them.
+"""
+
+import os
+import json
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+from geophygis import dem, geotiff
+
+INDEX_NAME = '.geophygis_dem_index.json'
+TILE_EXTENSIONS = ('.tif', '.tiff', '.asc', '.img')
+MAX_OPEN_TILES = 64
+
+
+def tile_paths(source):
+    """Raster files of a folder or of a ';' separated list of files and folders."""
+    paths = []
+    for item in source.split(';'):
+        item = item.strip()
+        if not item:
+            continue
+        if os.path.isdir(item):
+            paths += sorted(os.path.join(item, name) for name in os.listdir(item)
+                            if name.lower().endswith(TILE_EXTENSIONS))
+        else:
+            paths.append(item)
+    return paths
+
+
+def is_mosaic(source):
+    """True for a folder or a list of rasters, False for a single raster file."""
+    return ';' in source or os.path.isdir(source)
+
+
+def read_index(paths, index_path=None):
+    """Index entries (path, size, mtime, x_min, y_min, x_max, y_max, x_res, y_res) of ``paths``.
+
+    Entries of files unchanged since ``index_path`` was written are not
+    read again; the index file is updated when anything changed.
+    """
+    cached = {}
+    if index_path is not None and os.path.exists(index_path):
+        try:
+            with open(index_path) as index_file:
+                cached = {entry[0]: entry for entry in json.load(index_file)}
+        except (OSError, ValueError):
+            cached = {}  # uszkodzony indeks - budowa od nowa
+    entries = []
+    for path in paths:
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = cached.get(path)
+        if entry is None or entry[1:3] != [stat.st_size, stat.st_mtime_ns]:
+            x_min, y_max, x_res, y_res, width, height = geotiff.raster_extent(path)
+            entry = [path, stat.st_size, stat.st_mtime_ns,
+                     x_min, y_max - height * y_res, x_min + width * x_res, y_max, x_res, y_res]
+        entries.append(entry)
+    if index_path is not None and entries != [cached.get(entry[0]) for entry in entries]:
+        try:
+            handle, temp_path = tempfile.mkstemp(suffix='.json', dir=os.path.dirname(index_path))
+            with os.fdopen(handle, 'w') as temp_file:
+                json.dump(entries, temp_file)
+            os.replace(temp_path, index_path)
+        except OSError:
+            pass  # folder tylko do odczytu - indeks tylko w pamięci
+    return entries
+
+
+class DemMosaic:
+    """Sample many DEM tiles through the DemReader interface (``sample``, ``stats``, ``x_res``)."""
+
+    def __init__(self, paths, nodata=(dem.DEFAULT_NODATA,), cache_bytes=256 * 1024 ** 2, index_path=None):
+        if not paths:
+            raise ValueError('No DEM tiles given')
+        if index_path is None:
+            index_path = os.path.join(os.path.dirname(os.path.abspath(paths[0])), INDEX_NAME)
+        entries = read_index(paths, index_path)
+        self.paths = [entry[0] for entry in entries]
+        self.key = [tuple(entry[:3]) for entry in entries]  # do odcisków eksportu przyrostowego
+        self.extents = np.array([entry[3:7] for entry in entries], dtype=np.float64)
+        resolution = np.abs(np.array([entry[7:9] for entry in entries], dtype=np.float64))
+        self.x_res = float(resolution[:, 0].min())
+        self.y_res = float(resolution[:, 1].min())
+        self.nodata = list(nodata)
+        self.cache_bytes = cache_bytes
+        sizes = np.maximum(self.extents[:, 2] - self.extents[:, 0], self.extents[:, 3] - self.extents[:, 1])
+        self.cell = float(np.median(sizes)) or 1.0
+        self.x0 = float(self.extents[:, 0].min())
+        self.y0 = float(self.extents[:, 1].min())
+        self.margin = max(self.x_res, self.y_res)  # komórka sąsiedniego arkusza dla interpolacji dwuliniowej
+        self._buckets = {}
+        for tile, (x_min, y_min, x_max, y_max) in enumerate(self.extents + [-self.margin, -self.margin,
+                                                                             self.margin, self.margin]):
+            for gx in range(int((x_min - self.x0) // self.cell), int((x_max - self.x0) // self.cell) + 1):
+                for gy in range(int((y_min - self.y0) // self.cell), int((y_max - self.y0) // self.cell) + 1):
+                    self._buckets.setdefault((gx, gy), []).append(tile)
+        self._readers = OrderedDict()
+        self.opened = 0
+        self.released = 0
+        self._closed_stats = [0, 0, 0]  # trafienia, chybienia i usunięcia zamkniętych kafli
+
+    def _reader(self, tile):
+        reader = self._readers.get(tile)
+        if reader is None:
+            reader = geotiff.open_dem(self.paths[tile], self.nodata, self.cache_bytes)
+            self._readers[tile] = reader
+            self.opened += 1
+        else:
+            self._readers.move_to_end(tile)
+        return reader
+
+    def _release(self):
+        total = sum(reader.stats().bytes for reader in self._readers.values())
+        while len(self._readers) > 1 and (total > self.cache_bytes or len(self._readers) > MAX_OPEN_TILES):
+            tile, reader = self._readers.popitem(last=False)
+            stats = reader.stats()
+            total -= stats.bytes
+            self._closed_stats = [self._closed_stats[0] + stats.hits, self._closed_stats[1] + stats.misses,
+                                  self._closed_stats[2] + stats.evictions]
+            self.released += 1
+
+    def tiles_for(self, x, y, margin=0.0):
+        """Indexes of the tiles whose extent (grown by ``margin``) contains any of the points."""
+        with np.errstate(invalid='ignore'):
+            cells = np.floor(np.column_stack([(x - self.x0) / self.cell, (y - self.y0) / self.cell]))
+        cells = cells[np.isfinite(cells).all(axis=1)].astype(np.int64)
+        tiles = set()
+        for gx, gy in np.unique(cells, axis=0).tolist():  # komórki siatki indeksu
+            tiles.update(self._buckets.get((gx, gy), ()))
+        return sorted(tile for tile in tiles if self._contains(tile, x, y, margin).any())
+
+    def _contains(self, tile, x, y, margin=0.0):
+        x_min, y_min, x_max, y_max = self.extents[tile]
+        return (x >= x_min - margin) & (x < x_max + margin) & (y > y_min - margin) & (y <= y_max + margin)
+
+    def sample(self, x, y, method=0):
+        """Sample at map coordinates; ``method`` indexes dem.SAMPLING_METHODS."""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        values = np.full(x.shape, np.nan)
+        todo = self._sample_tiles(x, y, method, values, np.arange(x.size))
+        if todo.size and method == 1:  # brak sąsiednich komórek - wartość z krawędzi arkusza obok
+            self._sample_tiles(x, y, method, values, todo, self.margin)
+        self._release()
+        return values
+
+    def _sample_tiles(self, x, y, method, values, todo, margin=0.0):
+        """Fill ``values[todo]`` tile by tile; returns the indexes still without a value."""
+        for tile in self.tiles_for(x[todo], y[todo], margin):  # kafle w kolejności indeksu
+            inside = self._contains(tile, x[todo], y[todo], margin)
+            if not inside.any():
+                continue
+            index = todo[inside]
+            tile_x, tile_y = x[index], y[index]
+            if margin:
+                x_min, y_min, x_max, y_max = self.extents[tile]
+                tile_x = np.clip(tile_x, x_min, np.nextafter(x_max, x_min))
+                tile_y = np.clip(tile_y, np.nextafter(y_min, y_max), y_max)
+            values[index] = self._reader(tile).sample(tile_x, tile_y, method)
+            todo = todo[np.isnan(values[todo])]  # szwy i obwódki nodata - następny arkusz
+            if todo.size == 0:
+                break
+        return todo
+
+    def stats(self):
+        stats = [reader.stats() for reader in self._readers.values()]
+        return dem.CacheStats(self._closed_stats[0] + sum(s.hits for s in stats),
+                              self._closed_stats[1] + sum(s.misses for s in stats),
+                              self._closed_stats[2] + sum(s.evictions for s in stats),
+                              sum(s.tiles for s in stats), sum(s.bytes for s in stats), self.cache_bytes)
+
+    def clear(self):
+        self._readers.clear()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Geometric factors and pseudo-section positions of *.dat data rows.
+
+For every datum the electrode offsets of its array (datfile.ALL_ARRAYS)
+give the geometric factor k and the median depth of investigation. The
+depth is where the depth investigation characteristic of the four
+electrodes (Edwards 1977) reaches one half; it is solved by bisection for
+each distinct (a, n) of a profile only, so millions of rows cost a
+np.unique. Rows of the equatorial dipole-dipole array take n * a as the
+distance between the two electrode lines. Results are cached per profile
+next to the datload rows (CACHE_SUBFOLDER of datload.CACHE_DIR).
+"""
+
+import os
+
+import numpy as np
+
+from geophygis import datload
+
+PSEUDO_DTYPE = np.dtype([('x', '<f8'), ('depth', '<f4'), ('k', '<f8')])
+CACHE_SUBFOLDER = 'pseudo'
+BISECTION_STEPS = 40
+REMOTE = np.inf  # elektroda w nieskończoności (układy z biegunem)
+
+
+def electrode_offsets(array_type, a, n):
+    """Along- and across-line offsets (4, m) of C1, C2, P1, P2 from the first electrode of the array."""
+    reverse = (a < 0) | (n < 0)  # odwrócony układ pole-dipole
+    a = np.abs(a)
+    n = np.abs(n)
+    zero = np.zeros_like(a)
+    remote = np.full_like(a, REMOTE)
+    if array_type == 1:  # Wenner-Alpha: C1 P1 P2 C2
+        along = [zero, 3 * a, a, 2 * a]
+    elif array_type == 2:  # Pole-Pole: C1 P1
+        along = [zero, remote, a, remote]
+    elif array_type == 3:  # Dipole-dipole: C2 C1 P1 P2
+        along = [a, zero, a + n * a, 2 * a + n * a]
+    elif array_type == 4:  # Wenner-Beta: C2 C1 P1 P2
+        along = [a, zero, 2 * a, 3 * a]
+    elif array_type == 5:  # Wenner-Gamma: C1 P1 C2 P2
+        along = [zero, 2 * a, a, 3 * a]
+    elif array_type == 6:  # Pole-dipole: C1 P1 P2 albo odwrotnie P2 P1 C1
+        along = [np.where(reverse, (n + 1) * a, zero), remote,
+                 np.where(reverse, a, n * a), np.where(reverse, zero, (n + 1) * a)]
+    elif array_type == 7:  # Schlumberger: C1 P1 P2 C2
+        along = [zero, (2 * n + 1) * a, n * a, (n + 1) * a]
+    elif array_type == 8:  # Equatorial dipole-dipole: C1 C2 / P1 P2 na linii obok
+        along = [zero, a, zero, a]
+    else:
+        raise ValueError('Unknown array type {}'.format(array_type))
+    across = [zero, zero, n * a, n * a] if array_type == 8 else [zero] * 4
+    return np.array(along), np.array(across)
+
+
+def _pairs(along, across):
+    """Distances C1P1, C1P2, C2P1, C2P2 (4, m) and their signs in the measured potential."""
+    distance = []
+    for c, p in [(0, 2), (0, 3), (1, 2), (1, 3)]:
+        with np.errstate(invalid='ignore'):
+            distance.append(np.hypot(along[c] - along[p], across[c] - across[p]))
+    distance = np.array(distance)
+    distance[~np.isfinite(distance)] = REMOTE
+    return distance, np.array([1.0, -1.0, -1.0, 1.0])[:, None]
+
+
+def geometric_factor(array_type, a, n):
+    """Geometric factor k = 2 pi / (1/C1P1 - 1/C1P2 - 1/C2P1 + 1/C2P2)."""
+    distance, sign = _pairs(*electrode_offsets(array_type, a, n))
+    with np.errstate(divide='ignore'):
+        return 2 * np.pi / np.sum(sign / distance, axis=0)
+
+
+def median_depth(array_type, a, n):
+    """Median depth of investigation: depth where half of the array sensitivity lies above."""
+    distance, sign = _pairs(*electrode_offsets(array_type, a, n))
+    weight = np.where(np.isfinite(distance), sign / distance, 0.0)
+    total = weight.sum(axis=0)
+    low = np.zeros(distance.shape[1])
+    high = 4 * np.where(np.isfinite(distance), distance, 0.0).max(axis=0)
+    for i in range(BISECTION_STEPS):  # bisekcja dla wszystkich geometrii naraz
+        depth = (low + high) / 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            above = np.sum(weight - sign / np.sqrt(distance ** 2 + 4 * depth ** 2), axis=0) / total
+        low = np.where(above < 0.5, depth, low)
+        high = np.where(above < 0.5, high, depth)
+    return (low + high) / 2
+
+
+def midpoint_offset(array_type, a, n):
+    """Offset of the middle of the electrodes in use (remote poles left out) from the first one."""
+    along = electrode_offsets(array_type, a, n)[0]
+    finite = np.isfinite(along)
+    return np.where(finite, along, 0.0).sum(axis=0) / finite.sum(axis=0)
+
+
+def pseudo_section(array_type, x_location, rows):
+    """PSEUDO_DTYPE array (pseudo-section x, median depth, k) of datload rows.
+
+    The geometry is solved once per distinct (a, n) and spread over the rows.
+    """
+    geometry = np.ascontiguousarray(np.column_stack([rows['a'], rows['n']]), dtype='<f4').view('<u8').ravel()
+    keys, inverse = np.unique(geometry, return_inverse=True)
+    pairs = keys.view('<f4').reshape(-1, 2).astype(np.float64)
+    a, n = pairs[:, 0], pairs[:, 1]
+    result = np.zeros(rows.size, dtype=PSEUDO_DTYPE)
+    result['k'] = geometric_factor(array_type, a, n)[inverse]
+    result['depth'] = median_depth(array_type, a, n)[inverse]
+    result['x'] = rows['x']
+    if x_location != 1:  # x pierwszej elektrody - środek układu dalej o połowę rozstawu
+        result['x'] += midpoint_offset(array_type, a, n)[inverse]
+    return result
+
+
+def load_pseudo(dat_path, data=None, cache=True):
+    """Pseudo-section of a *.dat file, memory-mapped from the cache when valid.
+
+    ``data`` (a datload.DatData of the same file) saves loading the rows again.
+    """
+    stat = os.stat(dat_path)
+    cache_path = datload._cache_path(dat_path, stat, CACHE_SUBFOLDER)
+    if cache and os.path.exists(cache_path):
+        try:
+            return np.load(cache_path, mmap_mode='r')
+        except (OSError, ValueError):
+            pass  # uszkodzony plik pamięci podręcznej
+    if data is None:
+        data = datload.load_dat(dat_path, cache)
+    result = pseudo_section(data.array_type, data.x_location, data.rows)
+    if cache:
+        datload._store(cache_path, result)
+    return result
+
+
+def pseudo_stats(pseudo):
+    """Pseudo-depth coverage (min / max median depth) and the k range of a profile."""
+    if pseudo.size == 0:
+        return [None, None, None, None]
+    depth = np.asarray(pseudo['depth'], dtype=np.float64)
+    k = np.abs(np.asarray(pseudo['k'], dtype=np.float64))
+    return [round(float(depth.min()), 2), round(float(depth.max()), 2),
+            round(float(k.min()), 2), round(float(k.max()), 2)]
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+QGIS conversions shared by the Import and Export scripts.
+
+Line geometries are turned into NumPy vertex arrays and QGIS fields,
+values and CRS into their GeoPackage counterparts (see geophygis.gpkg).
+This is the only module of the package importing QGIS; the scripts use it
+so that the conversions cannot differ between Import and Export.
+"""
+
+import numpy as np
+from PyQt5.QtCore import Qt, QVariant
+from qgis.core import QgsLineString
+
+from geophygis import gpkg
+
+SQL_TYPES = {QVariant.Double: 'REAL', QVariant.Int: 'INTEGER', QVariant.LongLong: 'INTEGER',
+             QVariant.UInt: 'INTEGER', QVariant.ULongLong: 'INTEGER', QVariant.Bool: 'INTEGER'}
+
+
+def line_parts(geometry):
+    """Vertices [(x, y)] of the parts of a line geometry; curves are segmentized."""
+    parts = []
+    for part in geometry.constParts():
+        if not isinstance(part, QgsLineString):
+            part = part.curveToLine()
+        parts.append((np.array(part.xVector()), np.array(part.yVector())))
+    return parts
+
+
+def gpkg_fields(fields):
+    """GeoPackage columns [(name, SQL type)] of QgsFields."""
+    return gpkg.table_fields([(field.name(), SQL_TYPES.get(field.type(), 'TEXT')) for field in fields])
+
+
+def _text(value):
+    if hasattr(value, 'toString'):  # QDate, QTime, QDateTime
+        return value.toString(Qt.ISODate)
+    return str(value)
+
+
+def gpkg_value(value):
+    """GeoPackage value of a feature attribute."""
+    if isinstance(value, QVariant) and value.isNull():
+        return None
+    return gpkg.column_value(value, _text)
+
+
+def gpkg_srs(crs):
+    """``srs`` of gpkg.GeoPackageWriter for a QgsCoordinateReferenceSystem, None when invalid."""
+    if not crs.isValid():
+        return None
+    return gpkg.srs_row(crs.postgisSrid(), crs.description(), crs.authid(), crs.toWkt())
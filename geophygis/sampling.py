@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Densification of profile lines on NumPy arrays.
+
+``densify`` places points every ``spacing`` along a (multi)line the way
+qgis:pointsalonglines does; DEM values are read with geophygis.dem.
+"""
+
+import numpy as np
+
+
+def _line_angle(dx, dy):
+    return np.arctan2(dx, dy) % (2 * np.pi)  # zgodnie z ruchem wskazówek od północy
+
+
+def _average_angle(a1, a2):
+    clockwise = np.where(a2 > a1, a2 - a1, a2 + 2 * np.pi - a1)
+    counter_clockwise = 2 * np.pi - clockwise
+    angle = np.where(clockwise <= counter_clockwise, a1 + clockwise / 2.0, a1 - counter_clockwise / 2.0)
+    return angle % (2 * np.pi)
+
+
+def densify(parts, spacing, start_offset=0.0, end_offset=0.0):
+    """Points every ``spacing`` along a line given as a list of (x, y) vertex arrays.
+
+    Parts of a multiline are walked one after another. Returns arrays of
+    chainage, x, y and line angle in degrees.
+    """
+    x0, y0, x1, y1, part_id = [], [], [], [], []
+    for i, (x, y) in enumerate(parts):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if x.size < 2:
+            continue
+        x0.append(x[:-1])
+        y0.append(y[:-1])
+        x1.append(x[1:])
+        y1.append(y[1:])
+        part_id.append(np.full(x.size - 1, i))
+    if not x0:
+        empty = np.empty(0)
+        return empty, empty, empty, empty
+    x0, y0, x1, y1, part_id = [np.concatenate(a) for a in (x0, y0, x1, y1, part_id)]
+    dx = x1 - x0
+    dy = y1 - y0
+    seg_length = np.hypot(dx, dy)
+    seg_end = np.cumsum(seg_length)
+    seg_start = seg_end - seg_length
+    length = seg_end[-1] - end_offset
+
+    n = int(np.floor(max(length - start_offset, 0) / spacing)) + 2
+    distance = np.cumsum(np.concatenate(([start_offset], np.full(n, spacing))))  # jak kolejne += spacing
+    distance = distance[distance <= length]
+
+    index = np.minimum(np.searchsorted(seg_end, distance, side='left'), seg_end.size - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(seg_length[index] > 0, (distance - seg_start[index]) / seg_length[index], 0.0)
+    x = x0[index] + t * dx[index]
+    y = y0[index] + t * dy[index]
+
+    seg_angle = _line_angle(dx, dy)
+    angle = seg_angle[index]
+    next_index = np.minimum(index + 1, seg_end.size - 1)
+    at_vertex = ((distance == seg_end[index]) & (next_index != index)
+                 & (part_id[next_index] == part_id[index]))  # punkt dokładnie w wierzchołku
+    angle[at_vertex] = _average_angle(seg_angle[index[at_vertex]], seg_angle[next_index[at_vertex]])
+    return distance, x, y, np.degrees(angle)
+
+
+def line_length(parts):
+    """Total length of a line given as a list of (x, y) vertex arrays."""
+    return float(sum(np.hypot(np.diff(np.asarray(x, dtype=np.float64)), np.diff(np.asarray(y, dtype=np.float64))).sum()
+                     for x, y in parts))
+
+
+def round_half_away(values, places):
+    """Rounding of the QGIS round() expression (halves away from zero)."""
+    scale = 10.0 ** places
+    values = np.asarray(values, dtype=np.float64)
+    return np.sign(values) * np.floor(np.abs(values) * scale + 0.5) / scale
+
+
+
+def points_at(parts, distance):
+    """Map coordinates of the points at chainages ``distance`` along a line (parts walked as in densify)."""
+    x0, y0, x1, y1 = [], [], [], []
+    for x, y in parts:
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if x.size < 2:
+            continue
+        x0.append(x[:-1])
+        y0.append(y[:-1])
+        x1.append(x[1:])
+        y1.append(y[1:])
+    distance = np.asarray(distance, dtype=np.float64)
+    if not x0:
+        return np.full(distance.shape, np.nan), np.full(distance.shape, np.nan)
+    x0, y0, x1, y1 = [np.concatenate(a) for a in (x0, y0, x1, y1)]
+    seg_length = np.hypot(x1 - x0, y1 - y0)
+    seg_end = np.cumsum(seg_length)
+    index = np.minimum(np.searchsorted(seg_end, distance, side='left'), seg_end.size - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(seg_length[index] > 0, (distance - (seg_end[index] - seg_length[index])) / seg_length[index], 0.0)
+    return x0[index] + t * (x1 - x0)[index], y0[index] + t * (y1 - y0)[index]
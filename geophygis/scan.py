@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Reading of the per-profile *.dat / *.2dm headers used by Import, serially
+or with a pool of worker threads or processes.
+"""
+
+import os
+import re
+import sys
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+from geophygis import datfile, session
+
+SCAN_MODES = ['Threads (network shares)', 'Processes (CPU-bound parsing)']
+
+
+def read_2dm_header(path):
+    """Return the six metadata fields of an Ares-II or Ares-3D *.2dm header."""
+    with open(path) as file:
+        header_buffer = []
+        for i in range(1, 26):
+            header_line = file.readline()  # odczytanie linii pliku
+            header_line = header_line.rstrip('\n')  # odrzucenie wszystkiego po nline
+            header_buffer.append(header_line)
+    header_data = []
+    if 'Time' in header_buffer[1] != -1:  # Ares-II
+        file_type = [13, 2, 1, 0, 4, 5]
+        for j in file_type:  # operacje porządkujące plik żródłowy
+            header_buffer[j] = header_buffer[j].replace('\t', '')
+            header_buffer[j] = re.sub(r'.*: ', '', header_buffer[j])
+            for l in ['Operator:', 'Note:', 'Profile length:', ' m']:
+                header_buffer[j] = header_buffer[j].replace(l, '')
+            header_data.append(header_buffer[j])
+    else:
+        file_type = [9, 3, 24, 0, 2, 4]  # Ares-3D
+        for j in file_type: # operacje porządkujące plik żródłowy
+            header_buffer[j] = re.sub(r'.*:\t', '', header_buffer[j])
+            header_buffer[j] = re.sub(r'.*: \t', '', header_buffer[j])
+        header_buffer[24] = ''
+        header_data.append(header_buffer[j])
+    return header_data
+
+
+def read_profile(parent_dir_path, key, flag2dm):
+    """Metadata row of one profile: [LENGTH, SPACING, ARRAY, *2dm fields]."""
+    dat_header = datfile.read_dat_header(parent_dir_path + "/" + key + ".dat")
+    header_data = [dat_header.profile_end, dat_header.base_spacing, dat_header.array_name]
+    if flag2dm is True:  # moduł do odczytu danych z plików 2dm
+        header_data.extend(read_2dm_header(parent_dir_path + "/" + key + ".2dm"))
+    return header_data
+
+
+def read_profile_record(parent_dir_path, key, flag2dm):
+    """Metadata row of one profile and the session record of its *.dat file, reading the file once."""
+    record = session.read_record(parent_dir_path + "/" + key + ".dat")
+    dat_header = datfile.DatHeader(*record[2])
+    header_data = [dat_header.profile_end, dat_header.base_spacing, dat_header.array_name]
+    if flag2dm is True:
+        header_data.extend(read_2dm_header(parent_dir_path + "/" + key + ".2dm"))
+    return header_data, record
+
+
+def _process_executor(workers):
+    if sys.platform == 'win32':  # w QGIS sys.executable wskazuje na qgis.exe
+        python_exe = os.path.join(sys.exec_prefix, 'pythonw.exe')
+        if os.path.exists(python_exe):
+            multiprocessing.set_executable(python_exe)
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def scan_profiles(parent_dir_path, profile_names, flag2dm, feedback, workers=1, use_processes=False, records=None):
+    """Read all profiles and return {name: row} in ``profile_names`` order.
+
+    Profiles that fail to parse are reported through ``feedback`` and left
+    out of the result. The scan stops as soon as ``feedback`` is canceled.
+    A ``records`` dict is filled with the session records of the *.dat
+    files (see geophygis.session) read in the same pass.
+    """
+    results = {}
+    total = max(len(profile_names), 1)
+    read = read_profile if records is None else read_profile_record
+
+    def keep(key, result):
+        if records is None:
+            results[key] = result
+        else:
+            results[key], records[key] = result
+
+    if workers <= 1:
+        for current, key in enumerate(profile_names):
+            if feedback.isCanceled():
+                break
+            try:
+                keep(key, read(parent_dir_path, key, flag2dm))
+            except Exception as e:
+                feedback.reportError('Could not read profile {}: {}'.format(key, e))
+            feedback.setProgress(100 * (current + 1) / total)
+        return {key: results[key] for key in profile_names if key in results}
+
+    executor = _process_executor(workers) if use_processes else ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {executor.submit(read, parent_dir_path, key, flag2dm): key for key in profile_names}
+        for current, future in enumerate(as_completed(futures)):
+            if feedback.isCanceled():
+                break
+            key = futures[future]
+            try:
+                keep(key, future.result())
+            except Exception as e:
+                feedback.reportError('Could not read profile {}: {}'.format(key, e))
+            feedback.setProgress(100 * (current + 1) / total)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    return {key: results[key] for key in profile_names if key in results}
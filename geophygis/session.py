@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Survey session shared by Import and Export.
+
+The scan of Import parses the *.dat header of every profile once and
+stores it in the metadata index (see geophygis.metaindex), together with
+the byte offset where its data block ends. Export takes the electrode
+extent and the inversion cost from there instead of parsing the files
+again, and copies the data block of each _topo.dat up to the stored
+offset without searching for it. A record is used only while the size
+and mtime of its *.dat file are unchanged; the watch mode of Import keeps
+the records current because every update goes through the same index.
+"""
+
+import io
+import os
+
+from geophygis import datfile, topowriter, metaindex
+
+
+def read_record(dat_path):
+    """Session record ``[size, mtime, header fields, data block end]`` of a *.dat file."""
+    stat = os.stat(dat_path)
+    with open(dat_path, 'rb') as dat:
+        raw = dat.read()
+    header = datfile.parse_dat_bytes(raw)
+    return [stat.st_size, stat.st_mtime_ns, list(header), topowriter.data_block_end(io.BytesIO(raw), len(raw))]
+
+
+class SurveySession:
+    """Parsed *.dat headers and data block offsets of the profiles of one survey folder."""
+
+    def __init__(self, parent_dir_path, records=None):
+        self.parent_dir_path = parent_dir_path
+        self.records = records or {}
+        self.checked = {}  # rekordy sprawdzone w tej sesji - każdy profil liczony raz
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, parent_dir_path):
+        """Session of a survey folder from its metadata index; empty without an index."""
+        return cls(parent_dir_path, metaindex.read_records(parent_dir_path))
+
+    def _dat_path(self, name):
+        return self.parent_dir_path + "/" + name + ".dat"
+
+    def _record(self, name):
+        if name in self.checked:
+            return self.checked[name]
+        record = self.records.get(name)
+        if record is not None:
+            try:
+                stat = os.stat(self._dat_path(name))
+            except OSError:
+                record = None
+            else:
+                if [stat.st_size, stat.st_mtime_ns] != record[:2]:
+                    record = None  # plik zmieniony po imporcie
+        if record is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        self.checked[name] = record
+        return record
+
+    def header(self, name):
+        """DatHeader of a profile, None without a current record."""
+        record = self._record(name)
+        return datfile.DatHeader(*record[2]) if record is not None else None
+
+    def data_end(self, name):
+        """Offset where the closing zeros of the *.dat file start, None without a current record."""
+        record = self._record(name)
+        return record[3] if record is not None else None
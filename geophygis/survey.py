@@ -0,0 +1,469 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Survey level steps of Import and Export without any QGIS dependency.
+
+The processing scripts call these functions with QGIS objects only at
+the edges (layers, sinks, coordinate transforms); the command line
+interface in geophygis.cli runs the same steps on plain files.
+"""
+
+import os
+import re
+import csv
+import glob
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from geophygis import scan, metaindex, datfile, datload, sampling, filters, topostore, topowriter, batches, topocache, gpkg, ties, pseudo
+
+META_HEADER = "ID;LENGTH;SPACING;ARRAY;field_LENGTH;DATE;TIME;DEVICE;OPERATOR;NOTES\n"
+DOCSHEET_HEADER = 'ID\tGIS_LENGHTH\tLENHGTH\tARRAY\tSPACING\tDIRECTION\n'
+POINTS_HEADER = "ID;distance;angle;DEM_1;x;y\n"
+QC_FIELDS = ['DATUMS', 'RHO_MIN', 'RHO_MED', 'RHO_MAX', 'RHO_NONPOS_[%]', 'DEPTH_MIN', 'DEPTH_MAX', 'K_MIN', 'K_MAX']
+QC_TYPES = ['int', 'double', 'double', 'double', 'double', 'double', 'double', 'double', 'double']
+INCREMENTAL_DIR = 'TOPO_incremental'  # stały folder eksportu przyrostowego
+OPTIONAL_OUTPUTS = ['_points.csv', '_ties.csv', '.gpkg', '.attab', '_timing.prof']  # po nazwie folderu badania
+GPKG_POINTS = 'topo_points'
+GPKG_PROFILES = 'topo_profiles'
+POINT_FIELDS = [('ID', 'TEXT'), ('distance', 'REAL'), ('angle', 'REAL'), ('DEM_1', 'REAL'), ('x', 'REAL'), ('y', 'REAL')]
+PROFILE_FIELDS = [('ID', 'TEXT'), ('LENGTH', 'REAL'), ('POINTS', 'INTEGER'), ('DEM_MIN', 'REAL'), ('DEM_MAX', 'REAL')]
+
+ProfileSample = namedtuple('ProfileSample', ['distance', 'x', 'y', 'angle', 'elevation'])
+
+
+def profile_names(parent_dir_path):
+    """Profile IDs of all *.dat files in the survey folder (upper case)."""
+    return [os.path.basename(path)[:-4].upper() for path in glob.glob(parent_dir_path + "/*.dat")]
+
+
+def read_metadata(parent_dir_path, names, flag2dm, feedback, workers=1, use_processes=False, rebuild=False):
+    """Metadata rows of ``names`` through the metadata index.
+
+    Only new and changed profiles are parsed; the session records of their
+    *.dat files (see geophygis.session) are stored in the same pass. Returns
+    ``({name: row}, number of parsed profiles)``; the index is not updated
+    after cancel.
+    """
+    with metaindex.MetadataIndex(parent_dir_path, rebuild=rebuild) as index:
+        cached, stale = index.lookup(names, flag2dm)
+        records = {}
+        parsed = scan.scan_profiles(parent_dir_path, stale, flag2dm, feedback,
+                                    workers=workers, use_processes=use_processes, records=records)
+        if not feedback.isCanceled():
+            index.store(parsed, flag2dm, records)
+            index.prune(names)
+        feedback.pushInfo('Metadata index: {} hits, {} misses'.format(index.hits, index.misses))
+    cached.update(parsed)
+    return {key: cached[key] for key in names if key in cached}, len(stale)
+
+
+def read_qc(parent_dir_path, names, feedback, workers=1):
+    """QC columns (QC_FIELDS) of every profile computed from all its data rows.
+
+    Rows and pseudo-sections come from the datload cache, so only new or
+    changed files are parsed; DEPTH_* is the median depth of investigation
+    coverage and K_* the range of |k| (see geophygis.pseudo).
+    """
+    def qc(name):
+        dat_path = parent_dir_path + "/" + name + ".dat"
+        data = datload.load_dat(dat_path)
+        return datload.qc_stats(data.rows) + pseudo.pseudo_stats(pseudo.load_pseudo(dat_path, data))
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = [(name, executor.submit(qc, name)) for name in names]
+        for name, future in futures:
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                feedback.reportError('Could not read data of profile {}: {}'.format(name, e))
+    return results
+
+
+def write_meta_csv(path, data):
+    """Append the ``_meta`` table of ``data`` ({ID: row}) to ``path``."""
+    with open(path, 'a+') as file_out:
+        file_out.write(META_HEADER)
+        for key, row in data.items():  # eksport wszystkich danych do pliku csv, porządkowanie danych
+            line_out = str(row)
+            line_out = line_out.replace(", ", ";")
+            line_out = line_out.replace("'", "")
+            line_out = line_out.replace('[', '')
+            line_out = line_out.replace(']', '')
+            file_out.write(key + ';' + line_out + '\n')
+
+
+def csv_value(value):
+    return 'NULL' if value is None else str(value)
+
+
+def docsheet_line(values):
+    """Docsheet row of ID, GIS_LENGTH, LENGTH, ARRAY, SPACING and DIRECTION values."""
+    return "\t".join([str(values[0]), str(round(float(values[1]), 2))] + [csv_value(value) for value in values[2:]]) + "\n"
+
+
+def write_docsheet(path, rows):
+    """Write the docsheet of ``rows`` (values as in docsheet_line) to ``path``."""
+    with open(path, 'w') as file_docsheet:
+        file_docsheet.write(DOCSHEET_HEADER)
+        for values in rows:
+            file_docsheet.write(docsheet_line(values))
+
+
+def sample_profile(parts, spacing, dem_reader, method=0, to_dem=None, start_offset=0.0, end_offset=0.0):
+    """Densify a line and sample the DEM at its points.
+
+    ``to_dem`` optionally maps the x, y arrays to the DEM CRS. Returns a
+    ProfileSample, or None for lines too short to densify.
+    """
+    distance, x, y, angle = sampling.densify(parts, spacing, start_offset, end_offset)
+    if distance.size == 0:
+        return None
+    dem_x, dem_y = to_dem(x, y) if to_dem is not None else (x, y)
+    return ProfileSample(distance, x, y, angle, dem_reader.sample(dem_x, dem_y, method))
+
+
+def fine_step(dem_reader, step=0):
+    """Step of the fine topography curve: ``step`` or the DEM cell size."""
+    return step or min(abs(dem_reader.x_res), abs(dem_reader.y_res))
+
+
+def resample_profile(parts, layout, curve):
+    """ProfileSample at ``layout`` with elevations interpolated from a fine ``(distance, elevation)`` curve."""
+    distance, x, y, angle = sampling.densify(parts, *layout)
+    if distance.size == 0:
+        return None
+    return ProfileSample(distance, x, y, angle, np.interp(distance, curve[0], curve[1]))
+
+
+def layout_sample(parts, layout, dem_reader, method=0, to_dem=None, curves=None, curve_key=None, step=0):
+    """ProfileSample of a line at ``layout``: (spacing, start offset, end offset).
+
+    With a TopoCache of ``curves`` the elevations are interpolated from the
+    fine curve cached under ``curve_key``; the DEM is sampled every ``step``
+    only when the curve is missing.
+    """
+    if curves is None:
+        return sample_profile(parts, layout[0], dem_reader, method, to_dem, *layout[1:])
+    curve = curves.curve(curve_key)
+    if curve is None:
+        fine = sample_profile(parts, step, dem_reader, method, to_dem)
+        if fine is None:
+            return None
+        curve = (fine.distance, fine.elevation)
+        curves.store_curve(curve_key, *curve)
+    return resample_profile(parts, layout, curve)
+
+
+def electrode_layout(dat_path, parts, spacing, header=None, base_spacing=True):
+    """Layout placing the points at the electrodes of a *.dat file.
+
+    The electrodes run every base spacing from the minimum electrode over
+    the profile length of the header; with ``base_spacing`` False the
+    points stay every ``spacing``, only limited to the electrode range. A
+    ``header`` from the survey session saves reading the file. Falls back
+    to ``spacing`` along the whole line when the file cannot be read or
+    its array has no length.
+    """
+    if header is None:
+        try:
+            header = datfile.read_dat_header(dat_path)
+        except (OSError, ValueError, IndexError):
+            return spacing, 0.0, 0.0
+    if header.profile_end <= 0 or header.base_spacing <= 0:
+        return spacing, 0.0, 0.0
+    end_offset = sampling.line_length(parts) - header.min_electrode - header.profile_end
+    return header.base_spacing if base_spacing else spacing, float(header.min_electrode), max(end_offset, 0.0)
+
+
+def store_topography(store, profile_id, sample, null_value=None):
+    """Add the valid points of ``sample`` to a TopoStore."""
+    valid = ~np.isnan(sample.elevation)
+    if null_value is not None:
+        valid &= sample.elevation != null_value
+    if valid.any():
+        store.add(profile_id, sample.distance[valid], sample.elevation[valid])
+
+
+def filter_profiles(store, window, filter_type, feedback, names=None):
+    """Sorted and filtered topography of every profile (or of ``names``): {ID: (distance, elevation)}."""
+    profiles = {}
+    for name in store.ids() if names is None else names:  # filtrowanie każdego profilu niezależnie
+        distance, elevation = store.profile(name)
+        if window:
+            window_size = filters.effective_window(window, distance.size)
+            if window_size < window:
+                feedback.pushInfo("Size of window for filtering is too big. Changing window size to " + str(window_size) + " probes")
+            elevation = np.round(filters.smooth(elevation, window_size, filter_type), 2)
+        profiles[name] = (distance, elevation.copy())
+    return profiles
+
+
+def cached_sample(cache, key, compute):
+    """ProfileSample stored in a TopoCache under ``key``, computed and stored when missing."""
+    columns = cache.sample(key)
+    if columns is not None:
+        return ProfileSample(*columns)
+    sample = compute()
+    if sample is not None:
+        cache.store_sample(key, sample)
+    return sample
+
+
+def profile_fingerprints(parent_dir_path, feature_keys, window, filter_type, null_value=None):
+    """Fingerprints of the filtered topography of profiles from {ID: [feature fingerprints]}."""
+    return {name: topocache.fingerprint(keys, window, filter_type, null_value,
+                                        topocache.file_signature(parent_dir_path + "/" + name + ".dat"))
+            for name, keys in feature_keys.items()}
+
+
+def reused_profiles(cache, profile_keys, topo_dir_path, names):
+    """Cached topography of the ``names`` unchanged since their _topo.dat was written."""
+    reused = {}
+    for name in names:
+        if name in profile_keys and os.path.exists(topo_dir_path + "/" + name + "_topo.dat"):
+            profile = cache.profile(name, profile_keys[name])
+            if profile is not None:
+                reused[name] = profile
+    return reused
+
+
+def finish_incremental(cache, topo_dir_path, profiles, profile_keys, reused, written, feedback, prefix=None,
+                       outputs=()):
+    """Store newly written profiles, remove stale files and report reuse.
+
+    Stale files are the _topo.dat files of profiles not written, all *.bth
+    files (written again) and the OPTIONAL_OUTPUTS of ``prefix`` that are
+    not among the ``outputs`` of this run.
+    """
+    for name in written:
+        if name not in reused:
+            cache.store_profile(name, profile_keys[name], *profiles[name])
+    kept = set(written)
+    for path in glob.glob(topo_dir_path + "/*_topo.dat") + glob.glob(topo_dir_path + "/*.bth"):
+        if not path.endswith('_topo.dat') or os.path.basename(path)[:-len('_topo.dat')] not in kept:
+            os.remove(path)  # pliki bth są tworzone od nowa
+    if prefix is not None:
+        produced = {os.path.abspath(path) for path in outputs if path}
+        for suffix in OPTIONAL_OUTPUTS:
+            path = prefix + suffix
+            if os.path.abspath(path) not in produced and os.path.exists(path):
+                os.remove(path)  # wynik poprzedniego uruchomienia z innymi opcjami
+    cache.prune(written)
+    feedback.pushInfo("Incremental: {} of {} profiles reused".format(len(reused), len(written)))
+
+
+def write_batch_files(topo_dir_path, parent_dir_path, ivp_path, feedback, survey_session=None):
+    """Write balanced *.bth files for all _topo.dat files; returns their count."""
+    dat_files = glob.glob(topo_dir_path + "/*.dat")
+    parent_dir = os.path.basename(parent_dir_path)
+    costs = {}
+    for dat_file in dat_files:  # koszt szacowany na podstawie oryginalnego pliku dat
+        profile = os.path.basename(dat_file)[:-len('_topo.dat')]
+        header = survey_session.header(profile) if survey_session is not None else None
+        if header is not None:
+            costs[dat_file] = batches.estimate_cost(header)
+        else:
+            costs[dat_file] = batches.profile_cost(parent_dir_path + "/" + profile + ".dat")
+    for i, (batch_dat_files, batch_cost) in enumerate(batches.plan_batches(costs)):
+        batches.write_batch(topo_dir_path + "/" + parent_dir + '_' + str(i + 1) + '.bth', batch_dat_files, ivp_path)
+        feedback.pushInfo("Batch {}: {} profiles, estimated cost {:.0f}".format(i + 1, len(batch_dat_files), batch_cost))
+    return len(dat_files)
+
+
+def _wkt_parts(wkt):
+    parts = []
+    for part in re.findall(r'\(([^()]+)\)', wkt):
+        coordinates = np.array([point.split()[:2] for point in part.split(',')], dtype=np.float64)
+        parts.append((coordinates[:, 0], coordinates[:, 1]))
+    return parts
+
+
+def read_lines_csv(path, id_field='ID', wkt_field='WKT'):
+    """Profile lines of a delimited text file with ID and WKT (Multi)LineString columns.
+
+    Returns {ID: [(x, y), ...]} with one vertex array pair per line part.
+    """
+    lines = {}
+    with open(path, newline='') as csv_file:
+        header = csv_file.readline()
+        delimiter = ';' if ';' in header else ('\t' if '\t' in header else ',')
+        columns = next(csv.reader([header], delimiter=delimiter))
+        id_index = columns.index(id_field)
+        wkt_index = columns.index(wkt_field)
+        for values in csv.reader(csv_file, delimiter=delimiter):
+            if len(values) > max(id_index, wkt_index):
+                lines[values[id_index].strip()] = _wkt_parts(values[wkt_index])
+    return lines
+
+
+def points_lines(profile_id, sample):
+    """Rows of the ``;`` separated points table (POINTS_HEADER) for one profile."""
+    columns = np.column_stack([sample.distance, sample.angle, sample.elevation, sample.x, sample.y])
+    return [profile_id + ';' + ';'.join('' if value != value else repr(value) for value in row) + '\n'
+            for row in columns.tolist()]
+
+
+def point_rows(profile_id, sample):
+    """GeoPackage rows (POINT_FIELDS) of the sampled points of one profile, NaN as NULL."""
+    columns = np.column_stack([sample.distance, sample.angle, sample.elevation, sample.x, sample.y])
+    return [[profile_id] + [None if value != value else value for value in row] for row in columns.tolist()]
+
+
+def profile_row(profile_id, sample):
+    """GeoPackage row (PROFILE_FIELDS) summarising one sampled profile line."""
+    valid = sample.elevation[~np.isnan(sample.elevation)]
+    return [profile_id, float(sample.distance[-1]), int(sample.distance.size),
+            float(valid.min()) if valid.size else None, float(valid.max()) if valid.size else None]
+
+
+def open_geopackage(path, srs=None, point_fields=POINT_FIELDS, spatial_index=True):
+    """GeoPackageWriter with the point (GPKG_POINTS) and profile line (GPKG_PROFILES) tables."""
+    writer = gpkg.GeoPackageWriter(path, srs, spatial_index)
+    writer.create_table(GPKG_POINTS, point_fields, 'POINT')
+    writer.create_table(GPKG_PROFILES, PROFILE_FIELDS, 'LINESTRING')
+    return writer
+
+
+def dem_key(source, nodata, transform=None):
+    """Identity of a DEM in the cache fingerprints of Import and Export.
+
+    ``source`` identifies the raster (file_signature or DemMosaic.key),
+    ``nodata`` are the null values of the reader and ``transform`` the
+    (lines CRS, DEM CRS) pair when the lines are reprojected to the DEM.
+    """
+    return source, sorted(nodata), transform
+
+
+def export_survey(parent_dir_path, lines, dem_reader, spacing, topo_dir_path, feedback, instruments,
+                  dem_sampling=0, null_value=None, window=0, filter_type=0, ivp_path='', points_path=None,
+                  cache=None, dem_key=None, curves=None, step=0, dat_electrodes=False, geopackage=None,
+                  ties_path=None, survey_session=None, electrode_range=False, to_dem=None, attab_path=None,
+                  on_sample=None, gpkg_rows=None, on_ties=None):
+    """Export of one survey: sampling, filtering, _topo.dat, .top and .bth files.
+
+    ``lines`` is {ID: parts} or a sequence of ``(ID, parts)`` (one item per
+    line feature); ``to_dem`` maps their x, y arrays to the DEM CRS. With
+    ``points_path`` the sampled points are also written as a table and
+    with ``attab_path`` as the *.attab table of the original script. With
+    a TopoCache of ``topo_dir_path`` the export is incremental: ``dem_key``
+    (see dem_key) identifies the DEM and profiles unchanged since the last
+    run are not sampled or written again. With a TopoCache of ``curves``
+    the points are interpolated from fine curves (see layout_sample);
+    ``dat_electrodes`` places them at the electrodes of the *.dat files.
+    Points and profile lines also go to an open ``geopackage`` (see
+    open_geopackage). With ``ties_path`` the crossings of the lines are
+    written there as tie points (see geophygis.ties). ``electrode_range``
+    keeps the points within the electrodes of each *.dat file; a
+    SurveySession written by Import provides the headers and data block
+    ends without parsing the files again.
+
+    Callers add their own outputs through ``on_sample(index, ID, sample)``
+    called for every sampled line feature, ``gpkg_rows(index, ID, sample)``
+    giving the GeoPackage point rows instead of point_rows and
+    ``on_ties(tie_points, elevation)``. Returns the names of the profiles
+    written.
+    """
+    parent_dir_name = os.path.basename(parent_dir_path)
+    store = topostore.TopoStore()
+    feature_keys = {}
+    line_parts = {}  # linie profili do wyszukania przecięć
+    step = fine_step(dem_reader, step) if curves is not None else 0
+    settings = (dem_key, dem_sampling, step)  # wszystko co wpływa na wysokości próbek
+    points_file = open(points_path, 'w') if points_path is not None else None
+    try:
+        if points_file is not None:
+            points_file.write(POINTS_HEADER)
+        with instruments.stage('densify, sample, write points') as stage:
+            stage.count = 0
+            for index, (profile_id, parts) in enumerate(lines.items() if isinstance(lines, dict) else lines):
+                if feedback.isCanceled():
+                    break
+                if ties_path is not None:
+                    line_parts[profile_id] = parts
+                geometry_key = [np.stack(part).tobytes() for part in parts]
+                layout = (spacing, 0.0, 0.0)
+                if dat_electrodes or electrode_range:
+                    layout = electrode_layout(parent_dir_path + "/" + profile_id + ".dat", parts, spacing,
+                                              survey_session.header(profile_id) if survey_session is not None else None,
+                                              dat_electrodes)
+                curve_key = topocache.fingerprint(*geometry_key, settings) if curves is not None else None
+                compute = lambda: layout_sample(parts, layout, dem_reader, dem_sampling, to_dem, curves, curve_key, step)
+                if cache is None:
+                    sample = compute()
+                else:
+                    key = topocache.fingerprint(*geometry_key, layout, settings)
+                    feature_keys.setdefault(profile_id, []).append(key)
+                    sample = cached_sample(cache, key, compute)
+                if sample is None:
+                    continue
+                if points_file is not None:
+                    points_file.writelines(points_lines(profile_id, sample))
+                if geopackage is not None:
+                    rows = gpkg_rows(index, profile_id, sample) if gpkg_rows is not None else point_rows(profile_id, sample)
+                    geopackage.add_points(GPKG_POINTS, sample.x, sample.y, rows)
+                    geopackage.add_line(GPKG_PROFILES, sample.x, sample.y, profile_row(profile_id, sample))
+                if on_sample is not None:
+                    on_sample(index, profile_id, sample)
+                store_topography(store, profile_id, sample, null_value)
+                stage.count += sample.distance.size
+    finally:
+        if points_file is not None:
+            points_file.close()
+    if ties_path is not None and not feedback.isCanceled():
+        with instruments.stage('tie points') as stage:
+            tie_points = ties.find_ties(line_parts)  # indeks siatkowy odcinków zamiast sprawdzania wszystkich par
+            dem_x, dem_y = to_dem(tie_points.x, tie_points.y) if to_dem is not None else (tie_points.x, tie_points.y)
+            elevation = dem_reader.sample(dem_x, dem_y, dem_sampling)
+            ties.write_ties_csv(ties_path, tie_points, elevation)
+            if geopackage is not None:
+                geopackage.create_table(ties.GPKG_TIES, ties.TIE_FIELDS, 'POINT')
+                geopackage.add_points(ties.GPKG_TIES, tie_points.x, tie_points.y, ties.tie_rows(tie_points, elevation))
+            if on_ties is not None:
+                on_ties(tie_points, elevation)
+            stage.count = len(tie_points.x)
+        feedback.pushInfo("Tie points: {} crossings of {} profiles".format(len(tie_points.x), len(line_parts)))
+    if curves is not None:
+        feedback.pushInfo("Fine topography curves: {} reused, {} sampled every {:g}".format(curves.hits, curves.misses, step))
+    if attab_path is not None:
+        with instruments.stage('attab', len(store)):
+            store.dump_attab(attab_path)
+    reused = {}
+    if cache is not None:
+        profile_keys = profile_fingerprints(parent_dir_path, feature_keys, window, filter_type, null_value)
+        reused = reused_profiles(cache, profile_keys, topo_dir_path, store.ids())
+    with instruments.stage('filter', len(store) - len(reused)):
+        fresh = filter_profiles(store, window, filter_type, feedback, [name for name in store.ids() if name not in reused])
+        profiles = {name: reused[name] if name in reused else fresh[name] for name in store.ids()}
+    with instruments.stage('topo write', len(profiles) - len(reused)):
+        data_ends = {}
+        if survey_session is not None:
+            data_ends = {name: survey_session.data_end(name) for name in profiles if name not in reused}
+        written = topowriter.write_profiles(profiles, parent_dir_path, topo_dir_path,
+                                            topo_dir_path + '/' + parent_dir_name + '.top', feedback, skip=reused,
+                                            data_ends=data_ends)
+    if cache is not None:
+        outputs = [points_path, ties_path, attab_path, instruments.profile_path]
+        if geopackage is not None:
+            outputs.append(geopackage.path)
+        finish_incremental(cache, topo_dir_path, profiles, profile_keys, reused, written, feedback,
+                           topo_dir_path + '/' + parent_dir_name, outputs)
+    if ivp_path:
+        with instruments.stage('batch files') as stage:
+            stage.count = write_batch_files(topo_dir_path, parent_dir_path, ivp_path, feedback, survey_session)
+    if survey_session is not None:
+        feedback.pushInfo("Survey session: {} records used, {} missing or outdated".format(
+            survey_session.hits, survey_session.misses))
+    return written
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Tie points: crossings of profile lines for quasi-3D interpretation.
+
+Line segments are put into a regular grid index (cells of about the
+median segment size, like the tile buckets of geophygis.mosaic); only
+segments of different profiles sharing a grid cell are intersected
+exactly, all at once with NumPy. Chainages are measured along the line
+the way sampling.densify walks it, parts one after another. Collinear
+overlaps of two profiles have no single crossing point and are skipped.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+TIES_HEADER = "ID_1;ID_2;CHAINAGE_1;CHAINAGE_2;x;y;DEM\n"
+TIE_FIELDS = [('ID_1', 'TEXT'), ('ID_2', 'TEXT'), ('CHAINAGE_1', 'REAL'), ('CHAINAGE_2', 'REAL'), ('DEM', 'REAL')]
+GPKG_TIES = 'tie_points'
+
+Segments = namedtuple('Segments', ['line', 'x0', 'y0', 'x1', 'y1', 'chainage'])
+TiePoints = namedtuple('TiePoints', ['id_1', 'id_2', 'chainage_1', 'chainage_2', 'x', 'y'])
+
+
+def line_segments(lines):
+    """Segments of {ID: parts} with their line index and the chainage at the segment start."""
+    line, x0, y0, x1, y1, chainage = [], [], [], [], [], []
+    for i, parts in enumerate(lines.values()):
+        start = 0.0
+        for x, y in parts:
+            x = np.asarray(x, dtype=np.float64)
+            y = np.asarray(y, dtype=np.float64)
+            if x.size < 2:
+                continue
+            length = np.hypot(np.diff(x), np.diff(y))
+            line.append(np.full(length.size, i))
+            x0.append(x[:-1])
+            y0.append(y[:-1])
+            x1.append(x[1:])
+            y1.append(y[1:])
+            chainage.append(start + np.concatenate(([0.0], np.cumsum(length)[:-1])))
+            start += length.sum()  # kolejna część multilinii dalej w pikietażu
+    if not line:
+        empty = np.empty(0)
+        return Segments(np.empty(0, dtype=np.int64), empty, empty, empty, empty, empty)
+    return Segments(*[np.concatenate(a) for a in (line, x0, y0, x1, y1, chainage)])
+
+
+def candidate_pairs(segments, cell=None):
+    """Index pairs (i, j) of segments of different lines whose bounding boxes overlap in a grid cell."""
+    x_min = np.minimum(segments.x0, segments.x1)
+    x_max = np.maximum(segments.x0, segments.x1)
+    y_min = np.minimum(segments.y0, segments.y1)
+    y_max = np.maximum(segments.y0, segments.y1)
+    if x_min.size < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    if cell is None:
+        cell = float(np.median(np.maximum(x_max - x_min, y_max - y_min))) or 1.0
+    gx0 = np.floor((x_min - x_min.min()) / cell).astype(np.int64)
+    gx1 = np.floor((x_max - x_min.min()) / cell).astype(np.int64)
+    gy0 = np.floor((y_min - y_min.min()) / cell).astype(np.int64)
+    gy1 = np.floor((y_max - y_min.min()) / cell).astype(np.int64)
+    ny = gy1 - gy0 + 1
+    counts = (gx1 - gx0 + 1) * ny
+    segment = np.repeat(np.arange(counts.size), counts)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)  # numer komórki w prostokącie odcinka
+    keys = (gx0[segment] + k // ny[segment]) * (int(gy1.max()) + 1) + gy0[segment] + k % ny[segment]
+    order = np.argsort(keys, kind='stable')
+    keys, segment = keys[order], segment[order]
+    bounds = np.flatnonzero(np.diff(keys)) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [keys.size]))
+    first, second = [], []
+    for start, end in zip(starts[ends - starts > 1], ends[ends - starts > 1]):  # tylko komórki z kilkoma odcinkami
+        i, j = np.triu_indices(end - start, 1)
+        first.append(segment[start + i])
+        second.append(segment[start + j])
+    if not first:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    first = np.concatenate(first)
+    second = np.concatenate(second)
+    keep = ((segments.line[first] != segments.line[second])
+            & (x_min[first] <= x_max[second]) & (x_min[second] <= x_max[first])
+            & (y_min[first] <= y_max[second]) & (y_min[second] <= y_max[first]))
+    first, second = first[keep], second[keep]
+    swap = segments.line[first] > segments.line[second]  # niższy indeks linii zawsze pierwszy
+    first, second = np.where(swap, second, first), np.where(swap, first, second)
+    pairs = np.unique(first * np.int64(x_min.size) + second)  # para w kilku wspólnych komórkach
+    return pairs // x_min.size, pairs % x_min.size
+
+
+def find_ties(lines, cell=None):
+    """TiePoints of all crossings of the profile lines {ID: parts}, ordered by ID_1 and CHAINAGE_1."""
+    segments = line_segments(lines)
+    i, j = candidate_pairs(segments, cell)
+    rx, ry = segments.x1[i] - segments.x0[i], segments.y1[i] - segments.y0[i]
+    sx, sy = segments.x1[j] - segments.x0[j], segments.y1[j] - segments.y0[j]
+    qx, qy = segments.x0[j] - segments.x0[i], segments.y0[j] - segments.y0[i]
+    denominator = rx * sy - ry * sx
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (qx * sy - qy * sx) / denominator
+        u = (qx * ry - qy * rx) / denominator
+    hit = (denominator != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+    i, j, t, u = i[hit], j[hit], t[hit], u[hit]
+    line_1, line_2 = segments.line[i], segments.line[j]
+    chainage_1 = segments.chainage[i] + t * np.hypot(rx[hit], ry[hit])
+    chainage_2 = segments.chainage[j] + u * np.hypot(sx[hit], sy[hit])
+    x = segments.x0[i] + t * rx[hit]
+    y = segments.y0[i] + t * ry[hit]
+    # przecięcie w wierzchołku wspólnym dwóch odcinków jest znajdowane dwa razy
+    unique = np.unique(np.column_stack([line_1, line_2, np.round(chainage_1, 6), np.round(chainage_2, 6)]),
+                       axis=0, return_index=True)[1]
+    unique = unique[np.lexsort((line_2[unique], chainage_1[unique], line_1[unique]))]
+    names = np.array(list(lines), dtype=object)
+    return TiePoints(names[line_1[unique]].tolist(), names[line_2[unique]].tolist(), chainage_1[unique],
+                     chainage_2[unique], x[unique], y[unique])
+
+
+def tie_rows(ties, elevation):
+    """Rows of TIE_FIELDS; NaN elevations become None."""
+    return [[id_1, id_2, round(float(c1), 2), round(float(c2), 2), None if z != z else round(float(z), 2)]
+            for id_1, id_2, c1, c2, z in zip(ties.id_1, ties.id_2, ties.chainage_1, ties.chainage_2, elevation)]
+
+
+def write_ties_csv(path, ties, elevation):
+    """Write the tie points with the DEM ``elevation`` at each crossing to ``path``."""
+    with open(path, 'w') as file_out:
+        file_out.write(TIES_HEADER)
+        for row, x, y in zip(tie_rows(ties, elevation), ties.x, ties.y):
+            file_out.write(';'.join(['NULL' if value is None else str(value) for value in row[:4]]
+                                    + ['{:.2f}'.format(x), '{:.2f}'.format(y),
+                                       'NULL' if row[4] is None else str(row[4])]) + '\n')
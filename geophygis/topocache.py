@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Persistent SQLite cache of Export results.
+
+Sampled points are stored per line feature under a fingerprint of its
+geometry and the sampling settings; filtered topography is stored per
+profile ID under a fingerprint of its features, the filter settings and
+the source *.dat file. Unchanged profiles of an incremental Export are
+taken from here instead of being sampled, filtered and written again.
+
+Fine chainage / elevation curves (CURVE_CACHE in the cache folder of the
+survey) do not depend on the spacing, so an Export at another spacing is
+interpolated from them without reading the DEM.
+"""
+
+import os
+import hashlib
+import sqlite3
+
+import numpy as np
+
+CACHE_NAME = '.geophygis_topo.sqlite'
+CURVE_CACHE = 'topo_curves.sqlite'
+CACHE_VERSION = 1  # podbić przy każdej zmianie próbkowania lub filtrowania
+
+_SCHEMA = ["""CREATE TABLE IF NOT EXISTS samples (
+    fingerprint TEXT PRIMARY KEY,
+    version INTEGER,
+    points BLOB)""",
+           """CREATE TABLE IF NOT EXISTS curves (
+    fingerprint TEXT PRIMARY KEY,
+    version INTEGER,
+    points BLOB)""",
+           """CREATE TABLE IF NOT EXISTS profiles (
+    name TEXT PRIMARY KEY,
+    version INTEGER,
+    fingerprint TEXT,
+    points BLOB)"""]
+
+
+def fingerprint(*parts):
+    """Hex digest of the given values (bytes are hashed as they are)."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part if isinstance(part, (bytes, bytearray)) else repr(part).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def file_signature(path):
+    """Path, size and mtime of a file, None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def _pack(columns):
+    return np.ascontiguousarray(np.stack(columns), dtype='<f8').tobytes()
+
+
+def _unpack(blob, n_columns):
+    return np.frombuffer(blob, dtype='<f8').reshape(n_columns, -1)
+
+
+class TopoCache:
+    """Cache of sampled points and filtered topography used by incremental Export."""
+
+    def __init__(self, topo_dir_path, rebuild=False, name=CACHE_NAME):
+        os.makedirs(topo_dir_path, exist_ok=True)
+        self.path = os.path.join(topo_dir_path, name)
+        self.hits = 0
+        self.misses = 0
+        self._used = set()
+        self.connection = sqlite3.connect(self.path)
+        for statement in _SCHEMA:
+            self.connection.execute(statement)
+        if rebuild:
+            self.clear()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def clear(self):
+        with self.connection:
+            self.connection.execute("DELETE FROM samples")
+            self.connection.execute("DELETE FROM curves")
+            self.connection.execute("DELETE FROM profiles")
+
+    def sample(self, key):
+        """Cached ProfileSample columns of a feature fingerprint, None if unknown."""
+        self._used.add(key)
+        entry = self.connection.execute("SELECT points FROM samples WHERE fingerprint = ? AND version = ?",
+                                        (key, CACHE_VERSION)).fetchone()
+        if entry is None:
+            return None
+        return _unpack(entry[0], 5)
+
+    def store_sample(self, key, sample):
+        self._used.add(key)
+        self.connection.execute("INSERT OR REPLACE INTO samples VALUES (?,?,?)", (key, CACHE_VERSION, _pack(sample)))
+
+    def curve(self, key):
+        """Cached fine ``(distance, elevation)`` curve of a feature, None if unknown."""
+        entry = self.connection.execute("SELECT points FROM curves WHERE fingerprint = ? AND version = ?",
+                                        (key, CACHE_VERSION)).fetchone()
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        distance, elevation = _unpack(entry[0], 2)
+        return distance, elevation
+
+    def store_curve(self, key, distance, elevation):
+        self.connection.execute("INSERT OR REPLACE INTO curves VALUES (?,?,?)",
+                                (key, CACHE_VERSION, _pack([distance, elevation])))
+
+    def profile(self, name, key):
+        """Cached ``(distance, elevation)`` of a profile if its fingerprint matches."""
+        entry = self.connection.execute("SELECT points FROM profiles WHERE name = ? AND fingerprint = ? AND version = ?",
+                                        (name, key, CACHE_VERSION)).fetchone()
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        distance, elevation = _unpack(entry[0], 2)
+        return distance, elevation
+
+    def store_profile(self, name, key, distance, elevation):
+        self.connection.execute("INSERT OR REPLACE INTO profiles VALUES (?,?,?,?)",
+                                (name, CACHE_VERSION, key, _pack([distance, elevation])))
+
+    def prune(self, names):
+        """Drop profiles not in ``names`` and samples not used in this run."""
+        keep = set(names)
+        with self.connection:
+            stored = [row[0] for row in self.connection.execute("SELECT name FROM profiles")]
+            self.connection.executemany("DELETE FROM profiles WHERE name = ?",
+                                        [(name,) for name in stored if name not in keep])
+            stored = [row[0] for row in self.connection.execute("SELECT fingerprint FROM samples")]
+            self.connection.executemany("DELETE FROM samples WHERE fingerprint = ?",
+                                        [(key,) for key in stored if key not in self._used])
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+In-memory columnar store of sampled topography, one entry per profile ID.
+"""
+
+import numpy as np
+
+
+class TopoStore:
+    """Chainage and elevation columns (float64) grouped by profile ID.
+
+    Chunks are collected with ``add`` and concatenated lazily; ``profile``
+    returns the points of one profile sorted by chainage.
+    """
+
+    def __init__(self):
+        self._chunks = {}
+        self._profiles = {}
+
+    def add(self, profile_id, distance, elevation):
+        self._chunks.setdefault(profile_id, []).append(
+            (np.asarray(distance, dtype=np.float64), np.asarray(elevation, dtype=np.float64)))
+        self._profiles.pop(profile_id, None)
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def __contains__(self, profile_id):
+        return profile_id in self._chunks
+
+    def ids(self):
+        """Profile IDs in sorted order."""
+        return sorted(self._chunks)
+
+    def profile(self, profile_id):
+        """Return ``(distance, elevation)`` sorted by distance, then elevation."""
+        if profile_id not in self._profiles:
+            chunks = self._chunks[profile_id]
+            distance = np.concatenate([chunk[0] for chunk in chunks])
+            elevation = np.concatenate([chunk[1] for chunk in chunks])
+            order = np.lexsort((elevation, distance))
+            self._profiles[profile_id] = (distance[order], elevation[order])
+        return self._profiles[profile_id]
+
+    def dump_attab(self, path):
+        """Write the store as the tab separated ID / distance / DEM table (debug only)."""
+        with open(path, 'w') as attab_file:
+            for profile_id in self.ids():
+                distance, elevation = self.profile(profile_id)
+                attab_file.writelines("{}\t{}\t{}\n".format(profile_id, d, e)
+                                      for d, e in zip(distance.tolist(), elevation.tolist()))
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Writer of Res2DInv *_topo.dat files and the collective *.top file.
+
+The data block of the original *.dat is copied byte for byte in large
+chunks, only the closing zeros are cut off; the topography block is
+formatted for the whole profile at once.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+CHUNK_SIZE = 1 << 20
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+TOPO_END = '0\n0\n0\n0\n0\n'
+
+
+def data_block_end(file, size):
+    """Offset where the closing block of '0' (and empty) lines starts."""
+    window = 4096
+    while True:
+        start = max(size - window, 0)
+        file.seek(start)
+        tail = file.read(size - start)
+        lines = tail.split(b'\n')
+        pos = len(tail)
+        for i in range(len(lines) - 1, -1, -1):
+            if i == 0 and start > 0:
+                break  # linia może sięgać poza okno - większe okno
+            line = lines[i]
+            if line.strip() not in (b'0', b''):
+                return start + min(pos + 1, len(tail))  # razem ze znakiem końca linii
+            pos -= len(line) + 1
+        else:
+            return 0
+        window *= 4
+
+
+def format_topography(distance, elevation):
+    """Topography rows 'distance<TAB>elevation' with elevation rounded to 3 places."""
+    distance = np.asarray(distance, dtype=np.float64)
+    elevation = np.round(np.asarray(elevation, dtype=np.float64), 3)
+    if distance.size == 0:
+        return ''
+    rows = np.char.add(np.char.add(distance.astype(str), '\t'), elevation.astype(str))
+    return '\n'.join(rows.tolist()) + '\n'
+
+
+def write_topo_dat(dat_path, topo_path, distance, elevation, end=None):
+    """Write ``topo_path`` from ``dat_path`` and return the formatted topography.
+
+    ``end`` is the known offset of the closing zeros (see geophygis.session).
+    """
+    topography = format_topography(distance, elevation)
+    with open(dat_path, 'rb') as source, open(topo_path, 'wb') as target:
+        size = os.fstat(source.fileno()).st_size
+        if end is None or end > size:
+            end = data_block_end(source, size)
+        source.seek(0)
+        remaining = end
+        while remaining > 0:  # kopiowanie bloku danych w dużych porcjach
+            chunk = source.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            target.write(chunk)
+            remaining -= len(chunk)
+        newline = '\n'
+        if end > 0:
+            source.seek(max(end - 2, 0))
+            last = source.read(2)
+            if last.endswith(b'\r\n'):
+                newline = '\r\n'  # zachowanie końców linii pliku źródłowego
+            elif not last.endswith(b'\n'):
+                target.write(b'\n')
+        block = '2\n' + str(len(np.atleast_1d(distance))) + '\n' + topography + TOPO_END
+        target.write(block.replace('\n', newline).encode())
+    return topography
+
+
+def write_profiles(profiles, dat_dir, topo_dir, top_path, feedback, workers=DEFAULT_WORKERS, skip=(), data_ends=None):
+    """Write *_topo.dat files for ``profiles`` ({name: (distance, elevation)}) in parallel.
+
+    The collective *.top file is assembled afterwards in ``profiles`` order.
+    Profiles in ``skip`` already have an up to date _topo.dat and only go
+    to the *.top file; ``data_ends`` gives known data block ends by name.
+    Returns the names written successfully.
+    """
+    data_ends = data_ends or {}
+    def write(name):
+        distance, elevation = profiles[name]
+        if name in skip:
+            return format_topography(distance, elevation)
+        return write_topo_dat(dat_dir + '/' + name + '.dat', topo_dir + '/' + name + '_topo.dat', distance, elevation,
+                              data_ends.get(name))
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = [(name, executor.submit(write, name)) for name in profiles]
+        written = []
+        with open(top_path, 'w') as topx_file:
+            for name, future in futures:  # stała kolejność w pliku zbiorczym
+                try:
+                    topography = future.result()
+                except Exception:
+                    feedback.pushInfo("Profile not found: " + name)
+                    continue
+                topx_file.write("TOPO of:" + name + "\n")
+                topx_file.write(topography)
+                topx_file.write("###\n")
+                written.append(name)
+    return written
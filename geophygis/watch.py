@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Watch mode of Import: follow a survey folder during acquisition.
+
+New and modified *.dat / *.2dm files are noticed through inotify on Linux
+and by polling the folder elsewhere. A file is taken only after its size
+and modification time stayed the same for ``settle`` seconds, so profiles
+still being copied are not parsed half written. Metadata is read through
+survey.read_metadata, i.e. with the same scanner and metadata index as a
+normal Import, which parses only the profiles that changed; the session
+records Export reads from the index (see geophygis.session) are stored in
+the same update, before ``on_update`` is called.
+"""
+
+import os
+import sys
+import time
+import ctypes
+import select
+import tempfile
+
+from geophygis import survey
+
+WATCH_EXTENSIONS = ('.dat', '.2dm')
+META_LIVE = '_meta_live.csv'
+DOCSHEET_LIVE = '_docsheet_live.csv'
+GPKG_LIVE = '_live.gpkg'
+LIVE_TABLE = 'profiles'
+
+# stałe z <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+IN_EVENTS = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+def _inotify_fd(folder):
+    """Non-blocking inotify descriptor watching ``folder``, None where inotify is not available."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        init, add_watch = libc.inotify_init1, libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    fd = init(IN_NONBLOCK | IN_CLOEXEC)
+    if fd < 0:
+        return None
+    if add_watch(fd, os.fsencode(folder), IN_EVENTS) < 0:  # np. wyczerpany limit max_user_watches
+        os.close(fd)
+        return None
+    return fd
+
+
+def folder_state(folder):
+    """Size and mtime of the *.dat / *.2dm files of every profile: ``{ID: ((ext, size, mtime), ...)}``."""
+    state = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            stem, extension = os.path.splitext(entry.name)
+            if extension.lower() in WATCH_EXTENSIONS and entry.is_file():
+                stat = entry.stat()
+                state.setdefault(stem.upper(), []).append((extension.lower(), stat.st_size, stat.st_mtime_ns))
+    return {name: tuple(sorted(files)) for name, files in state.items()}
+
+
+class FolderWatcher:
+    """Profiles of a folder whose files were added, modified or removed since the last call."""
+
+    def __init__(self, folder, settle=1.0):
+        self.folder = folder
+        self.settle = settle
+        self.state = folder_state(folder)
+        self._pending = {}  # ID: (stan plików, czas pierwszej obserwacji)
+        self._fd = _inotify_fd(folder)
+
+    @property
+    def uses_inotify(self):
+        return self._fd is not None
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _wait(self, timeout):
+        if self._fd is None:
+            time.sleep(timeout)
+            return
+        ready = select.select([self._fd], [], [], timeout)[0]
+        if ready:
+            try:
+                while os.read(self._fd, 65536):  # opróżnienie kolejki - zdarzenia tylko budzą pętlę
+                    pass
+            except BlockingIOError:
+                pass
+
+    def changes(self, timeout):
+        """Wait up to ``timeout`` seconds; returns the sets of (changed, removed) profile IDs."""
+        self._wait(min(timeout, self.settle) if self._pending else timeout)
+        now = time.monotonic()
+        current = folder_state(self.folder)
+        changed, removed = set(), set()
+        for name in set(current) | set(self.state):
+            files = current.get(name)
+            if files == self.state.get(name):
+                self._pending.pop(name, None)
+                continue
+            pending = self._pending.get(name)
+            if pending is None or pending[0] != files:
+                self._pending[name] = (files, now)  # plik jeszcze się kopiuje
+            elif now - pending[1] >= self.settle:
+                del self._pending[name]
+                if files is None:
+                    removed.add(name)
+                    del self.state[name]
+                else:
+                    changed.add(name)
+                    self.state[name] = files
+        return changed, removed
+
+
+def write_live(path, write, *args):
+    """Replace ``path`` with the output of ``write(temp_path, *args)`` at once."""
+    handle, temp_path = tempfile.mkstemp(suffix=os.path.splitext(path)[1], dir=os.path.dirname(path))
+    os.close(handle)
+    try:
+        write(temp_path, *args)
+        os.replace(temp_path, path)  # czytelnik widzi stary albo nowy plik, nigdy w połowie zapisany
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def watch_survey(parent_dir_path, flag2dm, feedback, on_update, workers=1, interval=2.0, settle=1.0):
+    """Keep the metadata of a survey folder current until the feedback is cancelled.
+
+    ``on_update(data, changed, removed)`` gets the metadata of all profiles
+    ({ID: row}), the IDs parsed again and the IDs no longer in the folder.
+    It is called once for the whole folder when watching starts.
+    """
+    with FolderWatcher(parent_dir_path, settle) as watcher:
+        feedback.pushInfo('Watching {} ({}); cancel to stop'.format(
+            parent_dir_path, 'inotify' if watcher.uses_inotify else 'polling every {:g} s'.format(interval)))
+        data = survey.read_metadata(parent_dir_path, survey.profile_names(parent_dir_path), flag2dm, feedback,
+                                    workers=workers)[0]
+        on_update(data, set(data), set())
+        while not feedback.isCanceled():
+            changed, removed = watcher.changes(interval)
+            if not changed and not removed:
+                continue
+            start = time.perf_counter()
+            data, parsed = survey.read_metadata(parent_dir_path, survey.profile_names(parent_dir_path), flag2dm,
+                                                feedback, workers=workers)
+            removed = (removed | changed) - set(data)  # np. usunięty *.dat przy pozostawionym *.2dm
+            changed = changed & set(data)
+            on_update(data, changed, removed)
+            feedback.pushInfo('Live update: {} changed, {} removed, {} parsed in {:.2f} s'.format(
+                len(changed), len(removed), parsed, time.perf_counter() - start))
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+"""Stand-in for Res2DInv: behaves according to the name of the batch file it gets."""
+
+import os
+import sys
+import time
+
+bth_path = sys.argv[-1]
+name = os.path.splitext(os.path.basename(bth_path))[0]
+if 'fail' in name:
+    sys.stderr.write('Error reading ' + bth_path + '\n')
+    sys.exit(2)
+if 'slow' in name:
+    time.sleep(float(os.environ.get('FAKE_RES2DINV_SLEEP', '5')))
+with open(name + '.done', 'w') as done:  # w folderze roboczym, czyli obok *.bth
+    done.write(bth_path)
+print('Inverted ' + bth_path)
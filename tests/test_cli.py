@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+
+from geophygis import cli
+
+
+def test_new_folder_never_reuses_an_existing_one(tmp_path):
+    path = str(tmp_path / 'TOPO_(1710_120000)')
+    assert cli._new_folder(path) == path
+    assert cli._new_folder(path) == path + '_2'
+    assert cli._new_folder(path) == path + '_3'
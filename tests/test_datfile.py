@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+from conftest import DATA_DIR
+from geophygis import datfile
+
+
+def test_three_column_header():
+    header = datfile.read_dat_header(os.path.join(DATA_DIR, 'WENNER.dat'))
+    assert header == datfile.DatHeader(30, 5, 1, 'Wenner-Alpha', 5, 20, 7)
+
+
+def test_four_column_header():
+    header = datfile.read_dat_header(os.path.join(DATA_DIR, 'DD.dat'))
+    assert header == datfile.DatHeader(25, 5, 3, 'Dipole-dipole', 0, 10, 5)
+
+
+def test_long_fields_and_windows_line_ends():
+    with open(os.path.join(DATA_DIR, 'WENNER.dat'), 'rb') as dat:
+        raw = dat.read().replace(b' 20.000  5.000', b' 20.0000000000001  5.000').replace(b'\n', b'\r\n')
+    assert datfile.parse_dat_bytes(raw) == datfile.DatHeader(30, 5, 1, 'Wenner-Alpha', 5, 20, 7)
+
+
+def test_no_datum_points():
+    with pytest.raises(ValueError):
+        datfile.parse_dat_bytes(b'EMPTY\n5\n1\n0\n0\n0\n0\n0\n0\n')
+
+
+def test_profile_length():
+    assert datfile.profile_length(2, 5, 0, 100) == 105
+    assert datfile.profile_length(8, 5, 0, 100) == -999
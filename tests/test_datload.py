@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pytest
+
+from conftest import DATA_DIR
+from geophygis import datload
+
+
+def read_raw(name):
+    with open(os.path.join(DATA_DIR, name), 'rb') as dat:
+        return dat.read()
+
+
+def test_parse_three_column_array():
+    data = datload.parse_dat_rows(read_raw('WENNER.dat'))
+    assert (data.name, data.base_spacing, data.array_type, data.x_location, data.ip_flag) == ('WENNER', 5, 1, 0, 0)
+    np.testing.assert_allclose(data.rows['x'], [5, 10, 15, 20, 5, 10, 5])
+    np.testing.assert_allclose(data.rows['a'], [5, 5, 5, 5, 10, 10, 15])
+    np.testing.assert_allclose(data.rows['n'], 1)
+    np.testing.assert_allclose(data.rows['rho'], [100, 110, 120, 130, 140, 150, 160])
+    assert np.isnan(data.rows['ip']).all()
+
+
+def test_parse_four_column_array():
+    data = datload.parse_dat_rows(read_raw('DD.dat'))
+    np.testing.assert_allclose(data.rows['n'], [1, 1, 1, 2, 2])
+    np.testing.assert_allclose(data.rows['rho'], [100, 110, -5, 120, 130])
+
+
+def test_datum_count_different_from_header_keeps_all_rows():
+    raw = read_raw('WENNER.dat').replace(b'\n7\n', b'\n5\n', 1)
+    assert datload.parse_dat_rows(raw).rows.size == 7
+
+
+def test_malformed_row_is_not_dropped():
+    raw = read_raw('WENNER.dat').replace(b' 20.000  5.000  130.0', b' 20.000  5.000  13O.0')
+    with pytest.raises(ValueError):
+        datload.parse_dat_rows(raw)
+
+
+def test_load_dat_cache(tmp_path):
+    path = tmp_path / 'P1.dat'
+    path.write_bytes(read_raw('DD.dat'))
+    first = datload.load_dat(str(path))
+    cached = datload.load_dat(str(path))
+    assert isinstance(cached.rows, np.memmap)
+    for field in datload.DAT_DTYPE.names:
+        np.testing.assert_array_equal(cached.rows[field], first.rows[field])
+    assert cached[:5] == first[:5]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+
+from geophygis import gpkg
+
+
+def test_table_fields_rename_reserved_columns():
+    fields = [('ID', 'TEXT'), ('fid', 'INTEGER'), ('GEOM', 'TEXT'), ('RHO', 'REAL')]
+    assert gpkg.table_fields(fields) == [('ID', 'TEXT'), ('fid_1', 'INTEGER'), ('GEOM_1', 'TEXT'), ('RHO', 'REAL')]
+
+
+def test_column_value():
+    assert [gpkg.column_value(value) for value in [None, 3, 2.5, 'P1', True]] == [None, 3, 2.5, 'P1', True]
+    assert gpkg.column_value(datetime.date(2026, 10, 17), datetime.date.isoformat) == '2026-10-17'
+    assert gpkg.column_value(datetime.date(2026, 10, 17)) == '2026-10-17'
+
+
+def test_srs_row():
+    assert gpkg.srs_row(2180, 'ETRF2000-PL / CS92', 'EPSG:2180', 'WKT') == (2180, 'ETRF2000-PL / CS92', 'EPSG', 2180, 'WKT')
+    assert gpkg.srs_row(100000, 'custom', '', 'WKT')[2] == 'NONE'
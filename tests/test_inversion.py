@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import stat
+import time
+
+import pytest
+
+from geophygis import inversion
+
+FAKE_RES2DINV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_res2dinv.py')
+
+
+class Feedback:
+    def __init__(self, cancel_after=None):
+        self.cancel_after = cancel_after
+        self.started = time.monotonic()
+        self.errors = []
+        self.progress = []
+
+    def isCanceled(self):
+        return self.cancel_after is not None and time.monotonic() - self.started > self.cancel_after
+
+    def setProgress(self, progress):
+        self.progress.append(progress)
+
+    def pushInfo(self, text):
+        pass
+
+    def reportError(self, text, fatalError=False):
+        self.errors.append(text)
+
+
+def batch_files(folder, *names):
+    paths = []
+    for name in names:
+        path = folder / (name + '.bth')
+        path.write_text('')
+        paths.append(str(path))
+    return paths
+
+
+def test_argument_list_command(tmp_path):
+    paths = batch_files(tmp_path, 'S1_1', 'S1_fail', 'S1_2')
+    feedback = Feedback()
+    jobs = inversion.run_inversions([sys.executable, FAKE_RES2DINV], paths, feedback, workers=2)
+    assert [job.bth_path for job in jobs] == paths
+    assert [job.status for job in jobs] == ['ok', 'failed', 'ok']
+    assert jobs[1].returncode == 2
+    assert 'Error reading' in jobs[1].stderr and 'Inverted' in jobs[0].stdout
+    assert (tmp_path / 'S1_1.done').exists() and not (tmp_path / 'S1_fail.done').exists()
+    assert feedback.errors and feedback.progress[-1] == 100
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='shebang script')
+def test_path_command(tmp_path):
+    executable = tmp_path / 'res2dinv'
+    executable.write_text('#!{}\nexec(open({!r}).read())\n'.format(sys.executable, FAKE_RES2DINV))
+    executable.chmod(executable.stat().st_mode | stat.S_IXUSR)
+    jobs = inversion.run_inversions(str(executable), batch_files(tmp_path, 'S1_1'), Feedback())
+    assert jobs[0].status == 'ok'
+
+
+def test_missing_executable(tmp_path):
+    feedback = Feedback()
+    jobs = inversion.run_inversions(str(tmp_path / 'missing'), batch_files(tmp_path, 'S1_1'), feedback)
+    assert jobs[0].status == 'error' and jobs[0].returncode is None
+    assert feedback.errors
+
+
+def test_timeout_kills_the_job(tmp_path, monkeypatch):
+    monkeypatch.setenv('FAKE_RES2DINV_SLEEP', '30')
+    start = time.monotonic()
+    jobs = inversion.run_inversions([sys.executable, FAKE_RES2DINV], batch_files(tmp_path, 'S1_slow', 'S1_1'),
+                                    Feedback(), timeout=1)
+    assert [job.status for job in jobs] == ['timeout', 'ok']
+    assert time.monotonic() - start < 20
+    assert not (tmp_path / 'S1_slow.done').exists()
+
+
+def test_cancel_kills_running_and_skips_queued(tmp_path, monkeypatch):
+    monkeypatch.setenv('FAKE_RES2DINV_SLEEP', '30')
+    jobs = inversion.run_inversions([sys.executable, FAKE_RES2DINV], batch_files(tmp_path, 'S1_slow', 'S1_1'),
+                                    Feedback(cancel_after=0.5))
+    assert [job.status for job in jobs] == ['canceled', 'canceled']
+    assert jobs[1].returncode is None
+
+
+def test_summary():
+    jobs = [inversion.InversionJob('a.bth', 'ok', 0, 2.0, '', ''),
+            inversion.InversionJob('b.bth', 'failed', 1, 4.0, '', ''),
+            inversion.InversionJob('c.bth', 'canceled', None, 0.0, '', '')]
+    assert inversion.summary(jobs) == ('Inversions: 1 canceled, 1 failed, 1 ok; '
+                                       'duration min 2.0 s, mean 3.0 s, max 4.0 s, total 6.0 s')
+    assert inversion.summary([]) == 'No inversions run'
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pytest
+
+from conftest import DATA_DIR
+from geophygis import invfile
+
+MODEL_PATH = os.path.join(DATA_DIR, 'model.inv')
+CHAINAGE = [1.25, 3.75, 6.25, 8.75, 1.25, 3.75, 6.25, 8.75, 3.75, 6.25]
+DEPTH = [0.625] * 4 + [1.97] * 4 + [3.52] * 2
+
+
+def test_iteration_offsets_skip_the_header():
+    markers = [line for offset, line in invfile.iteration_offsets(MODEL_PATH)]
+    assert [line.split()[:2] for line in markers] == [[b'Iteration', b'1'], [b'Iteration', b'2'], [b'Iteration', b'3']]
+
+
+def test_block_geometry_of_the_header():
+    with open(MODEL_PATH, 'rb') as inv:
+        header = inv.read().split(b'Iteration 1')[0].split(b'\n')
+    chainage, depth = invfile.block_geometry(header)
+    np.testing.assert_allclose(chainage, CHAINAGE)
+    np.testing.assert_allclose(depth, DEPTH)
+
+
+def test_read_final_model():
+    model = invfile.read_final_model(MODEL_PATH)
+    assert model.name == 'model'
+    assert model.iteration == 3
+    assert model.rms == pytest.approx(3.21)
+    np.testing.assert_allclose(model.chainage, CHAINAGE)
+    np.testing.assert_allclose(model.depth, DEPTH)
+    np.testing.assert_allclose(model.rho, [95.5, 105.25, 120.0, 131.0, 139.4, 151.6, 163.2, 172.8, 183.9, 187.3])
+
+
+def test_read_final_model_without_iterations(tmp_path):
+    path = tmp_path / 'empty.inv'
+    path.write_text('Title\nNumber of iterations\n 0\n')
+    assert invfile.read_final_model(str(path)) is None
+
+
+def test_read_final_model_with_a_short_iteration(tmp_path):
+    path = tmp_path / 'P1_topo.inv'
+    with open(MODEL_PATH) as inv:
+        path.write_text(inv.read().split('Iteration 2')[0] + 'Iteration 2\n 95.5\n 105.2\n')
+    with pytest.raises(ValueError, match='2 resistivities for 10 blocks'):
+        invfile.read_final_model(str(path))
+
+
+def test_read_final_model_without_block_geometry(tmp_path):
+    path = tmp_path / 'P1.inv'
+    path.write_text('P1\nNumber of layers\n 1\nIteration 1\n 95.5\n')
+    with pytest.raises(ValueError, match='number of blocks'):
+        invfile.read_final_model(str(path))
+
+
+def test_place_model_along_line_with_topography():
+    model = invfile.read_final_model(MODEL_PATH)
+    parts = [(np.array([0.0, 10.0]), np.array([0.0, 0.0]))]
+    points = invfile.place_model(model, parts, (np.array([0.0, 10.0]), np.array([100.0, 110.0])))
+    np.testing.assert_allclose(points.x, CHAINAGE)
+    np.testing.assert_allclose(points.y, 0.0)
+    np.testing.assert_allclose(points.elevation, 100 + np.array(CHAINAGE) - np.array(DEPTH))
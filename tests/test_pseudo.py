@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pytest
+
+from conftest import DATA_DIR
+from geophygis import pseudo, datload
+
+ONE = np.array([1.0])
+
+
+@pytest.mark.parametrize('array_type, k', [
+    (1, 2 * np.pi),  # Wenner-Alpha
+    (2, 2 * np.pi),  # Pole-Pole
+    (3, 6 * np.pi),  # Dipole-dipole n = 1: pi n (n + 1) (n + 2) a
+    (4, 6 * np.pi),  # Wenner-Beta
+    (5, 3 * np.pi),  # Wenner-Gamma
+    (6, 4 * np.pi),  # Pole-dipole n = 1: 2 pi n (n + 1) a
+    (7, 2 * np.pi),  # Schlumberger n = 1: pi n (n + 1) a
+])
+def test_geometric_factor(array_type, k):
+    assert pseudo.geometric_factor(array_type, ONE, ONE)[0] == pytest.approx(k)
+
+
+def test_geometric_factor_scales_with_spacing_and_n():
+    a = np.array([2.0, 2.0, 2.0])
+    n = np.array([1.0, 2.0, 3.0])
+    np.testing.assert_allclose(pseudo.geometric_factor(3, a, n), np.pi * n * (n + 1) * (n + 2) * a)
+    np.testing.assert_allclose(pseudo.geometric_factor(7, a, n), np.pi * n * (n + 1) * a)
+    np.testing.assert_allclose(pseudo.geometric_factor(6, -a, n), pseudo.geometric_factor(6, a, n))
+
+
+@pytest.mark.parametrize('array_type, n, depth', [
+    (1, 1, 0.519),  # Edwards (1977)
+    (2, 1, 0.867),
+    (3, 1, 0.416),
+    (3, 2, 0.697),
+    (3, 3, 0.962),
+    (4, 1, 0.416),
+    (5, 1, 0.594),
+    (6, 1, 0.519),
+    (7, 1, 0.519),
+])
+def test_median_depth(array_type, n, depth):
+    assert pseudo.median_depth(array_type, ONE, np.array([float(n)]))[0] == pytest.approx(depth, abs=2e-3)
+
+
+def test_median_depth_scales_with_spacing():
+    np.testing.assert_allclose(pseudo.median_depth(1, np.array([5.0]), ONE), 5 * pseudo.median_depth(1, ONE, ONE))
+
+
+def test_unknown_array():
+    with pytest.raises(ValueError):
+        pseudo.geometric_factor(9, ONE, ONE)
+
+
+def test_pseudo_section_of_rows():
+    rows = datload.parse_dat_rows(open(os.path.join(DATA_DIR, 'DD.dat'), 'rb').read()).rows
+    section = pseudo.pseudo_section(3, 0, rows)
+    np.testing.assert_allclose(section['k'], np.pi * rows['n'] * (rows['n'] + 1) * (rows['n'] + 2) * 5)
+    np.testing.assert_allclose(section['x'], rows['x'] + 5 * (rows['n'] + 2) / 2)
+    np.testing.assert_allclose(section['depth'][:3], 5 * 0.416, atol=0.01)
+    assert section['depth'][3] > section['depth'][0]
+    np.testing.assert_allclose(pseudo.pseudo_section(3, 1, rows)['x'], rows['x'])
+
+
+def test_load_pseudo_cache_and_stats(tmp_path):
+    path = tmp_path / 'P1.dat'
+    with open(os.path.join(DATA_DIR, 'WENNER.dat'), 'rb') as dat:
+        path.write_bytes(dat.read())
+    first = pseudo.load_pseudo(str(path))
+    cached = pseudo.load_pseudo(str(path))
+    assert isinstance(cached, np.memmap)
+    np.testing.assert_array_equal(cached['k'], first['k'])
+    assert os.listdir(str(tmp_path / datload.CACHE_DIR / pseudo.CACHE_SUBFOLDER))
+    assert pseudo.pseudo_stats(first) == [2.6, 7.79, 31.42, 94.25]
+    assert pseudo.pseudo_stats(first[:0]) == [None, None, None, None]
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+
+from conftest import DATA_DIR
+from geophygis import session, survey, datfile
+
+
+class Feedback:
+    def isCanceled(self):
+        return False
+
+    def setProgress(self, progress):
+        pass
+
+    def pushInfo(self, text):
+        pass
+
+    def reportError(self, text, fatalError=False):
+        raise AssertionError(text)
+
+
+def test_read_record():
+    path = os.path.join(DATA_DIR, 'WENNER.dat')
+    size, mtime, header, data_end = session.read_record(path)
+    assert size == os.path.getsize(path)
+    assert datfile.DatHeader(*header) == datfile.read_dat_header(path)
+    with open(path, 'rb') as dat:
+        assert dat.read()[data_end:].split() == [b'0'] * 4
+
+
+def test_session_follows_the_metadata_index(tmp_path):
+    shutil.copy(os.path.join(DATA_DIR, 'WENNER.dat'), str(tmp_path / 'P1.dat'))
+    assert session.SurveySession.load(str(tmp_path)).header('P1') is None
+    survey.read_metadata(str(tmp_path), ['P1'], False, Feedback())
+    shutil.copy(os.path.join(DATA_DIR, 'DD.dat'), str(tmp_path / 'P2.dat'))
+    survey.read_metadata(str(tmp_path), ['P1', 'P2'], False, Feedback())  # nowy profil jak w trybie obserwacji
+    survey_session = session.SurveySession.load(str(tmp_path))
+    assert survey_session.header('P1') == datfile.read_dat_header(str(tmp_path / 'P1.dat'))
+    assert survey_session.header('P2').array_type == 3
+    os.utime(str(tmp_path / 'P1.dat'), ns=(0, 0))  # tylko dotknięty - rekord z indeksu nadal ważny
+    survey.read_metadata(str(tmp_path), ['P1', 'P2'], False, Feedback())
+    assert session.SurveySession.load(str(tmp_path)).header('P1') is not None
+    with open(str(tmp_path / 'P2.dat'), 'a') as dat:
+        dat.write('\n')
+    assert session.SurveySession.load(str(tmp_path)).header('P2') is None
+
+
+def test_session_counts_each_profile_once(tmp_path):
+    shutil.copy(os.path.join(DATA_DIR, 'WENNER.dat'), str(tmp_path / 'P1.dat'))
+    shutil.copy(os.path.join(DATA_DIR, 'DD.dat'), str(tmp_path / 'P2.dat'))
+    survey.read_metadata(str(tmp_path), ['P1'], False, Feedback())
+    survey_session = session.SurveySession.load(str(tmp_path))
+    for name in ['P1', 'P2', 'P3']:
+        survey_session.header(name)
+        survey_session.data_end(name)
+        survey_session.header(name)
+    assert (survey_session.hits, survey_session.misses) == (1, 2)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from geophygis import survey, topocache, topostore
+
+
+class Feedback:
+    def __init__(self):
+        self.messages = []
+
+    def isCanceled(self):
+        return False
+
+    def pushInfo(self, text):
+        self.messages.append(text)
+
+    def reportError(self, text, fatalError=False):
+        self.messages.append(text)
+
+
+def test_finish_incremental_removes_outputs_of_earlier_runs(tmp_path):
+    topo_dir = tmp_path / survey.INCREMENTAL_DIR
+    topo_dir.mkdir()
+    for name in ['P1_topo.dat', 'P2_topo.dat', 'S1_1.bth', 'S1.gpkg', 'S1_points.csv', 'S1_ties.csv', 'S1.top']:
+        (topo_dir / name).write_text('old')
+    profile = (np.array([0.0, 1.0]), np.array([10.0, 11.0]))
+    with topocache.TopoCache(str(topo_dir)) as cache:
+        survey.finish_incremental(cache, str(topo_dir), {'P1': profile}, {'P1': 'key'}, {}, ['P1'], Feedback(),
+                                  str(topo_dir / 'S1'), [str(topo_dir / 'S1_ties.csv'), None])
+        assert cache.profile('P1', 'key') is not None
+    assert sorted(path.name for path in topo_dir.iterdir() if not path.name.startswith('.')) == [
+        'P1_topo.dat', 'S1.top', 'S1_ties.csv']
+
+
+def test_store_topography_keeps_zero_elevation_without_null_value():
+    sample = survey.ProfileSample(np.array([0.0, 1.0, 2.0]), None, None, None, np.array([0.0, np.nan, 5.0]))
+    store = topostore.TopoStore()
+    survey.store_topography(store, 'P1', sample)
+    np.testing.assert_array_equal(store.profile('P1')[1], [0.0, 5.0])
+    survey.store_topography(store, 'P2', sample, null_value=0)
+    np.testing.assert_array_equal(store.profile('P2')[1], [5.0])
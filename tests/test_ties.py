@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+
+import numpy as np
+import pytest
+
+from geophygis import ties
+
+
+def line(*points):
+    points = np.array(points, dtype=np.float64)
+    return [(points[:, 0], points[:, 1])]
+
+
+def brute_force(lines):
+    segments = ties.line_segments(lines)
+    found = set()
+    for i, j in itertools.combinations(range(segments.line.size), 2):
+        if segments.line[i] == segments.line[j]:
+            continue
+        p = np.array([segments.x0[i], segments.y0[i]])
+        r = np.array([segments.x1[i], segments.y1[i]]) - p
+        q = np.array([segments.x0[j], segments.y0[j]])
+        s = np.array([segments.x1[j], segments.y1[j]]) - q
+        denominator = r[0] * s[1] - r[1] * s[0]
+        if denominator == 0:
+            continue
+        t = ((q - p)[0] * s[1] - (q - p)[1] * s[0]) / denominator
+        u = ((q - p)[0] * r[1] - (q - p)[1] * r[0]) / denominator
+        if 0 <= t <= 1 and 0 <= u <= 1:
+            x, y = p + t * r
+            found.add((round(x, 6), round(y, 6)))
+    return found
+
+
+def test_crossing_chainages():
+    lines = {'A': line((0, 0), (10, 0), (10, 10)), 'B': line((5, -5), (5, 5)), 'C': line((0, 5), (20, 5))}
+    found = ties.find_ties(lines)
+    assert list(zip(found.id_1, found.id_2)) == [('A', 'B'), ('A', 'C'), ('B', 'C')]
+    np.testing.assert_allclose(found.chainage_1, [5.0, 15.0, 10.0])
+    np.testing.assert_allclose(found.chainage_2, [5.0, 10.0, 5.0])
+    np.testing.assert_allclose(np.column_stack([found.x, found.y]), [[5, 0], [10, 5], [5, 5]])
+
+
+def test_crossing_at_a_shared_vertex_is_found_once():
+    found = ties.find_ties({'A': line((0, 0), (5, 5), (10, 10)), 'B': line((0, 10), (5, 5), (10, 0))})
+    assert len(found.x) == 1
+    assert found.chainage_1[0] == pytest.approx(np.hypot(5, 5))
+
+
+def test_parallel_and_collinear_lines_have_no_ties():
+    found = ties.find_ties({'A': line((0, 0), (10, 0)), 'B': line((5, 0), (15, 0)), 'C': line((0, 1), (10, 1))})
+    assert len(found.x) == 0
+
+
+def test_multipart_chainage_continues():
+    lines = {'A': line((0, 0), (10, 0)) + line((20, 0), (30, 0)), 'B': line((25, -1), (25, 1))}
+    np.testing.assert_allclose(ties.find_ties(lines).chainage_1, [15.0])
+
+
+@pytest.mark.parametrize('cell', [None, 0.5, 3.0, 1000.0])
+def test_grid_index_matches_brute_force(cell):
+    generator = np.random.default_rng(7)
+    lines = {}
+    for i in range(25):
+        points = np.cumsum(generator.normal(0, 5, (6, 2)), axis=0) + generator.uniform(0, 50, 2)
+        lines['P{}'.format(i)] = [(points[:, 0], points[:, 1])]
+    found = ties.find_ties(lines, cell)
+    assert set(zip(np.round(found.x, 6), np.round(found.y, 6))) == brute_force(lines)
+    order = np.lexsort((found.chainage_1, [list(lines).index(name) for name in found.id_1]))
+    assert (order == np.arange(order.size)).all()
+
+
+def test_no_lines():
+    found = ties.find_ties({})
+    assert len(found.x) == 0 and found.id_1 == []
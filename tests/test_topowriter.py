@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+
+import numpy as np
+
+from conftest import DATA_DIR
+from geophygis import topowriter, datfile
+
+
+class Feedback:
+    def __init__(self):
+        self.messages = []
+
+    def pushInfo(self, text):
+        self.messages.append(text)
+
+
+def test_data_block_end():
+    with open(os.path.join(DATA_DIR, 'DD.dat'), 'rb') as dat:
+        raw = dat.read()
+    end = topowriter.data_block_end(io.BytesIO(raw), len(raw))
+    assert raw[:end].endswith(b' 5.0 5.0 2 130.0\n')
+    assert topowriter.data_block_end(io.BytesIO(raw), len(raw)) == end
+
+
+def test_topo_dat_round_trip(tmp_path):
+    dat_path = os.path.join(DATA_DIR, 'WENNER.dat')
+    topo_path = str(tmp_path / 'WENNER_topo.dat')
+    topography = topowriter.write_topo_dat(dat_path, topo_path, np.array([0.0, 5.0, 10.0]), np.array([100.0, 101.25, 99.1234]))
+    assert topography == '0.0\t100.0\n5.0\t101.25\n10.0\t99.123\n'
+    with open(dat_path, 'rb') as dat, open(topo_path, 'rb') as topo:
+        source, written = dat.read(), topo.read()
+    end = topowriter.data_block_end(io.BytesIO(source), len(source))
+    assert written == source[:end] + ('2\n3\n' + topography + topowriter.TOPO_END).encode()
+    assert datfile.parse_dat_bytes(written[:end] + b'0\n0\n0\n0\n') == datfile.parse_dat_bytes(source)
+
+
+def test_windows_line_ends_are_kept(tmp_path):
+    dat_path = tmp_path / 'P1.dat'
+    with open(os.path.join(DATA_DIR, 'DD.dat'), 'rb') as dat:
+        dat_path.write_bytes(dat.read().replace(b'\n', b'\r\n'))
+    topowriter.write_topo_dat(str(dat_path), str(tmp_path / 'P1_topo.dat'), [0.0], [10.0])
+    written = (tmp_path / 'P1_topo.dat').read_bytes()
+    assert written.count(b'\r\n') == written.count(b'\n')
+
+
+def test_write_profiles(tmp_path):
+    with open(os.path.join(DATA_DIR, 'WENNER.dat'), 'rb') as dat:
+        (tmp_path / 'P1.dat').write_bytes(dat.read())
+    profiles = {'P1': (np.array([0.0, 5.0]), np.array([1.0, 2.0])), 'P9': (np.array([0.0]), np.array([3.0]))}
+    feedback = Feedback()
+    written = topowriter.write_profiles(profiles, str(tmp_path), str(tmp_path), str(tmp_path / 'S.top'), feedback)
+    assert written == ['P1']
+    assert feedback.messages == ['Profile not found: P9']
+    assert (tmp_path / 'S.top').read_text() == 'TOPO of:P1\n0.0\t1.0\n5.0\t2.0\n###\n'